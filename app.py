@@ -1,9 +1,12 @@
 import streamlit as st
 import os
-import time 
+import json
 
 # --- IMPORT BACKEND ---
-from src.bot import get_qa_chain
+# Cheap imports: langchain, the vector store and the embedding model load on first use
+from src.bot import get_qa_chain, start_background_warmup, start_index_watcher
+from src.config import BACKGROUND_WARMUP
+from src.llm_scheduler import LLMUnavailableError
 
 # --- PAGE CONFIGURATION ---
 st.set_page_config(
@@ -19,10 +22,36 @@ if "selected_product" not in st.session_state:
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
-# Initialize Bot
-if "bot" not in st.session_state:
-    with st.spinner("🧠 Hydrating Vector Store..."):
-        st.session_state.bot = get_qa_chain()
+if "debug" not in st.session_state:
+    st.session_state.debug = False
+
+# Warm the product chains while the user picks a product (once per server process;
+# chains are cached process-wide). The chat screen builds only the chain it needs.
+if BACKGROUND_WARMUP:
+    start_background_warmup()
+# Swap in a newly ingested index generation without restarting the app (INDEX_WATCH_SECONDS)
+start_index_watcher()
+
+def show_trace(trace):
+    """Debug panel: per-stage spans of one answer (see src/tracing.py)."""
+    with st.expander(f"🔍 Pipeline trace ({trace['outcome']}, {trace['total_ms']:.0f} ms)"):
+        depth = {}
+        rows = []
+        for span in trace["spans"]:
+            depth[span["id"]] = depth.get(span["parent"], -1) + 1 if span["parent"] is not None else 0
+            rows.append({
+                "stage": "\u2003" * depth[span["id"]] + span["stage"],
+                "component": span["name"],
+                "start (ms)": span["start_ms"],
+                "duration (ms)": span["duration_ms"],
+                "docs": span.get("documents"),
+                "prompt tok": span.get("prompt_tokens"),
+                "response tok": span.get("response_tokens"),
+            })
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+        st.caption(f"Tokens: {trace['tokens']['prompt']} prompt · {trace['tokens']['response']} response")
+        st.download_button("Download trace (JSON)", json.dumps(trace, indent=2), file_name=f"trace_{trace['trace_id']}.json",
+                           mime="application/json", key=f"trace_{trace['trace_id']}")
 
 # ==========================================
 # SCREEN 1: PRODUCT SELECTION
@@ -69,6 +98,8 @@ else:
             st.session_state.selected_product = None
             st.session_state.messages = [] 
             st.rerun()
+        st.session_state.debug = st.toggle("🔍 Debug panel", value=st.session_state.debug,
+                                           help="Show per-stage timings, document and token counts of each answer")
 
     # Main Chat Header
     st.title("🎧 Bose Technical Assistant")
@@ -84,7 +115,7 @@ else:
     # 2. Re-Initialize Bot with this Filter (Dynamic Loading)
     if "current_pdf_context" not in st.session_state or st.session_state.current_pdf_context != pdf_keyword:
         with st.spinner(f"🔒 Locking context to {pdf_keyword}..."):
-            st.session_state.bot = get_qa_chain(target_pdf=pdf_keyword)
+            get_qa_chain(target_pdf=pdf_keyword)
             st.session_state.current_pdf_context = pdf_keyword
 
     # 3. Display History
@@ -95,6 +126,8 @@ else:
                 with st.expander("📚 Sources"):
                     for src in message["sources"]:
                         st.caption(src)
+            if st.session_state.debug and message.get("trace"):
+                show_trace(message["trace"])
 
     # 4. Input Handling
     if prompt := st.chat_input("Type your query here..."):
@@ -105,46 +138,64 @@ else:
         # Inject Context for the prompt
         augmented_prompt = f"Context: {st.session_state.selected_product}. {prompt}"
 
-        # Assistant Response
+        # Assistant Response (streamed: sources as soon as retrieval is done, then tokens as they arrive)
         with st.chat_message("assistant"):
-            with st.spinner("Analyzing manuals..."):
-                try:
-                    # START TIMER
-                    start_time = time.time()
-                    
-                    response_payload = st.session_state.bot.invoke({"query": augmented_prompt})
-                    
-                    # STOP TIMER
-                    end_time = time.time()
-                    latency = end_time - start_time
-                    
-                    answer = response_payload["result"]
-                    source_docs = response_payload["source_documents"]
-                    
-                    # Format Sources
-                    unique_sources = set()
-                    for doc in source_docs:
-                        page = doc.metadata.get("page", 0) + 1
-                        file = doc.metadata.get("source", "Unknown").split("\\")[-1]
-                        unique_sources.add(f"Page {page} of {file}")
-                    
-                    # Display Answer
-                    st.markdown(answer)
-                    
-                    # Display Latency
-                    st.caption(f"⏱️ Processed in {latency:.2f} seconds")
-                    
-                    # Save to history
-                    st.session_state.messages.append({
-                        "role": "assistant", 
-                        "content": answer,
-                        "sources": list(unique_sources)
-                    })
-                    
-                    # Show sources
-                    with st.expander("📚 Sources"):
-                        for source in unique_sources:
-                            st.caption(f"📄 {source}")
-                            
-                except Exception as e:
-                    st.error(f"Error: {e}")
\ No newline at end of file
+            try:
+                # Looked up per question (cache hit): picks up a reloaded index generation
+                bot = get_qa_chain(target_pdf=pdf_keyword)
+                events = bot.stream({"query": augmented_prompt})
+
+                with st.spinner("Analyzing manuals..."):
+                    retrieval_event = next(events)
+                
+                # Format Sources
+                unique_sources = set()
+                for doc in retrieval_event["source_documents"]:
+                    page = doc.metadata.get("page", 0) + 1
+                    file = doc.metadata.get("source", "Unknown").split("\\")[-1]
+                    unique_sources.add(f"Page {page} of {file}")
+                
+                # Show sources (before generation finishes)
+                with st.expander("📚 Sources"):
+                    for source in unique_sources:
+                        st.caption(f"📄 {source}")
+
+                # Display Answer, token by token
+                final_event = {}
+                def token_stream():
+                    for event in events:
+                        if event["type"] == "token":
+                            yield event["text"]
+                        elif event["type"] == "done":
+                            final_event.update(event)
+
+                answer = st.write_stream(token_stream())
+                
+                # Display Latency (retrieval / time to first token / total)
+                timings = final_event["timings"]
+                cache_note = " (cached answer)" if final_event.get("cached") else ""
+                if final_event.get("fast_path"):
+                    cache_note = " (from the spec table)"
+                st.caption(
+                    f"⏱️ Retrieval {timings['retrieval']:.2f}s · "
+                    f"first token {timings['time_to_first_token']:.2f}s · "
+                    f"generation {timings['generation']:.2f}s · "
+                    f"total {timings['total']:.2f}s{cache_note}"
+                )
+                if st.session_state.debug and final_event.get("trace"):
+                    show_trace(final_event["trace"])
+                
+                # Save to history
+                st.session_state.messages.append({
+                    "role": "assistant", 
+                    "content": final_event.get("result", answer),
+                    "sources": list(unique_sources),
+                    "trace": final_event.get("trace")
+                })
+                        
+            except LLMUnavailableError as e:
+                # Rate limit / outage that outlasted the scheduler's retries: ask to retry, no stack trace
+                wait = f" in about {e.retry_after:.0f}s" if e.retry_after else " in a moment"
+                st.warning(f"⏳ The assistant is busy right now (API rate limit). Please try again{wait}.")
+            except Exception as e:
+                st.error(f"Error: {e}")
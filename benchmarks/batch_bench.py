@@ -0,0 +1,204 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from retrieval_bench import RESULTS_DIR, git_commit, latency_summary, run_ingest
+
+# Batch QA benchmark: a "comparison sheet" worth of spec questions (every spec field of each
+# sampled product, synthetic data sheets) answered
+#   single  one ProductQAChain.invoke per question, one after the other (what callers did before)
+#   batch   one src/batch_qa.answer_batch call per product
+# with the stub LLM and a simulated API round trip (--llm-latency-ms). Reported per mode:
+# questions/s, LLM calls, prompt tokens and answer accuracy (the gold value in the answer), plus
+# the retrieval step alone: per-question chain.retrieve vs retrieve_batch (embedding included).
+# The spec fast path and the answer cache are off (--spec-fastpath keeps the fast path on), so
+# every question goes through retrieval + generation in both modes.
+
+
+def _value_token(value):
+    """First token of a gold value with a digit in it: '> 110 dB, A-weighted' -> '110'."""
+    return next((token.strip(",") for token in value.split() if any(c.isdigit() for c in token)), value)
+
+
+def _sheet_questions(gold, n_products, seed=7):
+    import random
+
+    rng = random.Random(seed)
+    sheets = []
+    for entry in rng.sample(gold, k=min(n_products, len(gold))):
+        sheets.append((entry["model"], [
+            {"question": f"What is the {field} of the {entry['model']}?", "value": entry["specs"][field]}
+            for field in sorted(entry["specs"])
+        ]))
+    return sheets
+
+
+def _llm_call_counter():
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class LLMCallCounter(BaseCallbackHandler):
+        calls = 0
+
+        def on_llm_start(self, *args, **kwargs):
+            self.calls += 1
+
+    return LLMCallCounter()
+
+
+def run_modes(n_products, expansion_mode):
+    """Child-process body (phase 2): both modes over the same questions, chains warmed first."""
+    from src.config import DATA_DIR
+    from src.bot import get_qa_chain
+    from src.batch_qa import answer_batch, retrieve_batch
+    from src.context_packing import estimate_tokens
+
+    with open(os.path.join(DATA_DIR, "gold.json"), "r", encoding="utf-8") as f:
+        sheets = _sheet_questions(json.load(f), n_products)
+    n_questions = sum(len(questions) for _, questions in sheets)
+    for model, questions in sheets:
+        get_qa_chain(model, expansion_mode).retrieve(questions[0]["question"])
+
+    # Retrieval alone
+    single_retrieval, batch_retrieval = 0.0, 0.0
+    for model, questions in sheets:
+        chain = get_qa_chain(model, expansion_mode)
+        texts = [q["question"] for q in questions]
+        start = time.perf_counter()
+        for text in texts:
+            chain.retrieve(text)
+        single_retrieval += time.perf_counter() - start
+        start = time.perf_counter()
+        retrieve_batch(chain, texts)
+        batch_retrieval += time.perf_counter() - start
+
+    # single: one chain run per question
+    counter, correct, prompt_tokens, latencies = _llm_call_counter(), 0, 0, []
+    start = time.perf_counter()
+    for model, questions in sheets:
+        chain = get_qa_chain(model, expansion_mode)
+        for q in questions:
+            asked = time.perf_counter()
+            response = chain.invoke({"query": q["question"]}, config={"callbacks": [counter]})
+            latencies.append(time.perf_counter() - asked)
+            correct += _value_token(q["value"]) in response["result"]
+            prompt_tokens += estimate_tokens(chain.build_prompt(q["question"], response["source_documents"]))
+    single_seconds = time.perf_counter() - start
+    single = {
+        "seconds": round(single_seconds, 3),
+        "questions_per_second": round(n_questions / single_seconds, 2),
+        "question_latency": latency_summary(latencies),
+        "llm_calls": counter.calls,
+        "prompt_tokens": prompt_tokens,
+        "accuracy": round(correct / max(n_questions, 1), 4),
+        "retrieval_seconds": round(single_retrieval, 3),
+    }
+
+    # batch: one answer_batch call per product
+    llm_calls, correct, prompt_tokens, passages = 0, 0, 0, {"retrieved": 0, "sent": 0}
+    start = time.perf_counter()
+    for model, questions in sheets:
+        report = answer_batch([q["question"] for q in questions], target_pdf=model, expansion_mode=expansion_mode,
+                              use_cache=False)
+        stats = report["stats"]
+        llm_calls += stats["llm_calls"]
+        prompt_tokens += stats["prompt_tokens"]
+        passages["retrieved"] += stats["passages_retrieved"]
+        passages["sent"] += stats["passages_sent"]
+        correct += sum(_value_token(q["value"]) in (a["answer"] or "") for q, a in zip(questions, report["answers"]))
+    batch_seconds = time.perf_counter() - start
+    batch = {
+        "seconds": round(batch_seconds, 3),
+        "questions_per_second": round(n_questions / batch_seconds, 2),
+        "llm_calls": llm_calls,
+        "prompt_tokens": prompt_tokens,
+        "passages": passages,
+        "accuracy": round(correct / max(n_questions, 1), 4),
+        "retrieval_seconds": round(batch_retrieval, 3),
+    }
+    return {"products": len(sheets), "questions": n_questions, "modes": {"single": single, "batch": batch}}
+
+
+def run_in_child(args, workdir):
+    env = dict(
+        os.environ,
+        LLM_BACKEND="stub",
+        STUB_LLM_LATENCY_MS=str(args.llm_latency_ms),
+        BOSE_DATA_DIR=os.path.join(workdir, "data"),
+        BOSE_DB_DIR=os.path.join(workdir, "chroma_db"),
+        BOSE_EMBED_CACHE_DIR=os.path.join(workdir, "embedding_cache"),
+        VECTOR_BACKEND=args.vector_backend,
+        SPEC_FASTPATH_ENABLED="1" if args.spec_fastpath else "0",
+        ANSWER_CACHE_ENABLED="0",
+        INDEX_WATCH_SECONDS="0",
+    )
+    result = {}
+    for phase in ("ingest", "query"):
+        result_path = os.path.join(workdir, f"{phase}.json")
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", phase, "--documents", str(args.documents),
+             "--products", str(args.products), "--expansion", args.expansion, "--result", result_path],
+            env=env, check=True
+        )
+        with open(result_path, "r", encoding="utf-8") as f:
+            result.update(json.load(f))
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Questions/s and LLM calls: one chain run per question vs batch QA.")
+    parser.add_argument("--documents", type=int, default=50, help="Synthetic data sheets in the library")
+    parser.add_argument("--products", type=int, default=5, help="Products asked about (all 10 spec fields each)")
+    parser.add_argument("--expansion", choices=["llm", "local", "none"], default="local")
+    parser.add_argument("--llm-latency-ms", type=float, default=500, help="Simulated LLM round trip of the stub")
+    parser.add_argument("--vector-backend", choices=["chroma", "numpy"], default="numpy")
+    parser.add_argument("--spec-fastpath", action="store_true", help="Keep the spec-table fast path on")
+    parser.add_argument("--output", help="JSON output path (default: benchmarks/results/batch_<utc>.json)")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch corpus / index")
+    parser.add_argument("--child", choices=["ingest", "query"], help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = run_ingest(args.documents) if args.child == "ingest" else run_modes(args.products, args.expansion)
+        with open(args.result, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        sys.exit(0)
+
+    workdir = tempfile.mkdtemp(prefix="bose_batch_")
+    try:
+        print(f"\n📦 {args.products} products x 10 spec questions ({args.documents} data sheets)...")
+        result = run_in_child(args, workdir)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "benchmark": "batch_qa",
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "child", "result")},
+        **result,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"batch_{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print("\n📊 Summary")
+    for mode, run in report["modes"].items():
+        print(f"   {mode:>6} | {run['questions_per_second']:>8.2f} q/s ({run['seconds']:.2f}s) | "
+              f"{run['llm_calls']:>4} LLM calls | {run['prompt_tokens']:>7} prompt tokens | "
+              f"retrieval {run['retrieval_seconds']:.3f}s | accuracy {run['accuracy']:.2%}")
+    print(f" Results written to {output}")
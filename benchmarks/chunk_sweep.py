@@ -0,0 +1,198 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from retrieval_bench import RESULTS_DIR, dir_size_bytes, git_commit, latency_summary
+
+# Chunking sweep: one scratch index per configuration (CHUNKING_MODE:CHUNK_SIZE:CHUNK_OVERLAP),
+# built from the same PDFs in a child process, then measured in a fresh one:
+#   chunks, index bytes, ingestion time, retrieval latency and accuracy.
+# Parsed pages (PAGE_CACHE_DIR, a scratch folder of the sweep) and chunk vectors (EMBED_CACHE_DIR)
+# are shared by every configuration, so a PDF is parsed once per sweep at most and only text a
+# configuration cuts differently is embedded.
+#   --corpus data       the manuals in data/ + the data/eval test sets: keyword accuracy of
+#                       src/evaluate.py, locked to each question's product (stub LLM by default,
+#                       which answers with the best-matching context line: measures retrieval)
+#   --corpus synthetic  generated data sheets (benchmarks/synthetic_corpus.py): hybrid recall@k
+
+DEFAULT_CONFIGS = ["fixed:1000:200", "fixed:500:100", "structure:1000:200", "structure:1500:200"]
+
+
+def parse_config(text):
+    """'structure:1000' / 'fixed:500:100' -> (mode, size, overlap); overlap defaults to size / 5."""
+    parts = text.split(":")
+    mode, size = parts[0], int(parts[1])
+    overlap = int(parts[2]) if len(parts) > 2 else size // 5
+    return mode, size, overlap
+
+
+def _cached_vectors():
+    from src.embedding_cache import CachedEmbeddings
+    from src.resources import embedding_model_id
+
+    return CachedEmbeddings(None, model_name=embedding_model_id()).stats()["cached_vectors"]
+
+
+def run_ingest():
+    """Child-process body (phase 1): full rebuild of the scratch index with this configuration."""
+    from src.loader import page_cache_stats
+    from src.manifest import load_manifest
+    from src.vector_store import create_vector_db
+
+    vectors_before = _cached_vectors()
+    start = time.perf_counter()
+    create_vector_db(reset=True)
+    seconds = time.perf_counter() - start
+
+    chunks = sum(len(entry["chunk_ids"]) for entry in load_manifest()["sources"].values())
+    embedded = _cached_vectors() - vectors_before
+    return {
+        "chunks": chunks,
+        "ingestion_seconds": round(seconds, 3),
+        "pdfs_parsed": page_cache_stats["misses"],
+        "pdfs_from_page_cache": page_cache_stats["hits"],
+        "vectors_embedded": embedded,
+        "vectors_reused": chunks - embedded,
+    }
+
+
+def run_queries(corpus, k, query_products, expansion_mode):
+    """Child-process body (phase 2): retrieval latency + accuracy over the built index."""
+    from src.generations import get_db_dir
+
+    result = {"index_bytes": dir_size_bytes(get_db_dir())}
+    if corpus == "synthetic":
+        from retrieval_bench import run_queries as run_bench_queries
+
+        bench = run_bench_queries(k, query_products)
+        result.update(retrieval_latency=bench["query_latency"]["hybrid"],
+                      accuracy=bench[f"recall_at_{k}"]["hybrid"], accuracy_metric=f"recall_at_{k}")
+        return result
+
+    from src.config import SPEC_FASTPATH_ENABLED
+    from src.evaluate import run_evaluation
+
+    # One question at a time: latency without contention between questions
+    report = run_evaluation(expansion_mode=expansion_mode, workers=1, lock_product=True, verbose=False,
+                            spec_fastpath=SPEC_FASTPATH_ENABLED)
+    retrieval = [r["retrieval"] for r in report["results"] if not r["Error"]]
+    result.update(retrieval_latency=latency_summary(retrieval), accuracy=round(report["accuracy"] / 100, 4),
+                  accuracy_metric="keyword_accuracy", errors=report["errors"],
+                  prompt_tokens_mean=report["prompt_tokens"]["mean"])
+    return result
+
+
+def run_config_in_child(config, args, workdir, data_dir):
+    mode, size, overlap = config
+    label = f"{mode}:{size}:{overlap}"
+    env = dict(
+        os.environ,
+        CHUNKING_MODE=mode, CHUNK_SIZE=str(size), CHUNK_OVERLAP=str(overlap),
+        BOSE_DATA_DIR=data_dir,
+        BOSE_DB_DIR=os.path.join(workdir, label.replace(":", "_"), "chroma_db"),
+        LLM_BACKEND=args.llm_backend,
+        # Measure chunk retrieval: no answers from the spec tables or from earlier configurations
+        SPEC_FASTPATH_ENABLED="1" if args.spec_fastpath else "0",
+        ANSWER_CACHE_ENABLED="0",
+        INDEX_WATCH_SECONDS="0",
+        # Scratch page cache: the scratch indexes would prune a shared one down to their own PDFs
+        BOSE_PAGE_CACHE_DIR=os.path.join(workdir, "page_cache"),
+    )
+    if args.fresh_caches:
+        env.update(BOSE_EMBED_CACHE_DIR=os.path.join(workdir, "embedding_cache"))
+
+    result = {"config": label, "mode": mode, "chunk_size": size, "chunk_overlap": overlap}
+    for phase in ("ingest", "query"):
+        result_path = os.path.join(workdir, f"{label.replace(':', '_')}_{phase}.json")
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", phase, "--corpus", args.corpus,
+             "--k", str(args.k), "--query-products", str(args.query_products),
+             "--expansion", args.expansion, "--result", result_path],
+            env=env, check=True
+        )
+        with open(result_path, "r", encoding="utf-8") as f:
+            result.update(json.load(f))
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare chunking configurations on index size, latency and accuracy.")
+    parser.add_argument("--configs", nargs="+", default=DEFAULT_CONFIGS,
+                        help="mode:size[:overlap] with mode fixed or structure (overlap default size / 5)")
+    parser.add_argument("--corpus", choices=["data", "synthetic"], default="data")
+    parser.add_argument("--documents", type=int, default=100, help="--corpus synthetic: data sheets generated")
+    parser.add_argument("--k", type=int, default=4, help="--corpus synthetic: k for recall@k")
+    parser.add_argument("--query-products", type=int, default=20, help="--corpus synthetic: products sampled for queries")
+    parser.add_argument("--expansion", choices=["llm", "local", "none"], default="none",
+                        help="--corpus data: query expansion mode of the evaluated chain")
+    parser.add_argument("--llm-backend", choices=["gemini", "stub"], default="stub")
+    parser.add_argument("--spec-fastpath", action="store_true", help="Keep the spec-table fast path on")
+    parser.add_argument("--fresh-caches", action="store_true",
+                        help="Start from an empty embedding cache (shared by the sweep) instead of the real one")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch indexes")
+    parser.add_argument("--output", help="JSON output path (default: benchmarks/results/chunk_sweep_<utc>.json)")
+    parser.add_argument("--child", choices=["ingest", "query"], help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        if args.child == "ingest":
+            result = run_ingest()
+        else:
+            result = run_queries(args.corpus, args.k, args.query_products, args.expansion)
+        with open(args.result, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        sys.exit(0)
+
+    configs = [parse_config(text) for text in args.configs]
+    workdir = tempfile.mkdtemp(prefix="bose_chunk_sweep_")
+    try:
+        if args.corpus == "synthetic":
+            from synthetic_corpus import generate_corpus
+
+            data_dir = os.path.join(workdir, "data")
+            generate_corpus(data_dir, args.documents)
+        else:
+            from src.config import DATA_DIR
+            data_dir = DATA_DIR
+
+        runs = []
+        for config in configs:
+            print(f"\n✂️  Chunking {config[0]}:{config[1]}:{config[2]}...")
+            runs.append(run_config_in_child(config, args, workdir, data_dir))
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "benchmark": "chunk_sweep",
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "child", "result")},
+        "runs": runs,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"chunk_sweep_{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print("\n📊 Summary")
+    for run in runs:
+        latency = run["retrieval_latency"] or {}
+        print(f"   {run['config']:>20} | {run['chunks']:>6} chunks | index {run['index_bytes'] / 1e6:>7.2f}MB | "
+              f"ingest {run['ingestion_seconds']:>7.2f}s ({run['vectors_embedded']} embedded, "
+              f"{run['vectors_reused']} from cache) | retrieval p50 {latency.get('p50_ms')}ms "
+              f"p95 {latency.get('p95_ms')}ms | {run['accuracy_metric']} {run['accuracy']}")
+    print(f" Results written to {output}")
@@ -0,0 +1,185 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+import urllib.request
+from datetime import datetime, timezone
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+# The LLM calls go to the local stub server, never to Gemini
+os.environ["LLM_BACKEND"] = "stub-http"
+
+from retrieval_bench import RESULTS_DIR, git_commit, latency_summary
+from load_test import load_questions
+
+# LLM scheduler benchmark: a burst of questions, each one query-generation call
+# ("llm" expansion) + one answer call, against benchmarks/stub_llm_server.py with a
+# rate limit below the offered load (429 + Retry-After) and injected 503s:
+#   unscheduled  every call goes straight to the API (what the app did before)
+#   scheduled    calls go through LLMScheduler: token buckets, answers first,
+#                jittered retries, expansion skipped (local table) when the budget is tight
+# The rate-limit window is compressed (--window-seconds) so a run takes seconds, not minutes;
+# the scheduler's budget and backoff are scaled to match.
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_llm_server.py")
+MODES = ["unscheduled", "scheduled"]
+
+
+def expansion_prompt(question):
+    return f"Write 3 variants of the question for a vector search.\nOriginal question: {question}"
+
+
+def answer_prompt(question, queries):
+    context = "\n".join(queries)
+    return f"Context: {context}\nUser Question: {question}\nINSTRUCTIONS: answer from the context."
+
+
+async def ask(question, expansion_llm, answer_llm, scheduler):
+    """One question through the expansion + answer calls; returns its outcome."""
+    from src.llm_scheduler import LLMUnavailableError
+
+    result = {"expansion": "generated", "answered": False, "error": None}
+    queries = [question]
+    start = time.perf_counter()
+    if scheduler is not None and scheduler.should_skip_expansion():
+        result["expansion"] = "skipped"
+    else:
+        try:
+            queries.append(await expansion_llm.ainvoke(expansion_prompt(question)))
+        except LLMUnavailableError:
+            scheduler.record_skipped_expansion()
+            result["expansion"] = "skipped"
+        except Exception:
+            # An unscheduled app fails the whole question here (MultiQueryRetriever has no fallback);
+            # we go on so the answer calls are comparable
+            result["expansion"] = "failed"
+
+    try:
+        await answer_llm.ainvoke(answer_prompt(question, queries))
+        result["answered"] = True
+    except Exception as e:
+        result["error"] = type(e).__name__
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+async def run_mode(mode, questions, args):
+    from src.llm import HttpStubLLM, ScheduledLLM
+    from src.llm_scheduler import LLMScheduler
+
+    url = f"http://127.0.0.1:{args.port}"
+    llm = HttpStubLLM(url=url)
+    scheduler = None
+    expansion_llm = answer_llm = llm
+    if mode == "scheduled":
+        scale = args.window_seconds / 60.0
+        scheduler = LLMScheduler(rpm=args.rpm / scale, burst=args.rpm, max_concurrency=args.llm_concurrency,
+                                 backoff_base=1.0 * scale, backoff_max=20.0 * scale)
+        expansion_llm = ScheduledLLM(llm=llm, scheduler=scheduler, priority="expansion",
+                                     max_wait=args.expansion_max_wait * scale)
+        answer_llm = ScheduledLLM(llm=llm, scheduler=scheduler, priority="answer",
+                                  max_wait=args.answer_max_wait * scale)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(question):
+        async with semaphore:
+            return await ask(question, expansion_llm, answer_llm, scheduler)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(question) for question in questions))
+    wall_seconds = time.perf_counter() - start
+
+    with urllib.request.urlopen(f"{url}/stats") as resp:
+        server_stats = json.loads(resp.read())
+    answered = [r for r in results if r["answered"]]
+    return {
+        "mode": mode,
+        "questions": len(results),
+        "answered": len(answered),
+        "failed": len(results) - len(answered),
+        "errors": {name: sum(r["error"] == name for r in results) for name in {r["error"] for r in results} if name},
+        "expansion": {outcome: sum(r["expansion"] == outcome for r in results)
+                      for outcome in ("generated", "skipped", "failed")},
+        "wall_seconds": round(wall_seconds, 3),
+        "latency_answered": latency_summary([r["seconds"] for r in answered]),
+        "server": server_stats,
+        "scheduler": scheduler.snapshot() if scheduler is not None else None,
+    }
+
+
+def start_server(args):
+    command = [sys.executable, SERVER_SCRIPT, "--port", str(args.port), "--rpm", str(args.rpm),
+               "--window-seconds", str(args.window_seconds), "--latency-ms", str(args.latency_ms),
+               "--error-rate", str(args.error_rate)]
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{args.port}/stats").close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise TimeoutError("Stub LLM server did not start")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LLM scheduler benchmark against the rate-limited stub server.")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--questions", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=16, help="Questions in flight")
+    parser.add_argument("--llm-concurrency", type=int, default=4, help="Scheduler LLM_MAX_CONCURRENCY")
+    parser.add_argument("--rpm", type=int, default=30, help="Requests the stub server accepts per window")
+    parser.add_argument("--window-seconds", type=float, default=6.0, help="Stub rate-limit window (60 = real time)")
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--error-rate", type=float, default=0.05, help="Share of accepted calls failing with 503")
+    parser.add_argument("--answer-max-wait", type=float, default=60.0, help="Seconds, in real-time minutes")
+    parser.add_argument("--expansion-max-wait", type=float, default=2.0, help="Seconds, in real-time minutes")
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--output", help="JSON output path (default: benchmarks/results/llm_scheduler_<utc>.json)")
+    args = parser.parse_args()
+
+    pool = load_questions()
+    questions = [pool[i % len(pool)][0] for i in range(args.questions)]
+
+    runs = []
+    for mode in args.modes:
+        # A fresh server per mode: empty rate-limit window, same error sequence
+        server = start_server(args)
+        try:
+            print(f"🚀 {mode}: {len(questions)} questions, {args.concurrency} in flight, "
+                  f"limit {args.rpm} calls / {args.window_seconds:g}s")
+            runs.append(asyncio.run(run_mode(mode, questions, args)))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    report = {
+        "benchmark": "llm_scheduler",
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("modes", "output")},
+        "runs": runs,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"llm_scheduler_{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print("\n📊 Summary")
+    for run in runs:
+        latency = run["latency_answered"] or {}
+        retries = run["scheduler"]["retries"] if run["scheduler"] else 0
+        print(f"   {run['mode']:>11} | answered {run['answered']}/{run['questions']} | "
+              f"429s {run['server']['rate_limited']} | 503s {run['server']['errors']} | retries {retries} | "
+              f"expansion {run['expansion']} | p50 {latency.get('p50_ms')}ms | p95 {latency.get('p95_ms')}ms")
+    print(f" Results written to {output}")
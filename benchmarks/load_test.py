@@ -0,0 +1,186 @@
+import os
+import sys
+import glob
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+from collections import Counter
+from datetime import datetime, timezone
+import aiohttp
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from retrieval_bench import RESULTS_DIR, git_commit, latency_summary
+
+# Load test of the HTTP service (server.py). By default it starts its own server
+# with the stub LLM (LLM_BACKEND=stub, STUB_LLM_LATENCY_MS simulating the API),
+# so it runs offline against the real indexes / embeddings; --url targets a running one.
+# Requests come in bursts of identical questions (support agents asking the same
+# thing) mixed with unique ones, to measure coalescing under concurrency.
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_SCRIPT = os.path.join(REPO_DIR, "server.py")
+
+# Procedural questions (no spec row) that always take the retrieval + LLM path
+RAG_QUESTIONS = [
+    ("How do I mount the loudspeaker on a pole?", "DM8SE"),
+    ("How is the processor configured with ControlSpace Designer?", "EX-1280C"),
+    ("Which accessories are available for the loudspeaker?", "DM8SE"),
+    ("How many Dante channels does the processor support?", "EX-1280C"),
+]
+
+
+def load_questions():
+    """(question, product) pairs of the eval sets (.json / .jsonl, same format as src/evaluate.py)."""
+    questions = []
+    for path in sorted(glob.glob(os.path.join(REPO_DIR, "data", "eval", "*.json*"))):
+        with open(path, "r", encoding="utf-8") as f:
+            cases = [json.loads(line) for line in f if line.strip()] if path.endswith(".jsonl") else json.load(f)
+        questions.extend((case["question"], case.get("doc_source")) for case in cases)
+    return questions + RAG_QUESTIONS
+
+
+def build_requests(questions, n_requests, burst_size, unique_ratio, seed=0):
+    """
+    Request plan: bursts of burst_size identical questions, plus unique_ratio
+    one-off variants (never coalesced / cached).
+    """
+    rng = random.Random(seed)
+    plan = []
+    while len(plan) < n_requests:
+        question, product = rng.choice(questions)
+        if rng.random() < unique_ratio:
+            plan.append({"question": f"{question} (ticket {len(plan)})", "product": product})
+        else:
+            plan.extend({"question": question, "product": product} for _ in range(burst_size))
+    return plan[:n_requests]
+
+
+async def _wait_ready(session, url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(f"{url}/health") as resp:
+                health = await resp.json()
+                if resp.status == 200:
+                    return health
+                if health.get("status") == "failed":
+                    raise RuntimeError(f"Server failed to start: {health['startup']['error']}")
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.5)
+    raise TimeoutError(f"Server at {url} not ready after {timeout}s")
+
+
+async def run_load(url, plan, concurrency, ready_timeout):
+    results = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(session, body):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                async with session.post(f"{url}/ask", json=body) as resp:
+                    payload = await resp.json()
+                    status = resp.status
+            except aiohttp.ClientError as e:
+                payload, status = {"error": str(e)}, "client_error"
+            results.append({"status": status, "seconds": time.perf_counter() - start,
+                            "coalesced": payload.get("coalesced", False), "cached": payload.get("cached", False),
+                            "fast_path": payload.get("fast_path", False)})
+
+    timeout = aiohttp.ClientTimeout(total=None)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        health = await _wait_ready(session, url, ready_timeout)
+        start = time.perf_counter()
+        await asyncio.gather(*(one(session, body) for body in plan))
+        wall_seconds = time.perf_counter() - start
+        async with session.get(f"{url}/stats") as resp:
+            server_stats = await resp.json()
+
+    ok = [r for r in results if r["status"] == 200]
+    return {
+        "requests": len(results),
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(ok) / wall_seconds, 2) if wall_seconds else None,
+        "status_counts": {str(k): v for k, v in Counter(r["status"] for r in results).items()},
+        "coalesced": sum(r["coalesced"] for r in ok),
+        "cached": sum(r["cached"] for r in ok),
+        "fast_path": sum(r["fast_path"] for r in ok),
+        "latency": latency_summary([r["seconds"] for r in ok]),
+        "latency_leaders": latency_summary([r["seconds"] for r in ok if not r["coalesced"]]),
+        "server_startup": health["startup"],
+        "server_stats": server_stats,
+    }
+
+
+def start_server(port, stub_latency_ms, max_concurrency, fast_path, answer_cache):
+    env = dict(os.environ, LLM_BACKEND="stub", STUB_LLM_LATENCY_MS=str(stub_latency_ms),
+               SPEC_FASTPATH_ENABLED="1" if fast_path else "0", ANSWER_CACHE_ENABLED="1" if answer_cache else "0")
+    command = [sys.executable, SERVER_SCRIPT, "--port", str(port)]
+    if max_concurrency:
+        command += ["--max-concurrency", str(max_concurrency)]
+    return subprocess.Popen(command, env=env)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test of the HTTP QA service.")
+    parser.add_argument("--url", help="Running server (default: start server.py with the stub LLM)")
+    parser.add_argument("--port", type=int, default=8765, help="Port of the locally started server")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients")
+    parser.add_argument("--burst-size", type=int, default=8, help="Identical questions per burst")
+    parser.add_argument("--unique-ratio", type=float, default=0.3, help="Share of one-off questions")
+    parser.add_argument("--stub-latency-ms", type=float, default=300, help="Simulated LLM latency (local server)")
+    parser.add_argument("--max-concurrency", type=int, help="Server SERVER_MAX_CONCURRENCY (local server)")
+    parser.add_argument("--fast-path", action="store_true", help="Keep the spec-table fast path on (local server)")
+    parser.add_argument("--answer-cache", action="store_true", help="Keep the answer cache on (local server)")
+    parser.add_argument("--ready-timeout", type=float, default=300)
+    parser.add_argument("--output", help="JSON output path (default: benchmarks/results/load_<utc>.json)")
+    args = parser.parse_args()
+
+    plan = build_requests(load_questions(), args.requests, args.burst_size, args.unique_ratio)
+    server = None
+    url = args.url
+    if url is None:
+        url = f"http://127.0.0.1:{args.port}"
+        server = start_server(args.port, args.stub_latency_ms, args.max_concurrency, args.fast_path, args.answer_cache)
+
+    try:
+        print(f"🚀 {len(plan)} requests, {args.concurrency} clients -> {url}")
+        result = asyncio.run(run_load(url.rstrip("/"), plan, args.concurrency, args.ready_timeout))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    report = {
+        "benchmark": "http_load",
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "url": url,
+        "concurrency": args.concurrency,
+        "burst_size": args.burst_size,
+        "unique_ratio": args.unique_ratio,
+        "stub_latency_ms": args.stub_latency_ms if server is not None else None,
+        **result,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"load_{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    latency = result["latency"] or {}
+    print("\n📊 Summary")
+    print(f"   status {result['status_counts']} | {result['throughput_rps']} req/s | "
+          f"p50 {latency.get('p50_ms')}ms | p95 {latency.get('p95_ms')}ms | p99 {latency.get('p99_ms')}ms")
+    print(f"   coalesced {result['coalesced']} | cached {result['cached']} | fast path {result['fast_path']}")
+    print(f" Results written to {output}")
@@ -0,0 +1,218 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+from datetime import datetime, timezone
+import numpy as np
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from retrieval_bench import RESULTS_DIR, dir_size_bytes, git_commit, latency_summary, run_ingest
+
+# Memory benchmark of what a serving process keeps per chunk for retrieval. One synthetic
+# library per scale is ingested (VECTOR_BACKEND=numpy: the dense blocks live in-process too),
+# then every layout is loaded in a fresh process with every product warmed (all BM25
+# partitions + dense blocks, per source and for the whole library):
+#   legacy       what the partitions / dense blocks held before the chunk store: every chunk's
+#                id, text and metadata dict as Python objects, once per partition and per block
+#   chunk_store  scores-only partitions / blocks + one memory-mapped chunk store (src/chunk_store.py)
+# Reported: Python heap (tracemalloc), RSS growth, Document build time for a hit, and for the
+# chunk store the locked hybrid (dense + BM25) lookup latency without the embedding model.
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except (OSError, ValueError, AttributeError):  # not Linux
+        return None
+
+
+def _sources():
+    from src.manifest import load_manifest
+    return list(load_manifest()["sources"])
+
+
+def _load_index():
+    """Loads every BM25 partition and dense block the retrievers of all products would open."""
+    from src.bm25_index import ALL_PARTITION, load_partition, partition_name
+    from src.numpy_store import DENSE_DIRNAME, load_block
+    from src.generations import get_db_dir
+
+    names = [partition_name(source) for source in _sources()] + [ALL_PARTITION]
+    partitions = {name: load_partition(name) for name in names}
+    blocks = {name: load_block(os.path.join(get_db_dir(), DENSE_DIRNAME, name)) for name in names}
+    return partitions, blocks
+
+
+def _held_legacy(partitions, blocks):
+    """The per-chunk Python objects the pre-store BM25Partition / DenseBlock kept (same JSON files)."""
+    held = []
+    for partition in partitions.values():
+        with open(os.path.join(partition.path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        held.append((meta["ids"], meta["metadatas"]))
+    for block in blocks.values():
+        held.append(block.chunks())
+    return held
+
+
+def run_layout(layout, queries, k):
+    """Child-process body: load one layout, report its memory and lookup costs."""
+    from langchain_core.documents import Document
+    from src.chunk_store import load_chunk_store
+
+    rss_before = current_rss_mb()
+    tracemalloc.start()
+    partitions, blocks = _load_index()
+    if layout == "legacy":
+        held = _held_legacy(partitions, blocks)
+    else:
+        held = load_chunk_store()
+        # Dense block rows -> store rows are resolved on a block's first hit: count them too
+        for block in blocks.values():
+            if len(block.ids):
+                block.document(0)
+    heap_bytes, _ = tracemalloc.get_traced_memory()
+    rss_after = current_rss_mb()
+    tracemalloc.stop()
+
+    # Building the Document of one hit: from the held lists vs from the chunk store
+    from src.bm25_index import ALL_PARTITION
+    n_chunks = partitions[ALL_PARTITION].n_docs
+    rows = np.random.default_rng(0).integers(0, max(n_chunks, 1), size=min(1000, n_chunks))
+    start = time.perf_counter()
+    if layout == "legacy":
+        # The all-sources block: its rows cover every chunk
+        _, texts, metadatas = held[-1]
+        for row in rows:
+            Document(page_content=texts[row], metadata=dict(metadatas[row]))
+    else:
+        for row in rows:
+            held.document(int(row))
+    build_us = (time.perf_counter() - start) / max(len(rows), 1) * 1e6
+
+    result = {
+        "layout": layout,
+        "chunks": n_chunks,
+        "heap_mb": round(heap_bytes / (1024 * 1024), 2),
+        "heap_bytes_per_chunk": round(heap_bytes / max(n_chunks, 1), 1),
+        "rss_growth_mb": round(rss_after - rss_before, 1) if rss_before is not None else None,
+        "document_build_us": round(build_us, 2),
+    }
+    if layout == "chunk_store":
+        result["lookup_latency"] = _lookup_latency(partitions, blocks, held, queries, k)
+    return result
+
+
+def _lookup_latency(partitions, blocks, store, queries, k):
+    """Locked dense + BM25 lookup with Document building, random unit query vectors (no model)."""
+    from src.bm25_index import ALL_PARTITION
+
+    rng = np.random.default_rng(1)
+    names = [name for name in partitions if name != ALL_PARTITION]
+    dim = next((block.vectors.shape[1] for block in blocks.values() if len(block.ids)), 0)
+    seconds = []
+    for i, question in enumerate(queries):
+        name = names[i % len(names)]
+        vector = rng.standard_normal(dim).astype(np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        start = time.perf_counter()
+        block = blocks[name]
+        documents = [block.document(row) for row, _ in block.top_k(vector, k)]
+        first = store.first_row(name)
+        documents += [store.document(first + j) for j, _ in partitions[name].top_k(question, k)]
+        seconds.append(time.perf_counter() - start)
+    return latency_summary(seconds)
+
+
+def run_scale_in_child(n_docs, k, query_products, keep_dir=False):
+    workdir = tempfile.mkdtemp(prefix=f"bose_memory_{n_docs}_")
+    env = dict(
+        os.environ,
+        VECTOR_BACKEND="numpy",
+        BOSE_DATA_DIR=os.path.join(workdir, "data"),
+        BOSE_DB_DIR=os.path.join(workdir, "chroma_db"),
+        BOSE_EMBED_CACHE_DIR=os.path.join(workdir, "embedding_cache"),
+    )
+    result = {"documents": n_docs, "layouts": {}}
+    try:
+        for phase in ("ingest", "legacy", "chunk_store"):
+            result_path = os.path.join(workdir, f"{phase}.json")
+            subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", phase, "--scales", str(n_docs),
+                 "--k", str(k), "--query-products", str(query_products), "--result", result_path],
+                env=env, check=True
+            )
+            with open(result_path, "r", encoding="utf-8") as f:
+                phase_result = json.load(f)
+            if phase == "ingest":
+                result.update(phase_result)
+            else:
+                result["layouts"][phase] = phase_result
+        result["index_bytes"] = dir_size_bytes(env["BOSE_DB_DIR"])
+        return result
+    finally:
+        if not keep_dir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-chunk memory of the retrievers: legacy lists vs chunk store.")
+    parser.add_argument("--scales", nargs="+", type=int, default=[100, 1000], help="Corpus sizes (documents)")
+    parser.add_argument("--k", type=int, default=4, help="Hits per lookup")
+    parser.add_argument("--query-products", type=int, default=20, help="Products sampled for lookup queries")
+    parser.add_argument("--output", help="JSON output path (default: benchmarks/results/memory_<utc>.json)")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch corpora / indexes")
+    parser.add_argument("--child", choices=["ingest", "legacy", "chunk_store"], help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        if args.child == "ingest":
+            result = run_ingest(args.scales[0])
+        else:
+            from src.config import DATA_DIR
+            from synthetic_corpus import make_queries
+
+            with open(os.path.join(DATA_DIR, "gold.json"), "r", encoding="utf-8") as f:
+                queries = [q["question"] for q in make_queries(json.load(f), args.query_products)]
+            result = run_layout(args.child, queries, args.k)
+        with open(args.result, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        sys.exit(0)
+
+    report = {
+        "benchmark": "memory",
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "k": args.k,
+        "scales": [],
+    }
+    for n_docs in args.scales:
+        print(f"\n🧠 Measuring {n_docs} documents...")
+        report["scales"].append(run_scale_in_child(n_docs, args.k, args.query_products, keep_dir=args.keep))
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"memory_{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print("\n📊 Summary")
+    for scale in report["scales"]:
+        legacy, store = scale["layouts"]["legacy"], scale["layouts"]["chunk_store"]
+        print(f"   {scale['documents']:>5} docs ({store['chunks']} chunks) | heap {legacy['heap_mb']:>8.2f}MB -> "
+              f"{store['heap_mb']:>7.2f}MB ({legacy['heap_bytes_per_chunk']:.0f} -> "
+              f"{store['heap_bytes_per_chunk']:.0f} B/chunk) | RSS +{legacy['rss_growth_mb']}MB -> "
+              f"+{store['rss_growth_mb']}MB | Document build {legacy['document_build_us']}us -> "
+              f"{store['document_build_us']}us | lookup p50 {store['lookup_latency']['p50_ms']}ms")
+    print(f" Results written to {output}")
@@ -0,0 +1,247 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+import numpy as np
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from synthetic_corpus import generate_corpus, make_queries
+
+# Retrieval benchmark over synthetic spec-sheet libraries.
+# Every scale runs in its own child process pointed at a scratch corpus/DB
+# (BOSE_DATA_DIR / BOSE_DB_DIR / BOSE_EMBED_CACHE_DIR), so memory numbers and
+# caches never leak between scales or into the real chroma_db.
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def dir_size_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def latency_summary(values):
+    if not values:
+        return None
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"mean_ms": round(float(np.mean(values)) * 1000, 3), "p50_ms": round(float(p50) * 1000, 3),
+            "p95_ms": round(float(p95) * 1000, 3), "p99_ms": round(float(p99) * 1000, 3)}
+
+
+def is_hit(documents, query, k):
+    """Gold chunk = a chunk of the right data sheet that contains the asked-for value."""
+    return any(
+        query["value"] in doc.page_content and query["model"] in os.path.basename(doc.metadata.get("source", ""))
+        for doc in documents[:k]
+    )
+
+
+def run_ingest(n_docs):
+    """Child-process body (phase 1): generate and ingest one corpus size."""
+    from src.config import DATA_DIR
+    from src.vector_store import create_vector_db
+
+    generate_corpus(DATA_DIR, n_docs)
+
+    start = time.perf_counter()
+    create_vector_db(reset=True)
+    return {
+        "ingestion_seconds": round(time.perf_counter() - start, 3),
+        "peak_rss_mb_ingest": peak_rss_mb(),
+    }
+
+
+def run_queries(k, query_products):
+    """
+    Child-process body (phase 2): a fresh process that only serves queries, so its
+    peak RSS is the serving footprint (model + vector store + BM25) of the backend.
+    """
+    from src.config import DATA_DIR, ROUTER_TOP_N
+    from src.generations import get_db_dir
+    from src.product_router import load_router
+    from src.resources import get_vector_store
+    from src.vector_store import get_retriever
+
+    with open(os.path.join(DATA_DIR, "gold.json"), "r", encoding="utf-8") as f:
+        gold = json.load(f)
+    queries = make_queries(gold, query_products)
+
+    # Opening the store + first dense query (client start-up, mmap / SQLite warm-up)
+    start = time.perf_counter()
+    get_retriever(route=False).retrievers[0].invoke(queries[0]["question"])
+    first_query_seconds = time.perf_counter() - start
+
+    lock_seconds = []
+    latencies = {"dense": [], "bm25": [], "hybrid": [], "hybrid_unlocked": [], "hybrid_routed": []}
+    hits = {mode: 0 for mode in latencies}
+
+    by_model = {}
+    for query in queries:
+        by_model.setdefault(query["model"], []).append(query)
+
+    for model, model_queries in by_model.items():
+        start = time.perf_counter()
+        hybrid = get_retriever(target_pdf_name=model)
+        lock_seconds.append(time.perf_counter() - start)
+
+        dense, bm25 = hybrid.retrievers
+        for query in model_queries:
+            for mode, retriever in (("dense", dense), ("bm25", bm25), ("hybrid", hybrid)):
+                start = time.perf_counter()
+                documents = retriever.invoke(query["question"])
+                latencies[mode].append(time.perf_counter() - start)
+                hits[mode] += is_hit(documents, query, k)
+
+    # Whole-library search (no product lock): every partition vs the router's top-N
+    unlocked = get_retriever(route=False)
+    routed = get_retriever(route=True)
+    for query in queries:
+        for mode, retriever in (("hybrid_unlocked", unlocked), ("hybrid_routed", routed)):
+            start = time.perf_counter()
+            documents = retriever.invoke(query["question"])
+            latencies[mode].append(time.perf_counter() - start)
+            hits[mode] += is_hit(documents, query, k)
+
+    # Routing alone: latency (query embedding excluded) and whether the gold data sheet is picked
+    router = load_router()
+    embeddings = get_vector_store().embeddings
+    routing_seconds, routing_hits = [], {"top_1": 0, f"top_{ROUTER_TOP_N}": 0, "keyword_matched": 0}
+    for query in queries:
+        query_vector = embeddings.embed_query(query["question"])
+        start = time.perf_counter()
+        routes = router.route(query["question"], query_vector, ROUTER_TOP_N)
+        routing_seconds.append(time.perf_counter() - start)
+        picked = [query["model"] in os.path.basename(route["source"]) for route in routes]
+        routing_hits["top_1"] += picked[0]
+        routing_hits[f"top_{ROUTER_TOP_N}"] += any(picked)
+        routing_hits["keyword_matched"] += any(route["keyword"] for route in routes)
+
+    return {
+        "queries": len(queries),
+        "index_bytes": dir_size_bytes(get_db_dir()),
+        "first_query_ms": round(first_query_seconds * 1000, 3),
+        "product_lock": latency_summary(lock_seconds),
+        "query_latency": {mode: latency_summary(values) for mode, values in latencies.items()},
+        f"recall_at_{k}": {mode: round(hits[mode] / len(queries), 4) for mode in hits},
+        "routing": {
+            "top_n": ROUTER_TOP_N,
+            "latency": latency_summary(routing_seconds),
+            "accuracy": {key: round(n / len(queries), 4) for key, n in routing_hits.items()},
+        },
+        "peak_rss_mb_serving": peak_rss_mb(),
+    }
+
+
+def run_scale_in_child(n_docs, k, query_products, vector_backend="chroma", keep_dir=False):
+    workdir = tempfile.mkdtemp(prefix=f"bose_bench_{vector_backend}_{n_docs}_")
+    env = dict(
+        os.environ,
+        VECTOR_BACKEND=vector_backend,
+        BOSE_DATA_DIR=os.path.join(workdir, "data"),
+        BOSE_DB_DIR=os.path.join(workdir, "chroma_db"),
+        BOSE_EMBED_CACHE_DIR=os.path.join(workdir, "embedding_cache"),
+    )
+    result = {"documents": n_docs, "vector_backend": vector_backend}
+    try:
+        for phase in ("ingest", "query"):
+            result_path = os.path.join(workdir, f"{phase}.json")
+            subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", phase, "--scales", str(n_docs),
+                 "--k", str(k), "--query-products", str(query_products), "--result", result_path],
+                env=env, check=True
+            )
+            with open(result_path, "r", encoding="utf-8") as f:
+                result.update(json.load(f))
+        return result
+    finally:
+        if not keep_dir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrieval benchmark on synthetic spec-sheet corpora.")
+    parser.add_argument("--scales", nargs="+", type=int, default=[10, 100, 1000], help="Corpus sizes (documents)")
+    parser.add_argument("--k", type=int, default=4, help="k for recall@k")
+    parser.add_argument("--query-products", type=int, default=20, help="Products sampled for queries (3 questions each)")
+    parser.add_argument("--output", help="JSON output path (default: benchmarks/results/retrieval_<utc>.json)")
+    parser.add_argument("--vector-backends", nargs="+", choices=["chroma", "numpy"], default=["chroma", "numpy"],
+                        help="Dense vector stores to compare (VECTOR_BACKEND)")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch corpora / indexes")
+    parser.add_argument("--child", choices=["ingest", "query"], help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        if args.child == "ingest":
+            result = run_ingest(args.scales[0])
+        else:
+            result = run_queries(args.k, args.query_products)
+        with open(args.result, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        sys.exit(0)
+
+    from src.config import EMBEDDING_MODEL_NAME
+
+    report = {
+        "benchmark": "retrieval",
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "k": args.k,
+        "scales": [],
+    }
+    for n_docs in args.scales:
+        for backend in args.vector_backends:
+            print(f"\n📏 Benchmarking {n_docs} documents ({backend})...")
+            report["scales"].append(
+                run_scale_in_child(n_docs, args.k, args.query_products, vector_backend=backend, keep_dir=args.keep)
+            )
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"retrieval_{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print("\n📊 Summary")
+    for scale in report["scales"]:
+        print(f"   {scale['documents']:>5} docs {scale['vector_backend']:>6} | ingest {scale['ingestion_seconds']:>8.2f}s | "
+              f"first query {scale['first_query_ms']:>8.2f}ms | "
+              f"dense p50 {scale['query_latency']['dense']['p50_ms']:>7.2f}ms | "
+              f"hybrid p50 {scale['query_latency']['hybrid']['p50_ms']:>8.2f}ms | "
+              f"unlocked p50 {scale['query_latency']['hybrid_unlocked']['p50_ms']:>8.2f}ms "
+              f"-> routed {scale['query_latency']['hybrid_routed']['p50_ms']:>8.2f}ms | "
+              f"routing p50 {scale['routing']['latency']['p50_ms']:>6.3f}ms "
+              f"top-1 {scale['routing']['accuracy']['top_1']:.2f} | "
+              f"serving RSS {scale['peak_rss_mb_serving']}MB | "
+              f"recall@{args.k} {scale[f'recall_at_{args.k}']}")
+    print(f" Results written to {output}")
@@ -0,0 +1,145 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from datetime import datetime, timezone
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+from retrieval_bench import RESULTS_DIR, git_commit
+
+# Startup benchmark: import cost of the project / heavy third-party modules, and the
+# app's time to the product-selection screen and to the first answer, per startup mode:
+#   eager       the old app.py: warm chains + the unfiltered chain before the first screen
+#   lazy        nothing before the first screen; the selected product's chain on selection
+#   background  lazy + start_background_warmup() while the user "thinks" (--think-seconds)
+# Every measurement runs in a fresh interpreter (stub LLM, existing index in DB_DIR).
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = [
+    "src.config", "src.bot", "src.resources", "src.llm", "src.qa_chain", "src.vector_store",
+    "langchain.chains", "langchain_chroma", "chromadb", "sentence_transformers", "langchain_google_genai",
+]
+MODES = ["eager", "lazy", "background"]
+
+
+def _child_env():
+    return dict(os.environ, LLM_BACKEND="stub", PYTHONPATH=REPO_DIR)
+
+
+def import_seconds(module, repeats):
+    """Best-of-`repeats` cold import time of `module` (fresh interpreter each time)."""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    best = None
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, "-c", code], env=_child_env(), cwd=REPO_DIR,
+                             capture_output=True, text=True)
+        if out.returncode != 0:
+            return None
+        seconds = float(out.stdout.strip().splitlines()[-1])
+        best = seconds if best is None else min(best, seconds)
+    return round(best * 1000, 1)
+
+
+def run_startup(mode, product, question, think_seconds):
+    """Child-process body: one simulated app start."""
+    start = time.perf_counter()
+    from src.bot import get_qa_chain, start_background_warmup, startup_report, warm_qa_chains
+
+    if mode == "eager":
+        warm_qa_chains()
+        get_qa_chain()
+    elif mode == "background":
+        start_background_warmup()
+    selection_screen = time.perf_counter() - start
+
+    time.sleep(think_seconds)
+    selected = time.perf_counter()
+    chain = get_qa_chain(target_pdf=product)
+    chain_ready = time.perf_counter() - selected
+    chain.invoke({"query": question})
+    first_answer = time.perf_counter() - selected
+
+    return {
+        "mode": mode,
+        "selection_screen_ms": round(selection_screen * 1000, 1),
+        "chain_ready_after_selection_ms": round(chain_ready * 1000, 1),
+        "first_answer_after_selection_ms": round(first_answer * 1000, 1),
+        "report": startup_report(),
+    }
+
+
+def run_startup_in_child(mode, args):
+    result_path = os.path.join(RESULTS_DIR, f".startup_{mode}_{os.getpid()}.json")
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    command = [sys.executable, os.path.abspath(__file__), "--child", mode, "--result", result_path,
+               "--product", args.product, "--question", args.question, "--think-seconds", str(args.think_seconds)]
+    try:
+        subprocess.run(command, env=_child_env(), cwd=REPO_DIR, check=True)
+        with open(result_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    finally:
+        if os.path.exists(result_path):
+            os.remove(result_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time and startup-time report.")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--product", default="DM8SE", help="Product picked on the selection screen")
+    parser.add_argument("--question", default="How do I mount the loudspeaker on a pole?")
+    parser.add_argument("--think-seconds", type=float, default=3.0,
+                        help="Time between the selection screen and the product click")
+    parser.add_argument("--repeats", type=int, default=3, help="Cold imports per module (best is kept)")
+    parser.add_argument("--max-bot-import-ms", type=float,
+                        help="Exit 1 if 'import src.bot' is slower (CI guard against eager imports)")
+    parser.add_argument("--output", help="JSON output path (default: benchmarks/results/startup_<utc>.json)")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        with open(args.result, "w", encoding="utf-8") as f:
+            json.dump(run_startup(args.child, args.product, args.question, args.think_seconds), f)
+        sys.exit(0)
+
+    print("⏱️ Measuring cold imports...")
+    imports = {module: import_seconds(module, args.repeats) for module in MODULES}
+    startups = []
+    for mode in args.modes:
+        print(f"\n Simulating app start ({mode})...")
+        startups.append(run_startup_in_child(mode, args))
+
+    report = {
+        "benchmark": "startup",
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "product": args.product,
+        "think_seconds": args.think_seconds,
+        "import_ms": imports,
+        "startup": startups,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"startup_{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print("\n📊 Summary")
+    for module, ms in imports.items():
+        print(f"   import {module:<24} {'n/a' if ms is None else f'{ms:>8.1f}ms'}")
+    for startup in startups:
+        print(f"   {startup['mode']:>10} | selection screen {startup['selection_screen_ms']:>8.1f}ms | "
+              f"chain ready {startup['chain_ready_after_selection_ms']:>8.1f}ms | "
+              f"first answer {startup['first_answer_after_selection_ms']:>8.1f}ms after the click")
+    print(f" Results written to {output}")
+
+    bot_ms = imports.get("src.bot")
+    if args.max_bot_import_ms is not None and (bot_ms is None or bot_ms > args.max_bot_import_ms):
+        print(f"❌ import src.bot took {bot_ms}ms (budget {args.max_bot_import_ms}ms)")
+        sys.exit(1)
@@ -0,0 +1,94 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+from collections import deque
+from aiohttp import web
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Rate-limited stand-in for the Gemini API (LLM_BACKEND=stub-http, see src/llm.py: HttpStubLLM):
+#   POST /generate {"prompt": ...} -> {"text": ..., "usage": {...}}   (StubLLM answers)
+#   GET  /stats                    -> request / 429 / 5xx counters
+# Like the real API it counts requests in a rolling window and answers 429 + Retry-After
+# beyond --rpm, and fails a share of requests (--error-rate) with 503.
+# --window-seconds shrinks the one-minute window so benchmarks don't take minutes.
+
+os.environ.setdefault("LLM_BACKEND", "stub")
+
+
+class StubLLMServer:
+    def __init__(self, rpm, window_seconds, latency_ms, error_rate, seed=0):
+        from src.llm import StubLLM
+        from src.context_packing import estimate_tokens
+
+        self.llm = StubLLM()
+        self.estimate_tokens = estimate_tokens
+        self.rpm = rpm
+        self.window_seconds = window_seconds
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.accepted = deque()
+        self.stats = {"requests": 0, "ok": 0, "rate_limited": 0, "errors": 0, "max_in_window": 0}
+
+    def _admit(self):
+        """Rolling-window limit: None if accepted, else seconds until a slot frees up."""
+        now = time.monotonic()
+        while self.accepted and self.accepted[0] <= now - self.window_seconds:
+            self.accepted.popleft()
+        if len(self.accepted) >= self.rpm:
+            return self.accepted[0] + self.window_seconds - now
+        self.accepted.append(now)
+        self.stats["max_in_window"] = max(self.stats["max_in_window"], len(self.accepted))
+        return None
+
+    async def handle_generate(self, request):
+        self.stats["requests"] += 1
+        prompt = (await request.json())["prompt"]
+        retry_after = self._admit()
+        if retry_after is not None:
+            self.stats["rate_limited"] += 1
+            return web.json_response({"error": "Resource has been exhausted (e.g. check quota)."}, status=429,
+                                     headers={"Retry-After": f"{retry_after:.2f}"})
+
+        # Round trip with +-30% jitter
+        await asyncio.sleep(self.latency_ms / 1000 * self.random.uniform(0.7, 1.3))
+        if self.random.random() < self.error_rate:
+            self.stats["errors"] += 1
+            return web.json_response({"error": "The service is currently unavailable."}, status=503)
+
+        text = self.llm._answer(prompt)
+        self.stats["ok"] += 1
+        input_tokens, output_tokens = self.estimate_tokens(prompt), self.estimate_tokens(text)
+        return web.json_response({"text": text, "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                                                          "total_tokens": input_tokens + output_tokens}})
+
+    async def handle_stats(self, request):
+        return web.json_response(dict(self.stats, rpm=self.rpm, window_seconds=self.window_seconds))
+
+
+def create_app(rpm=15, window_seconds=60.0, latency_ms=300.0, error_rate=0.0, seed=0):
+    server = StubLLMServer(rpm, window_seconds, latency_ms, error_rate, seed)
+    app = web.Application()
+    app.router.add_post("/generate", server.handle_generate)
+    app.router.add_get("/stats", server.handle_stats)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rate-limited stub LLM server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--rpm", type=int, default=15, help="Requests accepted per window")
+    parser.add_argument("--window-seconds", type=float, default=60.0, help="Length of the rate-limit window")
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Simulated generation time")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of accepted requests failing with 503")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    web.run_app(create_app(args.rpm, args.window_seconds, args.latency_ms, args.error_rate, args.seed),
+                host=args.host, port=args.port)
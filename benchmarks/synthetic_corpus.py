@@ -0,0 +1,140 @@
+import os
+import sys
+import json
+import random
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Synthetic Bose-style technical data sheets: one PDF per product, a description
+# page plus a spec-table page, with known ("gold") values to ask about.
+
+FAMILIES = ["DesignMax", "ControlSpace", "FreeSpace", "ArenaMatch", "PowerSpace", "EdgeMax", "PowerMatch"]
+KINDS = ["loudspeaker", "conferencing processor", "amplifier", "subwoofer", "ceiling loudspeaker", "signal processor"]
+
+# field -> (section, value generator)
+SPEC_FIELDS = {
+    "Net Weight": ("PHYSICAL", lambda r: f"{r.uniform(1, 40):.1f} kg ({r.uniform(2, 90):.1f} lb)"),
+    "Shipping Weight": ("PHYSICAL", lambda r: f"{r.uniform(2, 50):.1f} kg"),
+    "AC Power Consumption": ("ELECTRICAL SPECIFICATIONS", lambda r: f"{r.randint(10, 900)} W typical"),
+    "Power Dissipation": ("ELECTRICAL SPECIFICATIONS", lambda r: f"{r.randint(20, 1500)} W ({r.randint(50, 5000)} BTU)"),
+    "Mains Voltage": ("ELECTRICAL SPECIFICATIONS", lambda r: f"{r.choice([85, 100, 120])} VAC-{r.choice([240, 264])} VAC 50/60 Hz"),
+    "Dynamic Range": ("AUDIO PERFORMANCE", lambda r: f"> {r.randint(95, 125)} dB, A-weighted"),
+    "Frequency Response": ("AUDIO PERFORMANCE", lambda r: f"{r.randint(20, 200)} Hz to {r.randint(15, 22)} kHz"),
+    "Sensitivity": ("AUDIO PERFORMANCE", lambda r: f"{r.randint(80, 105)} dB SPL / 1 W @ 1 m"),
+    "Maximum SPL": ("AUDIO PERFORMANCE", lambda r: f"{r.randint(100, 140)} dB peak"),
+    "Nominal Impedance": ("TRANSDUCERS", lambda r: f"{r.choice([4, 6, 8, 16])} ohms"),
+    "Tail Length": ("ACOUSTIC ECHO CANCELLING", lambda r: f"{r.choice([120, 240, 320, 480, 640])} ms"),
+    "Input Channels": ("ANALOG AUDIO INPUTS", lambda r: f"{r.randint(2, 64)} balanced, mic/line level"),
+    "Output Channels": ("ANALOG AUDIO OUTPUTS", lambda r: f"{r.randint(2, 32)} balanced, line level"),
+    "Operating Temperature": ("GENERAL", lambda r: f"{r.randint(-25, 5)} °C to {r.randint(40, 70)} °C"),
+    "Transformer Taps": ("ELECTRICAL SPECIFICATIONS", lambda r: f"70V: {', '.join(f'{w} W' for w in sorted(r.sample([2.5, 5, 10, 20, 40, 80, 160], 4)))}, bypass"),
+}
+
+DESCRIPTION_WORDS = (
+    "delivers clear intelligible sound for commercial installations with flexible mounting options "
+    "and premium aesthetics designed for boardrooms auditoriums retail spaces and outdoor venues "
+    "the open architecture design is configured using ControlSpace Designer software and supports "
+    "Dante audio networking AmpLink digital outputs and advanced acoustic echo cancellation"
+).split()
+
+
+def model_id(index):
+    return f"SYN-{index:05d}"
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages):
+    """
+    Writes a minimal text-only PDF (Helvetica, one line per entry) that PyPDFLoader can parse.
+    pages: list of lists of text lines.
+    """
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    pages_obj = add(None)
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    page_ids = []
+    for lines in pages:
+        text = " T* ".join(f"({_escape(line)}) Tj" for line in lines)
+        stream = f"BT /F1 9 Tf 12 TL 40 760 Td {text} ET".encode("latin-1", "replace")
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            f"<< /Type /Page /Parent {pages_obj} 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font} 0 R >> >> /Contents {content} 0 R >>".encode()
+        ))
+
+    objects[catalog - 1] = f"<< /Type /Catalog /Pages {pages_obj} 0 R >>".encode()
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects[pages_obj - 1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref_at = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{o:010d} 00000 n \n".encode() for o in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root {catalog} 0 R >>\nstartxref\n{xref_at}\n%%EOF\n".encode()
+
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def generate_corpus(data_dir, n_docs, seed=42):
+    """
+    Writes n_docs synthetic data sheets into data_dir and returns the gold table:
+    [{"model": "SYN-00003", "file": ..., "family": ..., "specs": {field: value}}]
+    """
+    rng = random.Random(seed)
+    os.makedirs(data_dir, exist_ok=True)
+    gold = []
+
+    for i in range(n_docs):
+        model = model_id(i)
+        family = rng.choice(FAMILIES)
+        kind = rng.choice(KINDS)
+        fields = rng.sample(sorted(SPEC_FIELDS), k=10)
+        specs = {field: SPEC_FIELDS[field][1](rng) for field in fields}
+
+        description = ["TECHNICAL DATA", f"{family} {model} {kind}", "Product Overview"]
+        words = [rng.choice(DESCRIPTION_WORDS) for _ in range(120)]
+        description += [" ".join(words[j:j + 14]) for j in range(0, len(words), 14)]
+
+        spec_page = ["Technical Specifications"]
+        for section in sorted({SPEC_FIELDS[f][0] for f in fields}):
+            spec_page.append(section)
+            spec_page += [f"{field} {specs[field]}" for field in fields if SPEC_FIELDS[field][0] == section]
+        spec_page.append(f"PRODUCT CODES {rng.randint(100000, 999999)}-{rng.randint(1000, 9999)} {model}")
+
+        file_name = f"TDS_{family}_{model}_EN.pdf"
+        write_pdf(os.path.join(data_dir, file_name), [description, spec_page])
+        gold.append({"model": model, "file": file_name, "family": family, "kind": kind, "specs": specs})
+
+    with open(os.path.join(data_dir, "gold.json"), "w", encoding="utf-8") as f:
+        json.dump(gold, f, indent=2)
+    return gold
+
+
+def make_queries(gold, n_products, per_product=3, seed=7):
+    """Spec questions with the gold value + source model they must be answered from."""
+    rng = random.Random(seed)
+    queries = []
+    for entry in rng.sample(gold, k=min(n_products, len(gold))):
+        for field in rng.sample(sorted(entry["specs"]), k=min(per_product, len(entry["specs"]))):
+            queries.append({
+                "question": f"What is the {field} of the {entry['model']}?",
+                "model": entry["model"],
+                "field": field,
+                "value": entry["specs"][field],
+            })
+    return queries
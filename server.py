@@ -0,0 +1,369 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+from aiohttp import web
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+# Headless QA service for support tooling (the Streamlit UI stays in app.py):
+#   POST /ask     {"question": ..., "product": "DM8SE" (optional), "expansion_mode": "local" (optional)}
+#   POST /ask/batch {"questions": [...], "product": ..., "expansion_mode": ...}: many questions for one
+#                 product in a few LLM calls (src/batch_qa.py), per-question answers + citations
+#   GET  /health  200 once embeddings, indexes and the warm chains are loaded, 503 before;
+#                 also reports the index generation being served (hot-reloaded, src/generations.py)
+#   GET  /stats   request counters, chain cache, answer cache and LLM scheduler stats
+#   GET  /metrics pipeline stage metrics in Prometheus text format (src/tracing.py)
+# Chains come from the same process-wide cache as the UI (bot.get_qa_chain).
+# NOTE: src.* is imported inside the functions so that --llm-backend can switch
+# to the offline stub LLM before config is read (same as src/evaluate.py).
+
+EXPANSION_MODES = ("llm", "local", "none")
+
+
+class ServiceOverloaded(Exception):
+    """More questions are waiting than SERVER_MAX_QUEUE allows."""
+
+
+def question_key(product, expansion_mode, question):
+    """Identical questions (case / whitespace-insensitive) to the same chain share one answer."""
+    return product or "", expansion_mode or "", " ".join(question.lower().split())
+
+
+def serialize_sources(documents, excerpt_chars=300):
+    sources, seen = [], set()
+    for doc in documents:
+        entry = (os.path.basename(doc.metadata.get("source", "")), doc.metadata.get("page", 0) + 1)
+        if entry in seen:
+            continue
+        seen.add(entry)
+        sources.append({"file": entry[0], "page": entry[1], "excerpt": doc.page_content[:excerpt_chars]})
+    return sources
+
+
+class QAService:
+    """
+    Bounded-concurrency, single-flight front of the QA chains:
+      - at most max_concurrency answers are computed at once, max_queue more may wait
+      - concurrent identical questions for the same product share one chain run
+    """
+
+    def __init__(self, max_concurrency, max_queue, timeout, warm_products=None):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.warm_products = warm_products
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        # Admitted requests not holding a slot yet / holding one
+        self.waiting = 0
+        self.running = 0
+        self.in_flight = {}
+        self.stats = {"requests": 0, "answered": 0, "batches": 0, "coalesced": 0, "rejected": 0, "llm_unavailable": 0,
+                      "timeouts": 0, "errors": 0}
+        self.ready = False
+        self.startup = {"embeddings": False, "vector_store": False, "indexes": False, "chains": [],
+                        "seconds": None, "error": None}
+
+    # --- readiness ---
+
+    def _warm_up_sync(self):
+        from src.manifest import load_manifest
+        from src.resources import get_embeddings, get_vector_store
+        from src.bot import chain_cache_stats, get_qa_chain, start_index_watcher, warm_qa_chains
+
+        if not load_manifest()["sources"]:
+            raise RuntimeError("Index is empty: run 'python src/vector_store.py --ingest' first")
+        get_embeddings()
+        self.startup["embeddings"] = True
+        get_vector_store()
+        self.startup["vector_store"] = True
+
+        # Building the chains opens the BM25 partitions / spec tables of each product
+        warm_qa_chains(self.warm_products)
+        if get_qa_chain() is None:
+            raise RuntimeError("QA chain could not be built (missing GOOGLE_API_KEY?)")
+        self.startup["indexes"] = True
+        self.startup["chains"] = chain_cache_stats()["products"]
+        # Newly ingested index generations are warmed and swapped in while serving
+        start_index_watcher()
+
+    async def warm_up(self):
+        start = time.perf_counter()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._warm_up_sync)
+            self.ready = True
+            print(f" QA service ready in {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            self.startup["error"] = str(e)
+            print(f"❌ QA service failed to start: {e}")
+        self.startup["seconds"] = round(time.perf_counter() - start, 3)
+
+    # --- answering ---
+
+    def _admit(self):
+        """
+        Counts a request as waiting for a slot, or raises ServiceOverloaded. Check and count happen
+        in the same step, so a burst arriving within one event-loop tick cannot overfill the queue.
+        """
+        if self.waiting >= self.max_queue + self.max_concurrency - self.running:
+            raise ServiceOverloaded()
+        self.waiting += 1
+
+    async def _acquire(self):
+        """Takes the slot of an admitted request (it stops counting as waiting either way)."""
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+
+    def _release(self):
+        self.running -= 1
+        self.semaphore.release()
+
+    async def ask(self, question, product=None, expansion_mode=None):
+        """Answers one question; returns the response dict with "coalesced" set for followers."""
+        key = question_key(product, expansion_mode, question)
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            return dict(await asyncio.shield(task), coalesced=True)
+
+        self._admit()
+        task = asyncio.ensure_future(self._answer(question, product, expansion_mode))
+        self.in_flight[key] = task
+        task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        # Shielded: a disconnecting client must not cancel the answer other callers wait for
+        return dict(await asyncio.shield(task), coalesced=False)
+
+    async def _answer(self, question, product, expansion_mode):
+        from src.bot import get_qa_chain
+
+        loop = asyncio.get_running_loop()
+        await self._acquire()
+        try:
+            # Cache hit in the common case; a cold product builds its chain off the event loop
+            chain = await loop.run_in_executor(None, get_qa_chain, product, expansion_mode)
+            if chain is None:
+                raise RuntimeError("QA chain could not be built (missing GOOGLE_API_KEY?)")
+            response = await asyncio.wait_for(chain.ainvoke({"query": question}), self.timeout)
+        finally:
+            self._release()
+
+        return {
+            "answer": response["result"],
+            "sources": serialize_sources(response.get("source_documents", [])),
+            "cached": response.get("cached", False),
+            "fast_path": response.get("fast_path", False),
+            "trace": response.get("trace"),
+        }
+
+
+    async def ask_batch(self, questions, product=None, expansion_mode=None):
+        """Answers a batch of questions (src/batch_qa.py); the whole batch takes one concurrency slot."""
+        from src.batch_qa import answer_batch
+
+        self._admit()
+        await self._acquire()
+        try:
+            # No overall timeout: every LLM call of the batch is bounded by the scheduler (LLM_ANSWER_MAX_WAIT)
+            return await asyncio.get_running_loop().run_in_executor(
+                None, lambda: answer_batch(questions, target_pdf=product, expansion_mode=expansion_mode)
+            )
+        finally:
+            self._release()
+
+
+# --- HTTP handlers ---
+
+def _error(status, message, **headers):
+    return web.json_response({"error": message}, status=status, headers=headers or None)
+
+
+async def handle_ask(request):
+    from src.vector_store import _find_matching_path
+
+    service = request.app["service"]
+    service.stats["requests"] += 1
+    if not service.ready:
+        return _error(503, "Service is starting", **{"Retry-After": "2"})
+
+    try:
+        body = await request.json()
+    except Exception:
+        return _error(400, "Body must be JSON: {\"question\": ..., \"product\": ...}")
+    if not isinstance(body, dict):
+        return _error(400, "Body must be a JSON object")
+
+    question = str(body.get("question") or "").strip()
+    product = body.get("product") or None
+    expansion_mode = body.get("expansion_mode") or None
+    if not question:
+        return _error(400, "'question' is required")
+    if expansion_mode is not None and expansion_mode not in EXPANSION_MODES:
+        return _error(400, f"'expansion_mode' must be one of {', '.join(EXPANSION_MODES)}")
+    if product is not None and _find_matching_path(str(product)) is None:
+        return _error(404, f"Unknown product: {product!r}")
+
+    from src.llm_scheduler import LLMUnavailableError
+
+    start = time.perf_counter()
+    try:
+        response = await service.ask(question, product, expansion_mode)
+    except ServiceOverloaded:
+        service.stats["rejected"] += 1
+        return _error(503, "Too many questions in flight", **{"Retry-After": "1"})
+    except LLMUnavailableError as e:
+        service.stats["llm_unavailable"] += 1
+        return _error(503, str(e), **{"Retry-After": str(max(1, round(e.retry_after or 5)))})
+    except asyncio.TimeoutError:
+        service.stats["timeouts"] += 1
+        return _error(504, f"No answer within {service.timeout:.0f}s")
+    except Exception as e:
+        service.stats["errors"] += 1
+        return _error(500, str(e))
+
+    service.stats["answered"] += 1
+    response.update(question=question, product=product, latency_ms=round((time.perf_counter() - start) * 1000, 2))
+    return web.json_response(response)
+
+
+async def handle_ask_batch(request):
+    from src.config import BATCH_QA_MAX_QUESTIONS
+    from src.vector_store import _find_matching_path
+
+    service = request.app["service"]
+    service.stats["requests"] += 1
+    if not service.ready:
+        return _error(503, "Service is starting", **{"Retry-After": "2"})
+
+    try:
+        body = await request.json()
+    except Exception:
+        return _error(400, "Body must be JSON: {\"questions\": [...], \"product\": ...}")
+    if not isinstance(body, dict):
+        return _error(400, "Body must be a JSON object")
+
+    questions = body.get("questions")
+    product = body.get("product") or None
+    expansion_mode = body.get("expansion_mode") or None
+    if not isinstance(questions, list) or not questions:
+        return _error(400, "'questions' must be a non-empty list")
+    questions = [str(question or "").strip() for question in questions]
+    if not all(questions):
+        return _error(400, "'questions' must not contain empty questions")
+    if len(questions) > BATCH_QA_MAX_QUESTIONS:
+        return _error(400, f"At most {BATCH_QA_MAX_QUESTIONS} questions per batch")
+    if expansion_mode is not None and expansion_mode not in EXPANSION_MODES:
+        return _error(400, f"'expansion_mode' must be one of {', '.join(EXPANSION_MODES)}")
+    if product is not None and _find_matching_path(str(product)) is None:
+        return _error(404, f"Unknown product: {product!r}")
+
+    from src.llm_scheduler import LLMUnavailableError
+
+    start = time.perf_counter()
+    try:
+        response = await service.ask_batch(questions, product, expansion_mode)
+    except ServiceOverloaded:
+        service.stats["rejected"] += 1
+        return _error(503, "Too many questions in flight", **{"Retry-After": "1"})
+    except LLMUnavailableError as e:
+        service.stats["llm_unavailable"] += 1
+        return _error(503, str(e), **{"Retry-After": str(max(1, round(e.retry_after or 5)))})
+    except Exception as e:
+        service.stats["errors"] += 1
+        return _error(500, str(e))
+
+    service.stats["batches"] += 1
+    service.stats["answered"] += len(questions)
+    response.update(product=product, latency_ms=round((time.perf_counter() - start) * 1000, 2))
+    return web.json_response(response)
+
+
+async def handle_health(request):
+    from src.bot import index_status
+    from src.config import LLM_BACKEND
+
+    service = request.app["service"]
+    status = "ready" if service.ready else ("failed" if service.startup["error"] else "starting")
+    return web.json_response(
+        {"status": status, "llm_backend": LLM_BACKEND, "startup": service.startup,
+         "in_flight": len(service.in_flight), "waiting": service.waiting,
+         "running": service.running, "index": index_status()},
+        status=200 if service.ready else 503,
+    )
+
+
+async def handle_stats(request):
+    from src.bot import chain_cache_stats, get_answer_cache
+    from src.llm_scheduler import get_scheduler
+
+    service = request.app["service"]
+    scheduler = get_scheduler()
+    answer_cache = get_answer_cache() if service.ready else None
+    return web.json_response({
+        "requests": service.stats,
+        "in_flight": len(service.in_flight),
+        "waiting": service.waiting,
+        "running": service.running,
+        "max_concurrency": service.max_concurrency,
+        "chain_cache": chain_cache_stats(),
+        "answer_cache": dict(answer_cache.stats) if answer_cache is not None else None,
+        "llm_scheduler": scheduler.snapshot() if scheduler is not None else None,
+    })
+
+
+async def handle_metrics(request):
+    from src.tracing import get_metrics
+
+    return web.Response(text=get_metrics().to_prometheus(),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+def create_app(max_concurrency=None, max_queue=None, timeout=None, warm_products=None):
+    from src.config import SERVER_MAX_CONCURRENCY, SERVER_MAX_QUEUE, SERVER_REQUEST_TIMEOUT
+
+    app = web.Application()
+    app["service_options"] = {
+        "max_concurrency": max_concurrency or SERVER_MAX_CONCURRENCY,
+        "max_queue": SERVER_MAX_QUEUE if max_queue is None else max_queue,
+        "timeout": timeout or SERVER_REQUEST_TIMEOUT,
+        "warm_products": warm_products,
+    }
+
+    async def start_service(app):
+        # Created inside the running loop; warm-up runs in the background so /health answers right away
+        app["service"] = QAService(**app["service_options"])
+        app["warm_up"] = asyncio.ensure_future(app["service"].warm_up())
+
+    async def stop_service(app):
+        app["warm_up"].cancel()
+
+    app.on_startup.append(start_service)
+    app.on_cleanup.append(stop_service)
+    app.router.add_post("/ask", handle_ask)
+    app.router.add_post("/ask/batch", handle_ask_batch)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/stats", handle_stats)
+    app.router.add_get("/metrics", handle_metrics)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP API for the Bose QA bot.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--llm-backend", choices=["gemini", "stub", "stub-http"],
+                        help="'stub' = deterministic offline LLM (load tests, CI), "
+                             "'stub-http' = the same behind benchmarks/stub_llm_server.py")
+    parser.add_argument("--max-concurrency", type=int, help="Default SERVER_MAX_CONCURRENCY")
+    parser.add_argument("--max-queue", type=int, help="Default SERVER_MAX_QUEUE")
+    args = parser.parse_args()
+
+    if args.llm_backend:
+        os.environ["LLM_BACKEND"] = args.llm_backend
+
+    web.run_app(create_app(max_concurrency=args.max_concurrency, max_queue=args.max_queue),
+                host=args.host, port=args.port)
@@ -0,0 +1,177 @@
+import os
+import re
+import sys
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.config import ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_MAX_ENTRIES
+
+# Words that change the answer of otherwise near-identical questions ("maximum" / "minimum SPL"),
+# mapped to one form: embeddings barely tell them apart, so they must match exactly
+_QUALIFIERS = {
+    "max": "max", "maximum": "max", "highest": "max", "upper": "max",
+    "min": "min", "minimum": "min", "lowest": "min", "lower": "min",
+    "peak": "peak", "continuous": "continuous", "nominal": "nominal", "typical": "typical",
+    "average": "average", "rms": "rms", "program": "program",
+}
+# Standalone numbers ("70V tap", "8 ohm"), not digits inside model names (DM8SE)
+_NUMBER = re.compile(r"\b\d+(?:[.,]\d+)?")
+
+
+def query_qualifiers(query):
+    """Qualifier words and numbers of a question; cached answers are only shared between equal sets."""
+    text = query.lower()
+    words = {_QUALIFIERS[w] for w in re.findall(r"[a-z]+", text) if w in _QUALIFIERS}
+    return frozenset(words | set(_NUMBER.findall(text)))
+
+
+class SemanticAnswerCache:
+    """
+    Product-scoped cache of chain answers, looked up by query-embedding similarity.
+
+    - An entry is reused when cosine(query, cached query) >= threshold and both
+      questions have the same qualifiers (max / min / peak, numbers; see query_qualifiers).
+    - Entries expire after ttl_seconds; the least recently used entry is evicted
+      once max_entries is reached.
+    - Every entry remembers the index version of its product; a lookup with a
+      different version drops all entries of that product (PDF was re-ingested).
+    """
+
+    def __init__(self, embed_fn, threshold=None, ttl_seconds=None, max_entries=None):
+        self.embed_fn = embed_fn
+        self.threshold = ANSWER_CACHE_THRESHOLD if threshold is None else threshold
+        self.ttl_seconds = ANSWER_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.max_entries = ANSWER_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+
+        self._entries = OrderedDict()   # entry_id -> entry dict (LRU order)
+        self._versions = {}             # product -> index version of its entries
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _embed(self, query):
+        vector = np.asarray(self.embed_fn(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self, product, version):
+        if self._versions.get(product, version) != version:
+            stale = [eid for eid, e in self._entries.items() if e["product"] == product]
+            for eid in stale:
+                del self._entries[eid]
+            self.stats["invalidations"] += len(stale)
+        self._versions[product] = version
+
+    def _expire(self, now):
+        expired = [eid for eid, e in self._entries.items() if now - e["created"] > self.ttl_seconds]
+        for eid in expired:
+            del self._entries[eid]
+        self.stats["evictions"] += len(expired)
+
+    def lookup(self, product, query, version=None, vector=None):
+        """
+        Returns (payload_or_None, query_vector). Pass the vector back to store()
+        on a miss so the query is only embedded once.
+        """
+        if vector is None:
+            vector = self._embed(query)
+
+        with self._lock:
+            self._check_version(product, version)
+            self._expire(time.time())
+
+            qualifiers = query_qualifiers(query)
+            candidates = [(eid, e) for eid, e in self._entries.items()
+                          if e["product"] == product and e["qualifiers"] == qualifiers]
+            if candidates:
+                matrix = np.stack([e["vector"] for _, e in candidates])
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    eid, entry = candidates[best]
+                    self._entries.move_to_end(eid)
+                    self.stats["hits"] += 1
+                    return dict(entry["payload"], similarity=float(scores[best])), vector
+
+            self.stats["misses"] += 1
+            return None, vector
+
+    def store(self, product, query, payload, version=None, vector=None):
+        if vector is None:
+            vector = self._embed(query)
+
+        with self._lock:
+            self._check_version(product, version)
+            self._entries[self._next_id] = {
+                "product": product,
+                "qualifiers": query_qualifiers(query),
+                "vector": vector,
+                "payload": payload,
+                "created": time.time(),
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# --- UNIT TEST (offline: bag-of-words "embeddings" + stub chain) ---
+if __name__ == "__main__":
+    import re
+    from src.qa_chain import ProductQAChain
+
+    vocab = {}
+    def toy_embed(text):
+        words = set(re.findall(r"\w+", text.lower())) - {"the", "of", "a", "is", "what", "how"}
+        vector = np.zeros(64, dtype=np.float32)
+        for w in words:
+            vector[vocab.setdefault(w, len(vocab)) % 64] += 1
+        return vector
+
+    class StubChain:
+        calls = 0
+        def invoke(self, inputs, config=None, **kwargs):
+            StubChain.calls += 1
+            return {"query": inputs["query"], "result": "10.3 kg (22.8 lb)", "source_documents": []}
+
+    version = {"v": "A"}
+    cache = SemanticAnswerCache(toy_embed, threshold=0.8, ttl_seconds=60, max_entries=10)
+    qa = ProductQAChain(StubChain(), product="DM8SE", answer_cache=cache, version_fn=lambda: version["v"])
+
+    qa.invoke({"query": "Net weight of the DM8SE?"})
+    hit = qa.invoke({"query": "What is the net weight of DM8SE"})
+    assert hit["cached"] and StubChain.calls == 1, "similar question should hit"
+
+    qa.invoke({"query": "Power handling peak?"})
+    assert StubChain.calls == 2, "different question should miss"
+
+    # Near-identical wording, opposite meaning: similar enough to hit, but the qualifiers differ
+    maximum = "What is the maximum operating temperature of the DM8SE loudspeaker outdoors?"
+    minimum = "What is the minimum operating temperature of the DM8SE loudspeaker outdoors?"
+    similarity = float(cache._embed(maximum) @ cache._embed(minimum))
+    qa.invoke({"query": maximum})
+    qa.invoke({"query": minimum})
+    assert similarity >= cache.threshold and StubChain.calls == 4, "max / min should miss"
+    qa.invoke({"query": "What is the 70V tap setting of the DM8SE?"})
+    qa.invoke({"query": "What is the 100V tap setting of the DM8SE?"})
+    assert StubChain.calls == 6, "different numbers should miss"
+    assert qa.invoke({"query": "Maximum operating temperature of the DM8SE loudspeaker outdoors?"})["cached"]
+
+    version["v"] = "B"
+    qa.invoke({"query": "Net weight of the DM8SE?"})
+    assert StubChain.calls == 7, "re-ingested PDF should invalidate"
+
+    print(f"✅ Answer cache OK: {cache.stats}")
@@ -0,0 +1,412 @@
+import os
+import sys
+import re
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.config import BATCH_QA_GROUP_SIZE, BATCH_QA_CONTEXT_BUDGET, LLM_MAX_CONCURRENCY
+from src.context_packing import ContextPackingRetriever, estimate_tokens, pack_context
+from src.query_expansion import (
+    BudgetedMultiQueryRetriever, LocalQueryExpansionRetriever, _unique_documents, expand_query
+)
+from src.bm25_index import PersistedBM25Retriever
+from src.vector_store import RoutedDenseRetriever, RoutedRetriever, similarity_search_by_vectors
+
+# Batch QA: many questions for one product (comparison sheets, bulk spec extraction) in a few
+# LLM calls instead of one chain run per question. Built on the product's cached chain (get_qa_chain):
+#   1. spec-table fast path, then the answer cache, per question (same as ProductQAChain.invoke)
+#   2. query variants from the chain's expansion table ("llm" mode too: no query-generation
+#      call per question), every distinct variant embedded in one batch
+#   3. dense lookups of all variants as one matrix product per block (NumPy index) / one
+#      multi-vector query (Chroma), BM25 scores in one pass per partition, fused per variant
+#      exactly like HybridRetriever, then context packed per question
+#   4. questions grouped (BATCH_QA_GROUP_SIZE, passages shared between them sent once, up to
+#      BATCH_QA_CONTEXT_BUDGET tokens) into one LLM call each, answering with a JSON array
+#   5. a question missing from its group's reply is answered by the single-question chain
+
+NOT_FOUND_ANSWER = "This query is not related to the currently selected product."
+
+BATCH_PROMPT = """You are a technical assistant for Bose Professional products.
+
+Passages:
+{passages}
+
+Questions:
+{questions}
+
+INSTRUCTIONS:
+1. Answer every question based only on the passages listed next to it.
+2. You may expand acronyms ONLY if the expansion text exists in those passages.
+   Do NOT add external definitions (e.g., IP ratings, safety standards, electrical codes).
+3. DATA CLEANING: The source text may have merged words due to PDF formatting.
+4. If a question's passages do not contain the answer, answer:
+   "{not_found}"
+5. Reply with a JSON array only, one object per question:
+   [{{"id": "Q1", "answer": "...", "citations": [1, 2]}}]
+   "citations" are the numbers of the passages the answer is taken from.
+
+JSON:"""
+
+
+# --- retrieval ---
+
+def _chain_retrievers(chain):
+    """The chain's retriever stack: (packer or None, expander or None, base hybrid / routed retriever)."""
+    retriever = chain.chain.retriever
+    packer = retriever if isinstance(retriever, ContextPackingRetriever) else None
+    if packer is not None:
+        retriever = packer.retriever
+    expander = retriever if isinstance(retriever, (LocalQueryExpansionRetriever, BudgetedMultiQueryRetriever)) else None
+    return packer, expander, expander.retriever if expander is not None else retriever
+
+
+def _vector_store(base):
+    return base.vector_store if isinstance(base, RoutedRetriever) else _search_plan(base)[0]["vector_store"]
+
+
+def _search_plan(hybrid):
+    """What a HybridRetriever searches: ({vector_store, filter, dense_k, partitions, chunks, bm25_k}, grouping key)."""
+    dense, sparse = hybrid.retrievers
+    if isinstance(dense, RoutedDenseRetriever):
+        vector_store, dense_filter, dense_k = dense.vector_store, dense.filter, dense.k
+    else:
+        vector_store, dense_filter, dense_k = dense.vectorstore, dense.search_kwargs.get("filter"), \
+            dense.search_kwargs.get("k", 4)
+    partitions = [sparse.partition] if isinstance(sparse, PersistedBM25Retriever) else list(sparse.partitions)
+    plan = {"vector_store": vector_store, "filter": dense_filter, "dense_k": dense_k,
+            "partitions": partitions, "chunks": sparse.chunks, "bm25_k": sparse.k, "fuser": hybrid}
+    return plan, (json.dumps(dense_filter, sort_keys=True), tuple(p.name for p in partitions))
+
+
+def _bm25_batch(plan, queries):
+    """PersistedBM25Retriever / PartitionedBM25Retriever results of every query, each partition scored once."""
+    chunks, k = plan["chunks"], plan["bm25_k"]
+    hits = [[] for _ in queries]
+    for partition in plan["partitions"]:
+        first = chunks.first_row(partition.name)
+        for query_hits, partition_hits in zip(hits, partition.top_k_batch(queries, k)):
+            query_hits.extend((score, first + i) for i, score in partition_hits)
+    results = []
+    for query_hits in hits:
+        query_hits.sort(key=lambda hit: -hit[0])
+        results.append([chunks.document(row) for _, row in query_hits[:k]])
+    return results
+
+
+def retrieve_batch(chain, questions, vectors=None, stats=None):
+    """
+    The context the chain would retrieve (and pack) for each question, computed for all
+    of them at once. vectors: {text: embedding} of queries already embedded by the caller;
+    the missing ones are embedded in one batch. Returns one Document list per question.
+    """
+    stats = {} if stats is None else stats
+    vectors = {} if vectors is None else vectors
+    packer, expander, base = _chain_retrievers(chain)
+
+    start = time.perf_counter()
+    variants = [expand_query(question, expander.table) if expander is not None else [question]
+                for question in questions]
+    queries = list(dict.fromkeys(variant for question_variants in variants for variant in question_variants))
+    missing = [query for query in queries if query not in vectors]
+    if missing:
+        vectors.update(zip(missing, _vector_store(base).embeddings.embed_documents(missing)))
+    embedded = time.perf_counter()
+
+    # Queries searching the same partitions / filter are looked up together
+    groups = {}
+    for query in queries:
+        hybrid = base._plan(query, vectors[query])[0] if isinstance(base, RoutedRetriever) else base
+        plan, key = _search_plan(hybrid)
+        groups.setdefault(key, (plan, []))[1].append(query)
+
+    fused = {}
+    for plan, group_queries in groups.values():
+        dense_lists = similarity_search_by_vectors(plan["vector_store"], [vectors[q] for q in group_queries],
+                                                   k=plan["dense_k"], filter=plan["filter"])
+        sparse_lists = _bm25_batch(plan, group_queries)
+        for query, dense_docs, sparse_docs in zip(group_queries, dense_lists, sparse_lists):
+            fused[query] = plan["fuser"].weighted_reciprocal_rank([dense_docs, sparse_docs])
+    searched = time.perf_counter()
+
+    contexts = []
+    for question_variants in variants:
+        documents = _unique_documents([doc for variant in question_variants for doc in fused[variant]])
+        if packer is not None:
+            documents = pack_context(documents, packer.token_budget, packer.dedup_threshold)[0]
+        contexts.append(documents)
+
+    stats.update(
+        queries=len(queries),
+        query_groups=len(groups),
+        embedded=len(missing),
+        embed_seconds=round(embedded - start, 4),
+        search_seconds=round(searched - embedded, 4),
+        retrieval_seconds=round(time.perf_counter() - start, 4),
+    )
+    return contexts
+
+
+# --- generation ---
+
+def _passage_key(doc):
+    return doc.metadata.get("source", ""), doc.metadata.get("page", 0), doc.page_content
+
+
+def group_questions(contexts, group_size=None, context_budget=None):
+    """
+    Splits question indexes into LLM calls, in order: at most group_size questions per call and
+    at most context_budget estimated tokens of distinct passages (a passage shared by several
+    questions counts once). A question over the budget on its own still gets a call.
+    """
+    group_size = group_size or BATCH_QA_GROUP_SIZE
+    context_budget = BATCH_QA_CONTEXT_BUDGET if context_budget is None else context_budget
+    groups, current, seen, tokens = [], [], set(), 0
+    for index, documents in enumerate(contexts):
+        new = {_passage_key(doc): doc for doc in documents if _passage_key(doc) not in seen}
+        new_tokens = sum(estimate_tokens(doc.page_content) for doc in new.values())
+        if current and (len(current) >= group_size or (context_budget and tokens + new_tokens > context_budget)):
+            groups.append(current)
+            current, seen, tokens = [], set(), 0
+            new_tokens = sum(estimate_tokens(doc.page_content) for doc in documents)
+        current.append(index)
+        seen.update(_passage_key(doc) for doc in documents)
+        tokens += new_tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def build_batch_prompt(questions, contexts):
+    """
+    One prompt for a group of questions: every distinct passage once, numbered, and each
+    question with the numbers of its own passages. Returns (prompt, passages, passage numbers per question).
+    """
+    passages, numbers, question_passages = [], {}, []
+    for documents in contexts:
+        own = []
+        for doc in documents:
+            key = _passage_key(doc)
+            if key not in numbers:
+                passages.append(doc)
+                numbers[key] = len(passages)
+            if numbers[key] not in own:
+                own.append(numbers[key])
+        question_passages.append(own)
+
+    passage_text = "\n\n".join(
+        f"[{n}] ({os.path.basename(doc.metadata.get('source', ''))}, page {doc.metadata.get('page', 0) + 1})\n"
+        f"{doc.page_content}"
+        for n, doc in enumerate(passages, 1)
+    )
+    question_text = "\n".join(
+        f"Q{i} (passages {', '.join(map(str, own)) or 'none'}): {' '.join(question.split())}"
+        for i, (question, own) in enumerate(zip(questions, question_passages), 1)
+    )
+    prompt = BATCH_PROMPT.format(passages=passage_text or "(none)", questions=question_text,
+                                 not_found=NOT_FOUND_ANSWER)
+    return prompt, passages, question_passages
+
+
+def parse_batch_answers(text):
+    """{"Q1": {"answer", "citations"}} from the model's JSON reply (code fences and chatter around it are ignored)."""
+    match = re.search(r"\[.*\]", text, re.S)
+    if not match:
+        return {}
+    try:
+        items = json.loads(match.group(0))
+    except ValueError:
+        return {}
+    answers = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict) or not isinstance(item.get("answer"), str):
+            continue
+        citations = item.get("citations") if isinstance(item.get("citations"), list) else []
+        answers[str(item.get("id", "")).strip()] = {
+            "answer": item["answer"].strip(),
+            "citations": [int(c) for c in citations if isinstance(c, int) or (isinstance(c, str) and c.isdigit())],
+        }
+    return answers
+
+
+def _citations(numbered, excerpt_chars=300):
+    """[(passage number, Document)] -> [{"passage", "file", "page", "excerpt"}] (pages 1-based like POST /ask)."""
+    return [
+        {"passage": n, "file": os.path.basename(doc.metadata.get("source", "")),
+         "page": doc.metadata.get("page", 0) + 1, "excerpt": doc.page_content[:excerpt_chars]}
+        for n, doc in numbered
+    ]
+
+
+def _answer(question, answer, documents, answered_by, citations=None, error=None):
+    return {
+        "question": question,
+        "answer": answer,
+        "citations": citations if citations is not None else _citations(enumerate(documents, 1)),
+        "answered_by": answered_by,
+        "error": error,
+        # Kept for the answer cache
+        "source_documents": documents,
+    }
+
+
+def _generate_group(chain, questions, contexts):
+    """One LLM call for a group: (answers by position, None for questions the reply missed; prompt tokens)."""
+    llm = chain.chain.combine_documents_chain.llm_chain.llm
+    prompt, passages, question_passages = build_batch_prompt(questions, contexts)
+    output = llm.invoke(prompt)
+    parsed = parse_batch_answers(output.content if hasattr(output, "content") else str(output))
+
+    answers = []
+    for i, (question, own) in enumerate(zip(questions, question_passages), 1):
+        reply = parsed.get(f"Q{i}")
+        if reply is None:
+            answers.append(None)
+            continue
+        cited = [n for n in dict.fromkeys(reply["citations"]) if n in own]
+        answers.append(_answer(question, reply["answer"], [passages[n - 1] for n in cited], "batch",
+                               citations=_citations((n, passages[n - 1]) for n in cited)))
+    return answers, estimate_tokens(prompt)
+
+
+def answer_batch(questions, target_pdf=None, expansion_mode=None, use_cache=True, group_size=None,
+                 context_budget=None):
+    """
+    Answers many questions for one product (None = all manuals) in a few LLM calls.
+    Returns {"answers": [...], "stats": {...}}, answers in question order:
+      {"question", "answer", "citations": [{"passage", "file", "page", "excerpt"}],
+       "answered_by": "spec_table" | "answer_cache" | "batch" | "chain", "error": None or message}
+    stats: counts per path, LLM calls, retrieval / generation seconds and questions_per_second.
+    """
+    from src.bot import get_qa_chain
+
+    start = time.perf_counter()
+    chain = get_qa_chain(target_pdf=target_pdf, expansion_mode=expansion_mode)
+    if chain is None:
+        raise RuntimeError("QA chain could not be built (missing GOOGLE_API_KEY?)")
+
+    answers = [None] * len(questions)
+    stats = {"questions": len(questions), "spec_table": 0, "answer_cache": 0, "batch": 0, "chain": 0,
+             "errors": 0, "llm_calls": 0, "prompt_tokens": 0, "passages_retrieved": 0, "passages_sent": 0}
+
+    # 1. Spec-table fast path
+    for i, question in enumerate(questions):
+        spec = chain._spec_answer(question)
+        if spec is not None:
+            answers[i] = _answer(question, spec["result"], spec["source_documents"], "spec_table")
+
+    # 2. Answer cache, with the question vectors retrieval needs anyway (one embedding batch)
+    pending = [i for i, answer in enumerate(answers) if answer is None]
+    vectors, version = {}, None
+    cache = chain.answer_cache if use_cache else None
+    if cache is not None and pending:
+        texts = list(dict.fromkeys(questions[i] for i in pending))
+        embeddings = _vector_store(_chain_retrievers(chain)[2]).embeddings
+        vectors.update(zip(texts, embeddings.embed_documents(texts)))
+        version = chain.version_fn()
+        for i in pending:
+            vector = np.asarray(vectors[questions[i]], dtype=np.float32)
+            cached, _ = cache.lookup(chain.cache_scope, questions[i], version=version,
+                                     vector=vector / (np.linalg.norm(vector) or 1.0))
+            if cached is not None:
+                answers[i] = _answer(questions[i], cached["result"], cached["source_documents"], "answer_cache")
+        pending = [i for i in pending if answers[i] is None]
+
+    # 3. Retrieval of every remaining question at once
+    retrieval_stats = {}
+    contexts = retrieve_batch(chain, [questions[i] for i in pending], vectors, retrieval_stats) if pending else []
+    stats["passages_retrieved"] = sum(len(documents) for documents in contexts)
+    retrieved = time.perf_counter()
+
+    # 4. Grouped answer generation, groups run side by side (the LLM scheduler keeps the rate limits)
+    groups = group_questions(contexts, group_size, context_budget)
+
+    def run_group(group):
+        try:
+            return _generate_group(chain, [questions[pending[j]] for j in group], [contexts[j] for j in group])
+        except Exception as e:
+            return e, 0
+
+    with ThreadPoolExecutor(max_workers=max(1, min(len(groups), LLM_MAX_CONCURRENCY))) as pool:
+        results = list(pool.map(run_group, groups))
+
+    missed = []
+    for group, (group_answers, prompt_tokens) in zip(groups, results):
+        stats["llm_calls"] += 1
+        stats["prompt_tokens"] += prompt_tokens
+        stats["passages_sent"] += len({_passage_key(doc) for j in group for doc in contexts[j]})
+        for position, j in enumerate(group):
+            i = pending[j]
+            if isinstance(group_answers, Exception):
+                # Failed after the scheduler's retries: don't hammer the API question by question
+                answers[i] = _answer(questions[i], None, [], "batch", error=str(group_answers))
+            elif group_answers[position] is None:
+                missed.append(i)
+            else:
+                answers[i] = group_answers[position]
+
+    # 5. Questions the model skipped / garbled: the regular single-question chain
+    for i in missed:
+        stats["llm_calls"] += 1
+        try:
+            response = chain.invoke({"query": questions[i]})
+            answers[i] = _answer(questions[i], response["result"], response.get("source_documents", []), "chain")
+        except Exception as e:
+            answers[i] = _answer(questions[i], None, [], "chain", error=str(e))
+    end = time.perf_counter()
+
+    for i in pending:
+        answer = answers[i]
+        if cache is not None and answer["answered_by"] == "batch" and answer["error"] is None:
+            vector = np.asarray(vectors[questions[i]], dtype=np.float32)
+            cache.store(chain.cache_scope, questions[i],
+                        {"result": answer["answer"], "source_documents": answer["source_documents"]},
+                        version=version, vector=vector / (np.linalg.norm(vector) or 1.0))
+    for answer in answers:
+        stats[answer["answered_by"]] += answer["error"] is None
+        stats["errors"] += answer["error"] is not None
+        answer.pop("source_documents")
+
+    total = end - start
+    stats.update(
+        retrieval=retrieval_stats,
+        retrieval_seconds=round(retrieved - start, 4),
+        generation_seconds=round(end - retrieved, 4),
+        total_seconds=round(total, 4),
+        questions_per_second=round(len(questions) / total, 2) if total > 0 else None,
+    )
+    return {"answers": answers, "stats": stats}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Answer many questions for one product in a few LLM calls.")
+    parser.add_argument("questions", help="Questions file: one per line (.txt) or a test set (.json / .jsonl)")
+    parser.add_argument("--product", help="Product to lock to, e.g. DM8SE (default: all manuals)")
+    parser.add_argument("--expansion", choices=["llm", "local", "none"], help="Default QUERY_EXPANSION_MODE")
+    parser.add_argument("--output", help="Write the answers + stats as JSON to this file")
+    args = parser.parse_args()
+
+    if args.questions.endswith((".json", ".jsonl")):
+        from src.evaluate import load_test_cases
+        questions = [case["question"] for case in load_test_cases([args.questions])]
+    else:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    report = answer_batch(questions, target_pdf=args.product, expansion_mode=args.expansion)
+    for answer in report["answers"]:
+        pages = ", ".join(f"{c['file']} p.{c['page']}" for c in answer["citations"])
+        print(f"Q: {answer['question']}\n   -> {answer['answer'] or answer['error']} [{answer['answered_by']}] ({pages})")
+    stats = report["stats"]
+    print(f"\n {stats['questions']} questions in {stats['total_seconds']:.2f}s ({stats['questions_per_second']} q/s), "
+          f"{stats['llm_calls']} LLM calls, {stats['spec_table']} from spec tables, {stats['errors']} errors")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f" Written to {args.output}")
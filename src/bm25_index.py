@@ -0,0 +1,286 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import threading
+import numpy as np
+from typing import Any, List
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.generations import get_db_dir
+
+BM25_DIRNAME = "bm25"
+ALL_PARTITION = "__all__"
+
+# Okapi BM25 parameters (same defaults as rank_bm25.BM25Okapi used by BM25Retriever)
+K1 = 1.5
+B = 0.75
+EPSILON = 0.25
+
+
+def tokenize(text):
+    """Same tokenizer as BM25Retriever's default preprocessing."""
+    return text.split()
+
+
+def partition_name(source):
+    """Folder-safe, collision-free partition name for a source PDF path."""
+    stem = os.path.splitext(os.path.basename(source))[0]
+    safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in stem)
+    digest = hashlib.sha1(source.encode("utf-8")).hexdigest()[:8]
+    return f"{safe}-{digest}"
+
+
+def _bm25_root(db_dir=None):
+    return os.path.join(db_dir or get_db_dir(), BM25_DIRNAME)
+
+
+def partition_exists(name, db_dir=None):
+    return os.path.exists(os.path.join(_bm25_root(db_dir), name, "meta.json"))
+
+
+def build_partition(name, ids, texts, metadatas, db_dir=None):
+    """
+    Builds one BM25 partition and writes it as flat arrays:
+      vocab.json                      -> sorted term list (term id = position)
+      term_offsets.npy                -> CSR offsets into the postings arrays (len = vocab + 1)
+      postings_doc.npy / postings_tf.npy
+      idf.npy, doc_lens.npy
+      texts.bin + text_offsets.npy    -> all chunk texts in one UTF-8 buffer
+      meta.json                       -> chunk ids, metadatas, avgdl
+    """
+    doc_tokens = [tokenize(text) for text in texts]
+    term_postings = {}
+    for doc_id, tokens in enumerate(doc_tokens):
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for term, tf in counts.items():
+            term_postings.setdefault(term, []).append((doc_id, tf))
+
+    vocab = sorted(term_postings)
+    term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    postings_doc, postings_tf = [], []
+    for term_id, term in enumerate(vocab):
+        postings = term_postings[term]
+        postings_doc.extend(doc for doc, _ in postings)
+        postings_tf.extend(tf for _, tf in postings)
+        term_offsets[term_id + 1] = term_offsets[term_id] + len(postings)
+
+    # IDF exactly like BM25Okapi (negative idf -> epsilon * average idf)
+    n_docs = len(texts)
+    doc_freqs = np.diff(term_offsets).astype(np.float64)
+    idf = np.log(n_docs - doc_freqs + 0.5) - np.log(doc_freqs + 0.5)
+    if len(idf):
+        idf = np.where(idf < 0, EPSILON * idf.mean(), idf)
+
+    doc_lens = np.array([len(tokens) for tokens in doc_tokens], dtype=np.int32)
+
+    encoded = [text.encode("utf-8") for text in texts]
+    text_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        text_offsets[1:] = np.cumsum([len(e) for e in encoded])
+
+    # Write into a temp folder, then swap it in, so readers never see half a partition
+    root = _bm25_root(db_dir)
+    final_dir = os.path.join(root, name)
+    tmp_dir = final_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    with open(os.path.join(tmp_dir, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocab, f)
+    np.save(os.path.join(tmp_dir, "term_offsets.npy"), term_offsets)
+    np.save(os.path.join(tmp_dir, "postings_doc.npy"), np.array(postings_doc, dtype=np.int32))
+    np.save(os.path.join(tmp_dir, "postings_tf.npy"), np.minimum(np.array(postings_tf, dtype=np.int64), 65535).astype(np.uint16))
+    np.save(os.path.join(tmp_dir, "idf.npy"), idf.astype(np.float32))
+    np.save(os.path.join(tmp_dir, "doc_lens.npy"), doc_lens)
+    np.save(os.path.join(tmp_dir, "text_offsets.npy"), text_offsets)
+    with open(os.path.join(tmp_dir, "texts.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "ids": list(ids),
+            "metadatas": list(metadatas),
+            "avgdl": float(doc_lens.mean()) if n_docs else 0.0,
+        }, f)
+
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(tmp_dir, final_dir)
+    _forget(final_dir)
+
+
+def delete_partition(name, db_dir=None):
+    final_dir = os.path.join(_bm25_root(db_dir), name)
+    shutil.rmtree(final_dir, ignore_errors=True)
+    _forget(final_dir)
+
+
+def read_partition_chunks(name, db_dir=None):
+    """Returns (ids, texts, metadatas) stored in a partition (used to rebuild ALL_PARTITION + the chunk store)."""
+    index = load_partition(name, db_dir)
+    with open(os.path.join(index.path, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    return meta["ids"], [index.text(i) for i in range(index.n_docs)], meta["metadatas"]
+
+
+class BM25Partition:
+    """
+    A loaded (memory-mapped) BM25 partition. Only scores documents: their texts and
+    metadata are read from the chunk store (src/chunk_store.py) for the hits.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, "vocab.json"), "r", encoding="utf-8") as f:
+            self.term_ids = {term: i for i, term in enumerate(json.load(f))}
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.n_docs = len(meta["ids"])
+        self.avgdl = meta["avgdl"]
+
+        load = lambda fname: np.load(os.path.join(path, fname), mmap_mode="r")
+        self.term_offsets = load("term_offsets.npy")
+        self.postings_doc = load("postings_doc.npy")
+        self.postings_tf = load("postings_tf.npy")
+        self.idf = load("idf.npy")
+        self.doc_lens = load("doc_lens.npy")
+        self.text_offsets = load("text_offsets.npy")
+        self._texts = np.memmap(os.path.join(path, "texts.bin"), dtype=np.uint8, mode="r") \
+            if self.text_offsets[-1] > 0 else np.zeros(0, dtype=np.uint8)
+
+    def text(self, doc_id):
+        start, end = self.text_offsets[doc_id], self.text_offsets[doc_id + 1]
+        return bytes(self._texts[start:end]).decode("utf-8")
+
+    def get_scores(self, query):
+        return self.get_scores_batch([query])[0]
+
+    def get_scores_batch(self, queries):
+        """
+        BM25 scores of many queries at once: (len(queries), n_docs). A term's postings are
+        read and weighted once for every query containing it (batch QA, src/batch_qa.py).
+        """
+        scores = np.zeros((len(queries), self.n_docs), dtype=np.float32)
+        if not self.n_docs:
+            return scores
+        norm = K1 * (1 - B + B * np.asarray(self.doc_lens, dtype=np.float32) / (self.avgdl or 1.0))
+        weighted = {}
+        for row, query in enumerate(queries):
+            for token in tokenize(query):
+                term_id = self.term_ids.get(token)
+                if term_id is None:
+                    continue
+                if term_id not in weighted:
+                    start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+                    docs = self.postings_doc[start:end]
+                    tf = self.postings_tf[start:end].astype(np.float32)
+                    weighted[term_id] = (docs, self.idf[term_id] * (tf * (K1 + 1) / (tf + norm[docs])))
+                docs, values = weighted[term_id]
+                scores[row, docs] += values
+        return scores
+
+    def top_k(self, query, k):
+        """Returns [(doc_id, score)] best first (like BM25Retriever, zero scores still fill k)."""
+        return _top_k(self.get_scores(query), k)
+
+    def top_k_batch(self, queries, k):
+        """top_k of every query, scored in one pass: [[(doc_id, score)], ...]."""
+        return [_top_k(scores, k) for scores in self.get_scores_batch(queries)]
+
+
+def _top_k(scores, k):
+    k = min(k, len(scores))
+    if k <= 0:
+        return []
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return [(int(i), float(scores[i])) for i in top]
+
+
+# Loaded partitions are shared by every retriever in the process
+_partitions = {}
+_partitions_lock = threading.Lock()
+
+
+def _forget(path):
+    with _partitions_lock:
+        _partitions.pop(path, None)
+
+
+def load_partition(name, db_dir=None):
+    """Lazily loads (and memoizes) a partition. Raises FileNotFoundError if it was never built."""
+    path = os.path.join(_bm25_root(db_dir), name)
+    with _partitions_lock:
+        if path not in _partitions:
+            if not os.path.exists(os.path.join(path, "meta.json")):
+                raise FileNotFoundError(f"BM25 partition not found: {path}")
+            _partitions[path] = BM25Partition(path)
+        return _partitions[path]
+
+
+class PersistedBM25Retriever(BaseRetriever):
+    """Sparse retriever over a prebuilt, memory-mapped BM25 partition."""
+
+    partition: Any
+    # Chunk store of the same index generation: Documents are only built for the k hits
+    chunks: Any
+    k: int = 4
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        first = self.chunks.first_row(self.partition.name)
+        return [self.chunks.document(first + i) for i, _ in self.partition.top_k(query, self.k)]
+
+
+class PartitionedBM25Retriever(BaseRetriever):
+    """
+    Sparse retriever over several partitions (the manuals picked by the product router):
+    each partition is scored on its own and the best k chunks across them are kept.
+    """
+
+    partitions: List[Any]
+    chunks: Any
+    k: int = 4
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        hits = [
+            (score, self.chunks.first_row(partition.name) + i)
+            for partition in self.partitions for i, score in partition.top_k(query, self.k)
+        ]
+        hits.sort(key=lambda hit: -hit[0])
+        return [self.chunks.document(row) for _, row in hits[:self.k]]
+
+
+def update_bm25_index(vector_store, sources, removed=(), db_dir=None):
+    """
+    Rebuilds the BM25 partitions of `sources` from the chunks stored in the vector store,
+    drops partitions of `removed` sources and refreshes ALL_PARTITION.
+    """
+    for source in removed:
+        delete_partition(partition_name(source), db_dir)
+
+    for source in sources:
+        raw = vector_store.get(where={"source": source})
+        build_partition(partition_name(source), raw["ids"], raw["documents"], raw["metadatas"], db_dir)
+        print(f"   - BM25 partition built for {os.path.basename(source)} ({len(raw['ids'])} chunks)")
+
+
+def rebuild_all_partition(sources, db_dir=None):
+    """Concatenates every per-source partition into ALL_PARTITION (used by unfiltered search)."""
+    ids, texts, metadatas = [], [], []
+    for source in sources:
+        name = partition_name(source)
+        if not partition_exists(name, db_dir):
+            continue
+        p_ids, p_texts, p_metas = read_partition_chunks(name, db_dir)
+        ids.extend(p_ids)
+        texts.extend(p_texts)
+        metadatas.extend(p_metas)
+    build_partition(ALL_PARTITION, ids, texts, metadatas, db_dir)
+    print(f"   - BM25 partition built for all sources ({len(ids)} chunks)")
@@ -1,40 +1,111 @@
 import os
 import sys
+import time
 import logging
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.chains import RetrievalQA
-from langchain.prompts import PromptTemplate
-from langchain.retrievers.multi_query import MultiQueryRetriever # <--- Re-adding this
+import threading
+from collections import OrderedDict
 
 # --- PATH FIX ---
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 
-from src.config import GOOGLE_API_KEY, LLM_MODEL_NAME
-from src.vector_store import get_retriever
+from src.config import (
+    DB_DIR, GOOGLE_API_KEY, LLM_BACKEND, QA_CHAIN_CACHE_SIZE, QA_CHAIN_WARM_PRODUCTS, ANSWER_CACHE_ENABLED,
+    QUERY_EXPANSION_MODE, SPEC_FASTPATH_ENABLED, CONTEXT_PACKING_ENABLED, INDEX_WATCH_SECONDS
+)
+# NOTE: langchain, the vector store and the embedding model are imported / loaded
+# on first use (_build_qa_chain, get_answer_cache), so importing this module is
+# cheap and app.py can render the product-selection screen right away.
 
 # Suppress logs
 logging.getLogger("langchain.retrievers.multi_query").setLevel(logging.INFO)
 
-def get_qa_chain(target_pdf=None):
-    if not GOOGLE_API_KEY:
+# --- CHAIN CACHE (process-wide, LRU) ---
+_chain_cache = OrderedDict()
+_chain_cache_lock = threading.Lock()
+_build_locks = {}
+_chain_stats = {"hits": 0, "misses": 0, "evictions": 0, "build_seconds": 0.0}
+_chain_build_seconds = {}
+
+# --- BACKGROUND WARM-UP (once per process, see start_background_warmup) ---
+_warmup_thread = None
+_warmup_lock = threading.Lock()
+_warmup = {"state": "idle", "products": [], "seconds": None, "error": None}
+
+# --- INDEX HOT-RELOAD (see start_index_watcher / reload_index) ---
+_watcher_thread = None
+_reload_lock = threading.Lock()
+_reload = {"reloads": 0, "seconds": None, "failed": None, "error": None}
+
+# --- ANSWER CACHE (process-wide, shared by every product chain) ---
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+def get_answer_cache():
+    """Returns the shared semantic answer cache (None if ANSWER_CACHE_ENABLED is off)."""
+    global _answer_cache
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                from src.answer_cache import SemanticAnswerCache
+                from src.resources import get_embeddings
+                _answer_cache = SemanticAnswerCache(embed_fn=get_embeddings().embed_query)
+    return _answer_cache
+
+def _build_qa_chain(target_pdf=None, expansion_mode=QUERY_EXPANSION_MODE):
+    if LLM_BACKEND == "gemini" and not GOOGLE_API_KEY:
         print("❌ ERROR: Missing API Key")
         return None
 
-    llm = ChatGoogleGenerativeAI(
-        model=LLM_MODEL_NAME,
-        google_api_key=GOOGLE_API_KEY,
-        temperature=0.5
-    )
+    from langchain.chains import RetrievalQA
+    from langchain.prompts import PromptTemplate
+    from src.llm import get_llm
+    from src.llm_scheduler import get_scheduler
+    from src.vector_store import get_retriever, _find_matching_path
+    from src.manifest import index_version
+    from src.qa_chain import ProductQAChain
+    from src.query_expansion import BudgetedMultiQueryRetriever, LocalQueryExpansionRetriever, get_expansion_table
+    from src.spec_index import answer_from_specs
+    from src.context_packing import ContextPackingRetriever
+    from src.generations import get_db_dir
+
+    # Every index the chain reads comes from one generation, even after a newer one is swapped in
+    db_dir = get_db_dir()
+
+    # Same model, two priorities: query generation yields to answers in the LLM scheduler
+    llm = get_llm(temperature=0.5, priority="answer")
 
     # 1. Get the FILTERED retriever (Locks to the correct PDF)
     base_retriever = get_retriever(target_pdf_name=target_pdf)
+    source = _find_matching_path(target_pdf) if target_pdf else None
 
-    # 2. MULTI-QUERY RETRIEVER
-    advanced_retriever = MultiQueryRetriever.from_llm(
-        retriever=base_retriever,
-        llm=llm
-    )
+    # 2. QUERY EXPANSION (acronyms like AEC, NC, SPL)
+    if expansion_mode == "llm":
+        # Multi-query: Gemini writes query variants (one extra LLM round trip);
+        # falls back to the local table when the rate-limit budget is tight
+        advanced_retriever = BudgetedMultiQueryRetriever.from_llm(
+            retriever=base_retriever,
+            llm=get_llm(temperature=0.5, priority="expansion"),
+            table=get_expansion_table(source),
+            scheduler=get_scheduler()
+        )
+    elif expansion_mode == "local":
+        # Acronym/synonym table mined from the manuals at index time
+        advanced_retriever = LocalQueryExpansionRetriever(
+            retriever=base_retriever,
+            table=get_expansion_table(source)
+        )
+    elif expansion_mode == "none":
+        advanced_retriever = base_retriever
+    else:
+        raise ValueError(f"Unknown query expansion mode: {expansion_mode!r} (use llm, local or none)")
+
+    # Expanded queries return overlapping chunks (200-char splitter overlap, several variants):
+    # merge / dedupe them and keep the prompt within CONTEXT_TOKEN_BUDGET
+    if CONTEXT_PACKING_ENABLED:
+        advanced_retriever = ContextPackingRetriever(retriever=advanced_retriever)
 
     # 3. The Prompt (Slightly relaxed to allow acronym inference)
     custom_prompt_template = """You are a technical assistant for Bose Professional products.
@@ -65,5 +136,200 @@ def get_qa_chain(target_pdf=None):
         return_source_documents=True,
         chain_type_kwargs={"prompt": PROMPT}
     )
-    
-    return qa_chain
\ No newline at end of file
+
+    # Cached answers are tied to the indexed version of the locked PDF (or of the whole index).
+    # Spec lookups with a confident match in the extracted tables skip retrieval + LLM entirely.
+    return ProductQAChain(
+        qa_chain,
+        product=target_pdf,
+        expansion_mode=expansion_mode,
+        answer_cache=get_answer_cache(),
+        version_fn=lambda: index_version(source, db_dir),
+        spec_lookup=(lambda query: answer_from_specs(query, source, db_dir)) if SPEC_FASTPATH_ENABLED else None
+    )
+
+def get_qa_chain(target_pdf=None, expansion_mode=None):
+    """
+    Returns the QA chain for a product (None = all manuals).
+    expansion_mode: "llm", "local" or "none" (default QUERY_EXPANSION_MODE).
+    Built chains are shared across sessions and kept in an LRU cache of
+    QA_CHAIN_CACHE_SIZE entries, so switching back to a product is instant.
+    Ask again per question: after an index reload the cache holds the new generation's chain.
+    """
+    from src.generations import get_db_dir
+
+    expansion_mode = expansion_mode or QUERY_EXPANSION_MODE
+    key = (target_pdf or "", expansion_mode)
+
+    with _chain_cache_lock:
+        if key in _chain_cache:
+            _chain_cache.move_to_end(key)
+            _chain_stats["hits"] += 1
+            return _chain_cache[key]
+        build_lock = _build_locks.setdefault(key, threading.Lock())
+
+    # One build per product at a time; concurrent callers wait for it instead of building twice
+    with build_lock:
+        with _chain_cache_lock:
+            if key in _chain_cache:
+                _chain_cache.move_to_end(key)
+                _chain_stats["hits"] += 1
+                return _chain_cache[key]
+
+        db_dir = get_db_dir()
+        start_time = time.time()
+        qa_chain = _build_qa_chain(target_pdf, expansion_mode)
+        build_seconds = time.time() - start_time
+
+        with _chain_cache_lock:
+            _chain_stats["misses"] += 1
+            _chain_stats["build_seconds"] += build_seconds
+            _chain_build_seconds[f"{target_pdf or 'all'} ({expansion_mode})"] = round(build_seconds, 3)
+            # A chain built while reload_index swapped generations is served once, not cached
+            if qa_chain is not None and db_dir == get_db_dir():
+                _chain_cache[key] = qa_chain
+                while len(_chain_cache) > QA_CHAIN_CACHE_SIZE:
+                    _chain_cache.popitem(last=False)
+                    _chain_stats["evictions"] += 1
+
+    print(f" Built QA chain for '{target_pdf or 'all manuals'}' in {build_seconds:.2f}s")
+    return qa_chain
+
+def warm_qa_chains(products=None, expansion_mode=None):
+    """Builds (and caches) the chains of the given products, default QA_CHAIN_WARM_PRODUCTS."""
+    for product in (QA_CHAIN_WARM_PRODUCTS if products is None else products):
+        get_qa_chain(target_pdf=product, expansion_mode=expansion_mode)
+
+def _run_warmup(products, expansion_mode):
+    start_time = time.perf_counter()
+    _warmup["state"] = "running"
+    try:
+        from src.resources import get_vector_store
+        get_vector_store()
+        warm_qa_chains(products, expansion_mode)
+        _warmup["state"] = "done"
+    except Exception as e:
+        _warmup["state"], _warmup["error"] = "failed", str(e)
+        print(f"❌ Background warm-up failed: {e}")
+    _warmup["seconds"] = round(time.perf_counter() - start_time, 3)
+
+def start_background_warmup(products=None, expansion_mode=None):
+    """
+    Loads the model / indexes and builds the chains of `products` (default
+    QA_CHAIN_WARM_PRODUCTS) in a daemon thread; only the first call per process starts it.
+    A get_qa_chain call for a chain being warmed waits for that build instead of repeating it.
+    """
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is None:
+            products = list(QA_CHAIN_WARM_PRODUCTS if products is None else products)
+            _warmup["products"] = products
+            _warmup_thread = threading.Thread(
+                target=_run_warmup, args=(products, expansion_mode), name="qa-warmup", daemon=True
+            )
+            _warmup_thread.start()
+    return _warmup_thread
+
+def startup_report():
+    """Startup timings of this process: imports, model / store loading, chain builds, warm-up."""
+    from src.resources import load_timings
+
+    heavy = ["langchain", "langchain_chroma", "chromadb", "sentence_transformers", "langchain_google_genai"]
+    with _chain_cache_lock:
+        chains = dict(_chain_build_seconds)
+    return {
+        "imported": {module: module in sys.modules for module in heavy},
+        "resources": dict(load_timings),
+        "chains": chains,
+        "warmup": dict(_warmup),
+        "index": index_status(),
+    }
+
+def chain_cache_stats():
+    """Hit/miss/eviction counters and total build time of the chain cache."""
+    with _chain_cache_lock:
+        stats = dict(_chain_stats)
+        stats["size"] = len(_chain_cache)
+        stats["products"] = [f"{product or 'all'} ({mode})" for product, mode in _chain_cache]
+    return stats
+
+def clear_chain_cache():
+    """Drops every cached chain (e.g. after the index was rebuilt)."""
+    with _chain_cache_lock:
+        _chain_cache.clear()
+
+def reload_index(generation=None):
+    """
+    Swaps the published index generation (default) into this process without a restart:
+    opens its store and rebuilds the cached chains against it while the current ones keep
+    serving, then replaces the chain cache in one step. Queries already running finish on
+    the chain (and generation) they started with. Returns False if it was already served.
+    """
+    from src.generations import active_generation, current_generation, generation_dir, set_active, using
+    from src.resources import get_vector_store, release_vector_store
+
+    with _reload_lock:
+        generation = generation or current_generation()
+        previous = active_generation()
+        if generation is None or generation == previous:
+            return False
+
+        start_time = time.perf_counter()
+        with _chain_cache_lock:
+            keys = list(_chain_cache) or [(product, QUERY_EXPANSION_MODE) for product in QA_CHAIN_WARM_PRODUCTS]
+        warmed = OrderedDict()
+        with using(generation):
+            # First query against a store pays for loading its index (HNSW / memory-mapped blocks)
+            get_vector_store().similarity_search("warm-up", k=1)
+            for product, mode in keys:
+                qa_chain = _build_qa_chain(product or None, mode)
+                if qa_chain is not None:
+                    warmed[(product or "", mode)] = qa_chain
+
+        with _chain_cache_lock:
+            set_active(generation)
+            _chain_cache.clear()
+            _chain_cache.update(warmed)
+        release_vector_store(generation_dir(previous) if previous else DB_DIR)
+
+        seconds = round(time.perf_counter() - start_time, 3)
+        _reload.update(reloads=_reload["reloads"] + 1, seconds=seconds, failed=None, error=None)
+        print(f" Swapped in index generation {generation} ({len(warmed)} chains warmed in {seconds:.2f}s)")
+        return True
+
+def _watch_index(interval):
+    from src.generations import current_generation
+
+    while True:
+        time.sleep(interval)
+        generation = current_generation()
+        if generation is None or generation == _reload["failed"]:
+            continue
+        try:
+            reload_index(generation)
+        except Exception as e:
+            # Not retried until yet another generation is published
+            _reload.update(failed=generation, error=str(e))
+            print(f"❌ Could not swap in index generation {generation}: {e}")
+
+def start_index_watcher(interval=INDEX_WATCH_SECONDS):
+    """
+    Polls for a newly published index generation every `interval` seconds in a daemon
+    thread and swaps it in (reload_index); only the first call per process starts it.
+    Returns None when disabled (interval <= 0).
+    """
+    global _watcher_thread
+    if interval <= 0:
+        return None
+    with _reload_lock:
+        if _watcher_thread is None:
+            _watcher_thread = threading.Thread(target=_watch_index, args=(interval,), name="index-watcher", daemon=True)
+            _watcher_thread.start()
+    return _watcher_thread
+
+def index_status():
+    """Generation this process serves vs. the published one, plus reload counters."""
+    from src.generations import active_generation, current_generation
+
+    return dict(_reload, serving=active_generation(), published=current_generation(),
+                watching=_watcher_thread is not None)
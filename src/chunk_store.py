@@ -0,0 +1,212 @@
+import os
+import sys
+import json
+import mmap
+import shutil
+import threading
+import numpy as np
+from langchain_core.documents import Document
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.generations import get_db_dir
+from src.bm25_index import ALL_PARTITION, partition_exists, partition_name, read_partition_chunks
+
+# Chunk store: every chunk of an index generation, once, in flat memory-mapped arrays.
+# BM25 partitions and dense blocks only score chunk rows; a Document is built from the
+# store for the hits a retriever returns, so nothing per chunk stays on the Python heap:
+#   chunks/texts.bin + text_offsets.npy  -> all chunk texts in one UTF-8 buffer
+#   chunks/ids.npy + id_order.npy        -> chunk ids (fixed-width bytes) and their sort order
+#   chunks/metadata.npy                  -> int64 matrix, one column per metadata key: the value
+#                                           for integer keys (page, start_index), else a code into
+#                                           the key's table of distinct values (source paths, sections)
+#   chunks/store.json                    -> keys, value tables, row range of every BM25 partition
+# Rows are the per-source BM25 partitions concatenated in manifest order, i.e. the rows of
+# ALL_PARTITION: document i of partition p is row ranges[p][0] + i.
+CHUNKS_DIRNAME = "chunks"
+# Column value of a chunk without that key
+MISSING = np.iinfo(np.int64).min
+
+
+def _store_dir(db_dir=None):
+    return os.path.join(db_dir or get_db_dir(), CHUNKS_DIRNAME)
+
+
+def chunk_store_exists(db_dir=None):
+    return os.path.exists(os.path.join(_store_dir(db_dir), "store.json"))
+
+
+def _encode_column(values):
+    """Metadata values of one key (None = absent) -> ({"kind", ["values"]}, int64 column)."""
+    present = [v for v in values if v is not None]
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in present):
+        return {"kind": "int"}, np.array([MISSING if v is None else v for v in values], dtype=np.int64)
+    table, codes = [], {}
+    column = np.full(len(values), MISSING, dtype=np.int64)
+    for row, value in enumerate(values):
+        if value is None:
+            continue
+        key = json.dumps(value, sort_keys=True)
+        if key not in codes:
+            codes[key] = len(table)
+            table.append(value)
+        column[row] = codes[key]
+    return {"kind": "value", "values": table}, column
+
+
+def update_chunk_store(sources, db_dir=None):
+    """
+    Rewrites the chunk store from the per-source BM25 partitions of `sources` (same
+    order as rebuild_all_partition, so ALL_PARTITION's document i is row i).
+    """
+    ids, texts, metadatas, ranges = [], [], [], {}
+    for source in sources:
+        name = partition_name(source)
+        if not partition_exists(name, db_dir):
+            continue
+        p_ids, p_texts, p_metas = read_partition_chunks(name, db_dir)
+        ranges[name] = [len(ids), len(ids) + len(p_ids)]
+        ids.extend(p_ids)
+        texts.extend(p_texts)
+        metadatas.extend(p_metas)
+    ranges[ALL_PARTITION] = [0, len(ids)]
+
+    keys = []
+    for metadata in metadatas:
+        keys.extend(key for key in metadata if key not in keys)
+
+    encoded = [text.encode("utf-8") for text in texts]
+    text_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        text_offsets[1:] = np.cumsum([len(e) for e in encoded])
+    id_array = np.array(ids, dtype="S") if ids else np.zeros(0, dtype="S1")
+
+    # Write into a temp folder, then swap it in (same as the BM25 partitions)
+    final_dir = _store_dir(db_dir)
+    tmp_dir = final_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    columns, matrix = [], np.empty((len(ids), len(keys)), dtype=np.int64)
+    for i, key in enumerate(keys):
+        column, matrix[:, i] = _encode_column([metadata.get(key) for metadata in metadatas])
+        columns.append(dict(column, key=key))
+    np.save(os.path.join(tmp_dir, "metadata.npy"), matrix)
+    with open(os.path.join(tmp_dir, "texts.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+    np.save(os.path.join(tmp_dir, "text_offsets.npy"), text_offsets)
+    np.save(os.path.join(tmp_dir, "ids.npy"), id_array)
+    np.save(os.path.join(tmp_dir, "id_order.npy"), np.argsort(id_array, kind="stable").astype(np.int32))
+    with open(os.path.join(tmp_dir, "store.json"), "w", encoding="utf-8") as f:
+        json.dump({"n_chunks": len(ids), "columns": columns, "ranges": ranges}, f, ensure_ascii=False)
+
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(tmp_dir, final_dir)
+    _forget(final_dir)
+    print(f"   - Chunk store built ({len(ids)} chunks, {int(text_offsets[-1])} text bytes)")
+
+
+class ChunkStore:
+    """A loaded (memory-mapped) chunk store. Only the distinct metadata values live on the heap."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "store.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.n_chunks = meta["n_chunks"]
+        self.ranges = {name: tuple(bounds) for name, bounds in meta["ranges"].items()}
+        # Source paths, sections, ... exist once; every Document's metadata references them
+        self.columns = [(column["key"], column.get("values")) for column in meta["columns"]]
+
+        # Plain ndarray views of the mappings: np.memmap indexing costs microseconds per hit
+        load = lambda fname: np.asarray(np.load(os.path.join(path, fname), mmap_mode="r" if self.n_chunks else None))
+        self.text_offsets = load("text_offsets.npy")
+        self.ids = load("ids.npy")
+        self.id_order = load("id_order.npy")
+        self.metadata_matrix = load("metadata.npy")
+        self._texts = b""
+        if self.text_offsets[-1] > 0:
+            with open(os.path.join(path, "texts.bin"), "rb") as f:
+                self._texts = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def first_row(self, partition):
+        """Row of document 0 of a BM25 partition. KeyError if the partition is not in the store."""
+        return self.ranges[partition][0]
+
+    def text(self, row):
+        start, end = self.text_offsets[row:row + 2].tolist()
+        return self._texts[start:end].decode("utf-8")
+
+    def metadata(self, row):
+        metadata = {}
+        for (key, table), value in zip(self.columns, self.metadata_matrix[row].tolist()):
+            if value != MISSING:
+                metadata[key] = value if table is None else table[value]
+        return metadata
+
+    def document(self, row):
+        return Document(page_content=self.text(row), metadata=self.metadata(row))
+
+    def rows_of(self, ids):
+        """Rows of chunk ids (str or bytes), -1 for ids that are not in the store."""
+        # Own width: an id longer than every stored one must not be truncated into a match
+        wanted = np.array([i.encode("utf-8") if isinstance(i, str) else i for i in ids], dtype="S") \
+            if len(ids) else np.zeros(0, dtype="S1")
+        if not self.n_chunks:
+            return np.full(len(wanted), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.ids, wanted, sorter=self.id_order), self.n_chunks - 1)
+        rows = self.id_order[positions].astype(np.int64)
+        return np.where(self.ids[rows] == wanted, rows, -1)
+
+
+# Loaded stores are shared by every retriever in the process (one per generation folder)
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def _forget(path):
+    with _stores_lock:
+        _stores.pop(path, None)
+
+
+def load_chunk_store(db_dir=None):
+    """Lazily loads (and memoizes) the chunk store. Raises FileNotFoundError if it was never built."""
+    path = _store_dir(db_dir)
+    with _stores_lock:
+        if path not in _stores:
+            if not os.path.exists(os.path.join(path, "store.json")):
+                raise FileNotFoundError(f"Chunk store not found: {path}")
+            _stores[path] = ChunkStore(path)
+        return _stores[path]
+
+
+# --- UNIT TEST ---
+if __name__ == "__main__":
+    import tempfile
+    from src.bm25_index import build_partition
+
+    db_dir = tempfile.mkdtemp()
+    sources = ["/data/a.pdf", "/data/b.pdf"]
+    chunks = {
+        "/data/a.pdf": [("a1", "Net Weight 3.6 kg", {"source": "/data/a.pdf", "page": 0, "start_index": 0}),
+                        ("a2", "IP55 rated", {"source": "/data/a.pdf", "page": 1, "start_index": 12,
+                                              "section": "ENVIRONMENTAL"})],
+        "/data/b.pdf": [("b1", "Tail length 200 ms — AEC", {"source": "/data/b.pdf", "page": 0})],
+    }
+    for source in sources:
+        ids, texts, metadatas = zip(*chunks[source])
+        build_partition(partition_name(source), ids, texts, metadatas, db_dir)
+    update_chunk_store(sources, db_dir)
+
+    store = load_chunk_store(db_dir)
+    expected = [chunk for source in sources for chunk in chunks[source]]
+    for row, (cid, text, metadata) in enumerate(expected):
+        document = store.document(row)
+        assert document.page_content == text and document.metadata == metadata, (row, document)
+    assert store.first_row(partition_name("/data/b.pdf")) == 2
+    assert list(store.rows_of(["b1", "a1", "zz", "a1-1"])) == [2, 0, -1, -1]
+    # Source paths are shared, not copied per chunk
+    assert store.metadata(0)["source"] is store.metadata(1)["source"]
+    shutil.rmtree(db_dir)
+    print("✅ Chunk store OK")
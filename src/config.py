@@ -4,18 +4,158 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
-# FOLDER PATHS
+# FOLDER PATHS (BOSE_* env vars let benchmarks point the pipeline at a scratch corpus)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DATA_DIR = os.path.join(BASE_DIR, "data")
-DB_DIR = os.path.join(BASE_DIR, "chroma_db")
+DATA_DIR = os.getenv("BOSE_DATA_DIR", os.path.join(BASE_DIR, "data"))
+DB_DIR = os.getenv("BOSE_DB_DIR", os.path.join(BASE_DIR, "chroma_db"))
+EVAL_DIR = os.path.join(BASE_DIR, "data", "eval")
+# Lives outside DB_DIR on purpose: survives full resets and chunking experiments
+EMBED_CACHE_DIR = os.getenv("BOSE_EMBED_CACHE_DIR", os.path.join(BASE_DIR, "embedding_cache"))
+# Parsed PDF pages keyed by file hash, so re-chunking skips PDF parsing (off unless set; chunk_sweep.py sets it)
+PAGE_CACHE_DIR = os.getenv("BOSE_PAGE_CACHE_DIR", "")
 
 # API KEYS (Securely loaded)
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-if not GOOGLE_API_KEY:
+# "gemini" (default), "stub": a deterministic offline LLM for tests / CI, or "stub-http":
+# the same stub behind a rate-limited local HTTP server (benchmarks/stub_llm_server.py)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+# Simulated round-trip time of the stub LLM (load tests / concurrency experiments)
+STUB_LLM_LATENCY_MS = float(os.getenv("STUB_LLM_LATENCY_MS", "0"))
+STUB_LLM_URL = os.getenv("STUB_LLM_URL", "http://127.0.0.1:8790")
+
+if LLM_BACKEND == "gemini" and not GOOGLE_API_KEY:
     raise ValueError("❌ GOOGLE_API_KEY not found. Please set it in your .env file.")
 
 # MODEL SETTINGS
 # We chose this because it's the fastest and has the best free-tier limits
 LLM_MODEL_NAME = "gemini-2.0-flash" 
-EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
\ No newline at end of file
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# "torch" (HuggingFaceEmbeddings) or "onnx": int8-quantized ONNX export of the same model,
+# several times faster on CPU. Export once with: python src/onnx_embeddings.py --export --validate
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(BASE_DIR, "models", "all-MiniLM-L6-v2-onnx"))
+# Minimum cosine similarity between ONNX and PyTorch vectors accepted by --validate
+ONNX_MIN_COSINE = float(os.getenv("ONNX_MIN_COSINE", "0.98"))
+
+# Dense vector store: "chroma" (ChromaDB, HNSW) or "numpy" (exact search over
+# memory-mapped float16 blocks per PDF, no client/SQLite overhead; fine for a few 100k chunks)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+
+# INGESTION SETTINGS
+# Worker processes used to parse PDFs (0 = one per CPU core)
+LOADER_WORKERS = int(os.getenv("LOADER_WORKERS", "0"))
+# "fixed": CHUNK_SIZE-character windows with CHUNK_OVERLAP overlap, or "structure": whole lines
+# packed up to CHUNK_SIZE, cut at headings, never through a spec-table row or across pages,
+# no overlap (fewer chunks, with "section" metadata). Changing any of the three re-chunks every
+# PDF on the next ingestion (compare settings with benchmarks/chunk_sweep.py)
+CHUNKING_MODE = os.getenv("CHUNKING_MODE", "fixed")
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+# Chunks embedded + written to the vector store per batch (keeps ingestion memory flat)
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+# Chunks sent to the embedding model per call when filling cache misses
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# float16 halves the cache size; all-MiniLM vectors are unit-length so the loss is negligible
+EMBED_CACHE_DTYPE = os.getenv("EMBED_CACHE_DTYPE", "float16")
+
+# SERVING SETTINGS
+# Fully built QA chains kept in memory (LRU), shared by every session in the process
+QA_CHAIN_CACHE_SIZE = int(os.getenv("QA_CHAIN_CACHE_SIZE", "8"))
+# Products whose chains are built at startup (comma separated, empty = none)
+QA_CHAIN_WARM_PRODUCTS = [p.strip() for p in os.getenv("QA_CHAIN_WARM_PRODUCTS", "DM8SE,EX-1280C").split(",") if p.strip()]
+# app.py: build the warm chains in a background thread while the product-selection screen renders
+# (0 = build only the selected product's chain, on selection)
+BACKGROUND_WARMUP = os.getenv("BACKGROUND_WARMUP", "1") == "1"
+# Seconds between checks for a newly published index generation (src/generations.py);
+# a new one is warmed and swapped in without a restart (0 = keep serving the startup index)
+INDEX_WATCH_SECONDS = float(os.getenv("INDEX_WATCH_SECONDS", "5"))
+# Index generations kept on disk after an ingestion, the published one included
+# (the previous one serves queries still in flight while processes swap)
+INDEX_GENERATIONS_KEEP = int(os.getenv("INDEX_GENERATIONS_KEEP", "2"))
+
+# HTTP SERVICE (server.py)
+# Questions answered at the same time (retrieval + LLM); the rest wait in line
+SERVER_MAX_CONCURRENCY = int(os.getenv("SERVER_MAX_CONCURRENCY", "8"))
+# Waiting questions beyond this are rejected with 503 (back-pressure for callers)
+SERVER_MAX_QUEUE = int(os.getenv("SERVER_MAX_QUEUE", "64"))
+# Seconds one answer may take before the request fails with 504
+SERVER_REQUEST_TIMEOUT = float(os.getenv("SERVER_REQUEST_TIMEOUT", "60"))
+
+# PRODUCT ROUTER (src/product_router.py): a question without a locked product only searches
+# the ROUTER_TOP_N manuals whose centroid / model-number keywords match it best
+PRODUCT_ROUTER_ENABLED = os.getenv("PRODUCT_ROUTER_ENABLED", "1") == "1"
+ROUTER_TOP_N = int(os.getenv("ROUTER_TOP_N", "3"))
+# Score added for a model number named in the question (cosine similarities are <= 1)
+ROUTER_KEYWORD_BOOST = float(os.getenv("ROUTER_KEYWORD_BOOST", "1.0"))
+# Manuals scoring this far below the best one are not searched (a named model number wins alone)
+ROUTER_MARGIN = float(os.getenv("ROUTER_MARGIN", "0.5"))
+
+# LLM SCHEDULER (src/llm_scheduler.py): every Gemini call goes through one process-wide
+# rate limiter with retries; defaults match the gemini-2.0-flash free tier
+LLM_SCHEDULER_ENABLED = os.getenv("LLM_SCHEDULER_ENABLED", "1") == "1"
+# Requests / tokens per minute allowed by the API key, and the request burst (0 = LLM_RPM)
+LLM_RPM = float(os.getenv("LLM_RPM", "15"))
+LLM_TPM = float(os.getenv("LLM_TPM", "1000000"))
+LLM_BURST = float(os.getenv("LLM_BURST", "0"))
+# LLM calls in flight at once (the rest wait in line, answers before query generation)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+# Retries of 429 / 5xx / timeouts, with full-jitter exponential backoff (seconds)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+# Seconds an answer / a query-generation call may wait for budget before giving up
+LLM_ANSWER_MAX_WAIT = float(os.getenv("LLM_ANSWER_MAX_WAIT", "30"))
+LLM_EXPANSION_MAX_WAIT = float(os.getenv("LLM_EXPANSION_MAX_WAIT", "1.0"))
+# Output tokens reserved per call until the real usage is known
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "256"))
+# Share of the request bucket kept for answers: below it, "llm" expansion falls back to "local"
+LLM_EXPANSION_RESERVE = float(os.getenv("LLM_EXPANSION_RESERVE", "0.2"))
+
+# QUERY EXPANSION before retrieval:
+#   "llm"   -> MultiQueryRetriever (extra Gemini round trip)
+#   "local" -> acronym/synonym table mined from the manuals at index time (microseconds)
+#   "none"  -> search the question as typed
+QUERY_EXPANSION_MODE = os.getenv("QUERY_EXPANSION_MODE", "llm")
+
+# CONTEXT PACKING for the "stuff" prompt: overlapping chunks of a page are merged,
+# near-duplicates dropped and passages packed by rank up to a token budget
+CONTEXT_PACKING_ENABLED = os.getenv("CONTEXT_PACKING_ENABLED", "1") == "1"
+# Estimated context tokens per prompt (0 = no limit)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+# Share of a passage's word 5-grams already present in a better passage to count as duplicate
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+
+# BATCH QA (src/batch_qa.py, POST /ask/batch): many questions for one product answered together,
+# retrieval vectorized across them and several questions per LLM call (JSON answers with citations)
+# Questions answered per LLM call
+BATCH_QA_GROUP_SIZE = int(os.getenv("BATCH_QA_GROUP_SIZE", "8"))
+# Estimated context tokens per grouped call; passages shared by its questions count once (0 = no limit)
+BATCH_QA_CONTEXT_BUDGET = int(os.getenv("BATCH_QA_CONTEXT_BUDGET", "8000"))
+# Questions accepted per POST /ask/batch request
+BATCH_QA_MAX_QUESTIONS = int(os.getenv("BATCH_QA_MAX_QUESTIONS", "100"))
+
+# SPEC FAST PATH: key/value rows of the spec tables are extracted at ingestion;
+# a question that clearly asks for one row is answered from it (no retrieval, no LLM)
+SPEC_FASTPATH_ENABLED = os.getenv("SPEC_FASTPATH_ENABLED", "1") == "1"
+# Share of the row label's words that must appear in the question
+SPEC_MIN_COVERAGE = float(os.getenv("SPEC_MIN_COVERAGE", "0.6"))
+# Score lead the best row needs over the runner-up (ambiguous -> full RAG chain)
+SPEC_MIN_MARGIN = float(os.getenv("SPEC_MIN_MARGIN", "0.5"))
+# Share of the question's words the row must account for (words other rows use count against it)
+SPEC_MIN_QUERY_SHARE = float(os.getenv("SPEC_MIN_QUERY_SHARE", "0.65"))
+
+# ANSWER CACHE (semantic, per product)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+# Cosine similarity between query embeddings needed to reuse an answer
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512"))
+
+# TRACING (src/tracing.py): per-stage spans of every answer (retrieval, query generation,
+# dense / BM25 search, fusion, packing, LLM call) with document and token counts
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") == "1"
+# JSON-lines log of every trace ("" = off)
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", "")
+# Prometheus text file rewritten after every answer ("" = off), e.g. for node_exporter's textfile collector
+METRICS_PROM_PATH = os.getenv("METRICS_PROM_PATH", "")
@@ -0,0 +1,228 @@
+import os
+import sys
+import re
+import time
+from typing import Any, List
+from langchain_core.callbacks.manager import adispatch_custom_event, dispatch_custom_event
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.config import CONTEXT_TOKEN_BUDGET, CONTEXT_DEDUP_THRESHOLD
+
+# Gemini counts roughly 4 characters per token for English text; good enough for budgeting
+CHARS_PER_TOKEN = 4
+# Chunks of one page whose spans are at most this many characters apart count as adjacent
+ADJACENT_GAP = 2
+# Without start offsets, the longest chunk overlap searched for (splitter overlap is 200)
+MAX_OVERLAP_SEARCH = 400
+MIN_OVERLAP = 20
+SHINGLE_SIZE = 5
+
+
+def estimate_tokens(text):
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _span(doc):
+    start = doc.metadata.get("start_index")
+    if start is None or start < 0:
+        return None
+    return start, start + len(doc.page_content)
+
+
+def _text_overlap(left, right):
+    """Length of the longest suffix of `left` that is a prefix of `right` (0 if < MIN_OVERLAP)."""
+    for size in range(min(len(left), len(right), MAX_OVERLAP_SEARCH), MIN_OVERLAP - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _merge_page(items):
+    """
+    Merges overlapping / adjacent chunks of one page. items: [(rank, doc)].
+    Uses the splitter's start_index when every chunk has one, otherwise text overlap.
+    Returns [(best_rank, doc, n_chunks)].
+    """
+    if all(_span(doc) for _, doc in items):
+        items = sorted(items, key=lambda item: _span(item[1])[0])
+        merged = []
+        for rank, doc in items:
+            start, end = _span(doc)
+            if merged:
+                m_rank, m_start, m_end, m_text, m_doc, count = merged[-1]
+                if start <= m_end + ADJACENT_GAP:
+                    if end > m_end:
+                        tail = doc.page_content[max(m_end - start, 0):]
+                        m_text = m_text + ("\n" if start > m_end else "") + tail
+                        m_end = end
+                    merged[-1] = (min(m_rank, rank), m_start, m_end, m_text, m_doc, count + 1)
+                    continue
+            merged.append((rank, start, end, doc.page_content, doc, 1))
+        return [
+            (rank, Document(page_content=text, metadata=dict(doc.metadata, start_index=start)), count)
+            for rank, start, _, text, doc, count in merged
+        ]
+
+    # No offsets (index built before start_index was stored): stitch on the shared text
+    merged = []
+    for rank, doc in items:
+        text = doc.page_content
+        for i, (m_rank, m_text, m_doc, count) in enumerate(merged):
+            if text in m_text:
+                merged[i] = (min(m_rank, rank), m_text, m_doc, count + 1)
+                break
+            if m_text in text:
+                merged[i] = (min(m_rank, rank), text, m_doc, count + 1)
+                break
+            overlap = _text_overlap(m_text, text)
+            if overlap:
+                merged[i] = (min(m_rank, rank), m_text + text[overlap:], m_doc, count + 1)
+                break
+            overlap = _text_overlap(text, m_text)
+            if overlap:
+                merged[i] = (min(m_rank, rank), text + m_text[overlap:], m_doc, count + 1)
+                break
+        else:
+            merged.append((rank, text, doc, 1))
+    return [(rank, Document(page_content=text, metadata=dict(doc.metadata)), count)
+            for rank, text, doc, count in merged]
+
+
+def _shingles(text):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def pack_context(documents, token_budget=None, dedup_threshold=None):
+    """
+    Context assembly for the "stuff" prompt. documents: retrieved chunks, best first.
+      1. merges overlapping / adjacent chunks of the same page into one passage
+      2. drops passages whose word 5-grams are >= dedup_threshold contained in a better one
+      3. packs passages by rank until token_budget (estimated tokens, 0 = no limit);
+         the best passage is always kept, cut to the budget if it alone is too long
+    Returns (packed_documents, stats).
+    """
+    token_budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    dedup_threshold = CONTEXT_DEDUP_THRESHOLD if dedup_threshold is None else dedup_threshold
+
+    pages = {}
+    for rank, doc in enumerate(documents):
+        key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        pages.setdefault(key, []).append((rank, doc))
+
+    passages = []
+    for items in pages.values():
+        passages.extend(_merge_page(items))
+    passages.sort(key=lambda item: item[0])
+
+    kept, kept_shingles, near_duplicates = [], [], 0
+    for rank, doc, count in passages:
+        shingles = _shingles(doc.page_content)
+        if any(len(shingles & other) >= dedup_threshold * len(shingles) for other in kept_shingles):
+            near_duplicates += 1
+            continue
+        kept.append((doc, count))
+        kept_shingles.append(shingles)
+
+    packed, used, over_budget = [], 0, 0
+    for doc, count in kept:
+        tokens = estimate_tokens(doc.page_content)
+        if token_budget and used + tokens > token_budget:
+            if packed:
+                over_budget += 1
+                continue
+            doc = Document(page_content=doc.page_content[:token_budget * CHARS_PER_TOKEN], metadata=doc.metadata)
+            tokens = estimate_tokens(doc.page_content)
+        if count > 1:
+            doc.metadata["merged_chunks"] = count
+        packed.append(doc)
+        used += tokens
+
+    stats = {
+        "chunks_in": len(documents),
+        "passages": len(passages),
+        "near_duplicates": near_duplicates,
+        "dropped_for_budget": over_budget,
+        "chunks_out": len(packed),
+        "tokens_in": sum(estimate_tokens(doc.page_content) for doc in documents),
+        "tokens_out": used,
+    }
+    return packed, stats
+
+
+class ContextPackingRetriever(BaseRetriever):
+    """
+    Wraps the (expanded) retriever and hands the "stuff" chain deduplicated, budgeted context.
+    Packing stats (+ its duration) are reported as a "context_packing" event (src/tracing.py).
+    """
+
+    retriever: Any
+    token_budget: int = CONTEXT_TOKEN_BUDGET
+    dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD
+
+    def retrieve_with_stats(self, query, config=None):
+        """Packed documents + packing stats (ProductQAChain.stream reports them per query)."""
+        stats = {}
+        documents = self.invoke(query, config=config, stats=stats)
+        return documents, stats
+
+    async def aretrieve_with_stats(self, query, config=None):
+        stats = {}
+        documents = await self.ainvoke(query, config=config, stats=stats)
+        return documents, stats
+
+    def _pack(self, documents, stats):
+        start = time.perf_counter()
+        packed, packing_stats = pack_context(documents, self.token_budget, self.dedup_threshold)
+        if stats is not None:
+            stats.update(packing_stats)
+        event = dict(packing_stats, documents=len(packed), duration_ms=(time.perf_counter() - start) * 1000)
+        return packed, event
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None, stats=None) -> List[Document]:
+        config = {"callbacks": run_manager.get_child()} if run_manager else None
+        packed, event = self._pack(self.retriever.invoke(query, config=config), stats)
+        if run_manager:
+            dispatch_custom_event("context_packing", event, config={"callbacks": run_manager.get_child()})
+        return packed
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager=None, stats=None) -> List[Document]:
+        config = {"callbacks": run_manager.get_child()} if run_manager else None
+        packed, event = self._pack(await self.retriever.ainvoke(query, config=config), stats)
+        if run_manager:
+            await adispatch_custom_event("context_packing", event, config={"callbacks": run_manager.get_child()})
+        return packed
+
+
+# --- UNIT TEST ---
+if __name__ == "__main__":
+    from src.splitter import _get_text_splitter
+
+    page_text = " ".join(f"Sentence {i} about the DM8SE loudspeaker and its mounting bracket." for i in range(60))
+    page = Document(page_content=page_text, metadata={"source": "a.pdf", "page": 1})
+    chunks = _get_text_splitter().split_documents([page])
+    other = Document(page_content="Net Weight 10.3 kg (22.8 lb)", metadata={"source": "a.pdf", "page": 2})
+    duplicate = Document(page_content=chunks[0].page_content, metadata={"source": "b.pdf", "page": 0})
+
+    retrieved = [chunks[1], other, chunks[0], duplicate, chunks[2]]
+    packed, stats = pack_context(retrieved, token_budget=0)
+    print(stats)
+    assert stats["passages"] == 3 and stats["near_duplicates"] == 1
+    assert page_text.startswith(packed[0].page_content)
+
+    # Same result without start offsets (text-overlap stitching)
+    for doc in retrieved:
+        doc.metadata.pop("start_index", None)
+    packed_text, _ = pack_context(retrieved, token_budget=0)
+    assert [d.page_content for d in packed_text] == [d.page_content for d in packed]
+
+    packed, stats = pack_context(retrieved, token_budget=300)
+    print(stats)
+    assert stats["tokens_out"] <= 300
+    print("✅ Context packing OK")
@@ -0,0 +1,158 @@
+import os
+import sys
+import json
+import hashlib
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.config import EMBED_CACHE_DIR, EMBED_CACHE_DTYPE, EMBED_BATCH_SIZE
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps any LangChain Embeddings with a persistent, append-only vector cache.
+
+    On disk (one folder per model):
+      vectors.bin -> raw rows of `dtype`, one row per cached text
+      keys.txt    -> sha256(text) per line, appended in step with vectors.bin (row i = line i)
+      index.json  -> {"model": ..., "dim": ..., "dtype": ...}, written once when the cache is created
+
+    Only documents are cached; queries go straight to the wrapped model.
+    """
+
+    # sha256 hex digest + newline: fixed-width lines, so a torn tail can be cut at a row boundary
+    KEY_LINE_BYTES = 65
+
+    def __init__(self, embeddings, model_name, cache_dir=None, dtype=None, batch_size=None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype or EMBED_CACHE_DTYPE)
+        self.batch_size = batch_size or EMBED_BATCH_SIZE
+
+        slug = model_name.replace("/", "__").replace(":", "_")
+        self.cache_dir = os.path.join(cache_dir or EMBED_CACHE_DIR, slug)
+        self._vectors_path = os.path.join(self.cache_dir, "vectors.bin")
+        self._keys_path = os.path.join(self.cache_dir, "keys.txt")
+        self._index_path = os.path.join(self.cache_dir, "index.json")
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    # --- storage ---
+
+    def _load(self):
+        self._keys = []
+        self._rows = {}
+        self.dim = None
+        self._vectors = None
+
+        if not os.path.exists(self._index_path):
+            return
+
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f" Warning: Ignoring unreadable embedding cache index: {e}")
+            return
+
+        if np.dtype(index.get("dtype")) != self.dtype:
+            print(f" Warning: Embedding cache dtype is {index.get('dtype')}, expected {self.dtype}. Starting fresh.")
+            return
+
+        self.dim = index["dim"]
+        if os.path.exists(self._keys_path):
+            with open(self._keys_path, "r", encoding="ascii") as f:
+                self._keys = [line[:-1] for line in f if len(line) == self.KEY_LINE_BYTES]
+
+        # An interrupted append may leave one file a batch ahead of the other: keep the rows both have
+        row_bytes = self.dim * self.dtype.itemsize
+        stored_rows = os.path.getsize(self._vectors_path) // row_bytes if os.path.exists(self._vectors_path) else 0
+        del self._keys[stored_rows:]
+
+        self._rows = {key: row for row, key in enumerate(self._keys)}
+        self._map_vectors()
+
+    def _write_index(self):
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model_name, "dim": self.dim, "dtype": self.dtype.name}, f)
+        os.replace(tmp_path, self._index_path)
+
+    def _map_vectors(self):
+        if self._keys:
+            self._vectors = np.memmap(
+                self._vectors_path, dtype=self.dtype, mode="r", shape=(len(self._keys), self.dim)
+            )
+
+    def _append(self, keys, vectors):
+        if self.dim is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self.dim = vectors.shape[1]
+            for path in (self._vectors_path, self._keys_path):
+                open(path, "wb").close()
+            self._write_index()
+
+        # Truncate leftovers of an interrupted write so both files stay row-aligned, then append
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(len(self._keys) * self.dim * self.dtype.itemsize)
+            f.write(np.ascontiguousarray(vectors, dtype=self.dtype).tobytes())
+        with open(self._keys_path, "ab") as f:
+            f.truncate(len(self._keys) * self.KEY_LINE_BYTES)
+            f.write("".join(f"{key}\n" for key in keys).encode("ascii"))
+
+        for key in keys:
+            self._rows[key] = len(self._keys)
+            self._keys.append(key)
+
+    # --- Embeddings interface ---
+
+    def embed_documents(self, texts):
+        with self._lock:
+            keys = [text_hash(text) for text in texts]
+
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in self._rows and key not in missing:
+                    missing[key] = text
+
+            self.misses += len(missing)
+            self.hits += len(texts) - len(missing)
+
+            # Encode misses in batches and persist each batch straight away
+            missing_items = list(missing.items())
+            for start in range(0, len(missing_items), self.batch_size):
+                batch = missing_items[start:start + self.batch_size]
+                vectors = np.asarray(self.embeddings.embed_documents([text for _, text in batch]))
+                self._append([key for key, _ in batch], vectors)
+            if missing_items:
+                self._map_vectors()
+
+            if not keys:
+                return []
+            rows = [self._rows[key] for key in keys]
+            return np.asarray(self._vectors[rows], dtype=np.float32).tolist()
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+    # --- reporting ---
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "cached_vectors": len(self._keys)}
+
+    def report(self):
+        total = self.hits + self.misses
+        hit_rate = (self.hits / total * 100) if total else 0.0
+        print(f" Embedding cache: {self.hits} hits, {self.misses} misses "
+              f"({hit_rate:.1f}% hit rate, {len(self._keys)} vectors stored in {self.cache_dir})")
@@ -1,90 +1,256 @@
 import sys
 import os
+import glob
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 
 # --- PATH FIX ---
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 # ----------------
 
-from src.bot import get_qa_chain
-
-def run_evaluation():
-    print(" Starting Automated Evaluation...")
-    
-    # 1. Initialize Bot
-    bot = get_qa_chain()
-    if not bot:
-        return
-
-    # 2. Define the Test Set (From AIML.pdf)
-    # We use "Keyword Matching" to check if the answer is roughly correct.
-    test_cases = [
-        {
-            "question": "What is the maximum power consumption of the processor?",
-            "expected_keywords": ["35 W", "35W", "35 watts"], 
-            "doc_source": "EX-1280C"
-        },
-        {
-            "question": "What is the maximum 70V transformer tap setting in Watts?",
-            "expected_keywords": ["80W"],
-            "doc_source": "DM8SE"
-        },
-        {
-            "question": "What is the Net Weight of a single DM8SE loudspeaker?",
-            "expected_keywords": ["10.3 kg", "22.8 lb"],
-            "doc_source": "DM8SE"
-        },
-        {
-            "question": "What is the Dynamic Range of the analog signal path?",
-            "expected_keywords": ["115 dB"],
-            "doc_source": "EX-1280C"
-        },
-        {
-            "question": "What is the length of AEC tail in milliseconds?",
-            "expected_keywords": ["480 ms", "480ms"],
-            "doc_source": "EX-1280C"
-        }
-    ]
-
-    results = []
-    correct_count = 0
-
-    print(f" Testing {len(test_cases)} questions...\n")
-
-    for i, test in enumerate(test_cases):
-        print(f"🔹 Q{i+1}: {test['question']}")
-        
-        # Ask the bot
+# NOTE: src.bot / src.config are imported inside the functions so that
+# --llm-backend can switch to the offline stub LLM before config is read.
+
+STAGES = ["retrieval", "time_to_first_token", "generation", "total"]
+
+def load_test_cases(paths=None):
+    """
+    Loads test cases from .json (list) or .jsonl files (default: every file in EVAL_DIR).
+    Each case: {"question": ..., "expected_keywords": [...], "doc_source": "DM8SE"}
+    """
+    from src.config import EVAL_DIR
+
+    if not paths:
+        paths = sorted(glob.glob(os.path.join(EVAL_DIR, "*.json")) + glob.glob(os.path.join(EVAL_DIR, "*.jsonl")))
+
+    test_cases = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            if path.endswith(".jsonl"):
+                cases = [json.loads(line) for line in f if line.strip()]
+            else:
+                cases = json.load(f)
+        for case in cases:
+            case.setdefault("set", os.path.basename(path))
+        test_cases.extend(cases)
+
+    return test_cases
+
+def _get_chain(test, expansion_mode, lock_product):
+    from src.bot import get_qa_chain
+
+    bot = get_qa_chain(target_pdf=test.get("doc_source") if lock_product else None, expansion_mode=expansion_mode)
+    if bot is None:
+        raise RuntimeError("QA chain could not be built")
+    return bot
+
+def _is_correct(test, answer):
+    # If ANY of the expected keywords appear in the answer, we mark it PASS
+    return any(keyword.lower() in answer.lower() for keyword in test["expected_keywords"])
+
+def _run_case(test, expansion_mode, lock_product, use_fast_path=False):
+    """Runs one test case through the streaming path so every stage gets timed."""
+    bot = _get_chain(test, expansion_mode, lock_product)
+
+    done = {}
+    for event in bot.stream({"query": test["question"]}, use_cache=False, use_fast_path=use_fast_path):
+        if event["type"] == "done":
+            done = event
+
+    answer = done["result"]
+    return answer, _is_correct(test, answer), done
+
+def evaluate_spec_fast_path(test_cases, expansion_mode=None, lock_product=False):
+    """
+    Asks the spec tables alone (no retrieval, no LLM): how many questions they answer and how
+    many of those answers are right. None if the fast path is off (SPEC_FASTPATH_ENABLED).
+    """
+    answered = correct = 0
+    for test in test_cases:
+        spec_lookup = _get_chain(test, expansion_mode, lock_product).spec_lookup
+        if spec_lookup is None:
+            return None
+        spec = spec_lookup(test["question"])
+        if spec is not None:
+            answered += 1
+            correct += _is_correct(test, spec["result"])
+    return {"answered": answered, "correct": correct,
+            "accuracy": round(correct / answered * 100, 1) if answered else None}
+
+def _percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": round(float(p50), 4), "p95": round(float(p95), 4), "p99": round(float(p99), 4)}
+
+def run_evaluation(expansion_mode=None, test_files=None, workers=4, lock_product=False, verbose=True,
+                   spec_fastpath=False):
+    """
+    Runs every test case concurrently (`workers` threads) and reports accuracy,
+    per-stage p50/p95/p99 latency and throughput. Errors count as failures.
+    Every question goes through retrieval + LLM unless spec_fastpath=True (answer from the
+    spec tables first, as the app does); the spec tables are scored on their own either way.
+    """
+    from src.bot import warm_qa_chains
+
+    test_cases = load_test_cases(test_files)
+    if not test_cases:
+        print(" No test cases found.")
+        return None
+
+    print(f" Starting Automated Evaluation (query expansion: {expansion_mode or 'default'}, "
+          f"{len(test_cases)} questions, {workers} worker(s), "
+          f"spec fast path {'on' if spec_fastpath else 'off'})...")
+
+    # Build chains up front so chain construction is not part of the measured latency
+    products = {t.get("doc_source") for t in test_cases} if lock_product else {None}
+    warm_start = time.perf_counter()
+    warm_qa_chains(list(products), expansion_mode=expansion_mode)
+    warm_seconds = time.perf_counter() - warm_start
+
+    def run(test):
         try:
-            response_payload = bot.invoke({"query": test['question']})
-            generated_answer = response_payload["result"]
-            
-            # Check correctness (Simple Keyword Match)
-            # If ANY of the expected keywords appear in the answer, we mark it PASS
-            is_correct = any(keyword.lower() in generated_answer.lower() for keyword in test['expected_keywords'])
-            
-            status = " PASS" if is_correct else "❌ FAIL"
-            if is_correct:
-                correct_count += 1
-            
-            print(f"   Answer: {generated_answer}")
-            print(f"   Result: {status}")
-            print("-" * 30)
-            
-            results.append({
-                "Question": test['question'],
-                "Bot Answer": generated_answer,
-                "Status": status
-            })
-            
+            answer, is_correct, done = _run_case(test, expansion_mode, lock_product, use_fast_path=spec_fastpath)
+            context = done.get("context") or {}
+            return {"Question": test["question"], "Bot Answer": answer,
+                    "Status": " PASS" if is_correct else "❌ FAIL", "Error": None,
+                    "Fast Path": done.get("fast_path", False),
+                    # Estimated tokens: whole prompt, retrieved context before / after packing
+                    "prompt_tokens": done.get("prompt_tokens", 0),
+                    "context_tokens_raw": context.get("tokens_in"),
+                    "context_tokens_packed": context.get("tokens_out"),
+                    # Seconds per pipeline stage from the trace (TRACING_ENABLED)
+                    "pipeline": {stage: info["total_ms"] / 1000
+                                 for stage, info in (done.get("trace") or {}).get("stages", {}).items()},
+                    **done["timings"]}
         except Exception as e:
-            print(f"    Error: {e}")
+            return {"Question": test["question"], "Bot Answer": None, "Status": "❌ ERROR", "Error": str(e)}
 
-    # 3. Final Report
-    accuracy = (correct_count / len(test_cases)) * 100
-    print(f"\n🏆 Final Accuracy: {accuracy}% ({correct_count}/{len(test_cases)})")
-    
-    return results
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = list(pool.map(run, test_cases))
+    wall_seconds = time.perf_counter() - wall_start
+    fast_path = evaluate_spec_fast_path(test_cases, expansion_mode, lock_product)
+
+    if verbose:
+        for i, r in enumerate(results):
+            print(f"🔹 Q{i+1}: {r['Question']}")
+            if r["Error"]:
+                print(f"    Error: {r['Error']}")
+            else:
+                print(f"   Answer: {r['Bot Answer']}")
+                print(f"   Result: {r['Status']} ({r['total']:.2f}s{', spec table' if r['Fast Path'] else ''})")
+                if r["context_tokens_raw"] is not None:
+                    print(f"   Prompt: {r['prompt_tokens']} tokens "
+                          f"(context {r['context_tokens_raw']} -> {r['context_tokens_packed']} after packing)")
+            print("-" * 30)
+
+    # Final Report (errors are failures, not silently dropped)
+    correct_count = sum(1 for r in results if r["Status"].strip() == "PASS")
+    error_count = sum(1 for r in results if r["Error"])
+    ok_results = [r for r in results if not r["Error"]]
+    packed = [r for r in ok_results if r["context_tokens_raw"] is not None]
+    raw_tokens = sum(r["context_tokens_raw"] for r in packed)
+    packed_tokens = sum(r["context_tokens_packed"] for r in packed)
+    report = {
+        "expansion_mode": expansion_mode,
+        "questions": len(results),
+        "correct": correct_count,
+        "errors": error_count,
+        "spec_fastpath_enabled": spec_fastpath,
+        "spec_fast_path": sum(1 for r in results if r.get("Fast Path")),
+        "accuracy": round(correct_count / len(results) * 100, 1),
+        # The spec tables on their own: questions they answer and accuracy on those
+        "spec_table_accuracy": fast_path,
+        "throughput_qps": round(len(results) / wall_seconds, 3) if wall_seconds else None,
+        "wall_seconds": round(wall_seconds, 3),
+        "chain_build_seconds": round(warm_seconds, 3),
+        "latency": {stage: _percentiles([r[stage] for r in ok_results]) for stage in STAGES},
+        # Traced stages (query generation, dense / BM25 search, fusion, packing, LLM call, ...)
+        "pipeline_latency": {
+            stage: _percentiles([r["pipeline"][stage] for r in ok_results if stage in r["pipeline"]])
+            for stage in sorted({stage for r in ok_results for stage in r["pipeline"]})
+        },
+        "prompt_tokens": {
+            "mean": round(float(np.mean([r["prompt_tokens"] for r in ok_results])), 1) if ok_results else None,
+            "context_raw": raw_tokens,
+            "context_packed": packed_tokens,
+            "context_saved_pct": round((1 - packed_tokens / raw_tokens) * 100, 1) if raw_tokens else None,
+        },
+        "results": results,
+    }
+
+    print(f"\n🏆 Final Accuracy: {report['accuracy']}% ({correct_count}/{len(results)}, {error_count} error(s))")
+    print(f"⚡ Throughput: {report['throughput_qps']} questions/s over {report['wall_seconds']}s "
+          f"({report['spec_fast_path']} answered from the spec tables)")
+    if fast_path is not None:
+        print(f"📋 Spec tables alone: {fast_path['answered']}/{len(results)} answered, "
+              f"{fast_path['correct']} correct ({fast_path['accuracy']}% accuracy)")
+    if packed:
+        print(f"🧮 Context tokens: {raw_tokens} retrieved -> {packed_tokens} sent "
+              f"({report['prompt_tokens']['context_saved_pct']}% saved by packing)")
+    latency_table = pd.DataFrame(report["latency"]).T
+    latency_table.index.name = "stage (s)"
+    print(latency_table.to_string())
+    if report["pipeline_latency"]:
+        pipeline_table = pd.DataFrame(report["pipeline_latency"]).T
+        pipeline_table.index.name = "traced stage (s)"
+        print(pipeline_table.to_string())
+
+    return report
+
+def compare_expansion_modes(modes=("llm", "local"), **kwargs):
+    """Runs the evaluation once per query-expansion mode and prints accuracy + latency side by side."""
+    rows = []
+    for mode in modes:
+        report = run_evaluation(expansion_mode=mode, verbose=False, **kwargs)
+        if report is None:
+            continue
+        rows.append({
+            "Mode": mode,
+            "Accuracy (%)": report["accuracy"],
+            "Errors": report["errors"],
+            "Retrieval p50 (s)": report["latency"]["retrieval"]["p50"],
+            "Total p50 (s)": report["latency"]["total"]["p50"],
+            "Total p95 (s)": report["latency"]["total"]["p95"],
+            "Prompt tokens (mean)": report["prompt_tokens"]["mean"],
+            "Throughput (q/s)": report["throughput_qps"],
+        })
+
+    print("\n📊 Query expansion comparison")
+    print(pd.DataFrame(rows).to_string(index=False))
+    return rows
 
 if __name__ == "__main__":
-    run_evaluation()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Keyword-match evaluation of the QA bot.")
+    parser.add_argument("--expansion", nargs="+", choices=["llm", "local", "none"],
+                        help="Query expansion mode(s); several modes are compared side by side")
+    parser.add_argument("--tests", nargs="+", help="Test set files (.json / .jsonl), default: data/eval/*")
+    parser.add_argument("--workers", type=int, default=4, help="Questions evaluated concurrently")
+    parser.add_argument("--lock-product", action="store_true", help="Lock each question to its doc_source PDF")
+    parser.add_argument("--spec-fastpath", action="store_true",
+                        help="Answer from the spec tables first, as the app does (default: retrieval + LLM only; "
+                             "the spec tables are scored separately)")
+    parser.add_argument("--llm-backend", choices=["gemini", "stub"],
+                        help="'stub' = deterministic offline LLM (CI boxes without network)")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    if args.llm_backend:
+        os.environ["LLM_BACKEND"] = args.llm_backend
+
+    options = {"test_files": args.tests, "workers": args.workers, "lock_product": args.lock_product,
+               "spec_fastpath": args.spec_fastpath}
+    if args.expansion and len(args.expansion) > 1:
+        output = compare_expansion_modes(args.expansion, **options)
+    else:
+        output = run_evaluation(expansion_mode=args.expansion[0] if args.expansion else None, **options)
+
+    if args.output and output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2, default=str)
+        print(f" Report written to {args.output}")
@@ -0,0 +1,302 @@
+import os
+import sys
+import shutil
+import socket
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.config import DB_DIR, INDEX_GENERATIONS_KEEP
+
+# Index generations: every ingestion run builds a complete index (vector store, BM25
+# partitions, router, acronym + spec tables, manifest) in a fresh folder and publishes
+# it by atomically rewriting one pointer file, so readers never see a half-built index
+# and nothing is deleted under a running app:
+#   DB_DIR/CURRENT                      -> id of the published generation
+#   DB_DIR/generations/<id>/            -> one complete index (what DB_DIR used to hold)
+#   DB_DIR/generations/<id>/READERS/    -> one lease file per serving process using it
+# A serving process pins the generation it loaded (get_db_dir) until it swaps to a newer
+# one (bot.reload_index); old generations are garbage-collected after each ingestion.
+GENERATIONS_DIRNAME = "generations"
+CURRENT_FILENAME = "CURRENT"
+READERS_DIRNAME = "READERS"
+# Side indexes that are only ever replaced (tmp folder + rename), never edited in place:
+# a new generation hard-links their files instead of copying them
+LINKED_DIRNAMES = {"bm25", "chunks", "dense", "router"}
+# Files of the flat pre-generation layout (the whole index directly in DB_DIR)
+LEGACY_MARKERS = ("ingest_manifest.json", "chroma.sqlite3")
+
+
+def _root(root=None):
+    return root or DB_DIR
+
+
+def generation_dir(generation, root=None):
+    return os.path.join(_root(root), GENERATIONS_DIRNAME, generation)
+
+
+def list_generations(root=None):
+    """Ids of the generation folders on disk, oldest first (ids sort by creation time)."""
+    path = os.path.join(_root(root), GENERATIONS_DIRNAME)
+    if not os.path.isdir(path):
+        return []
+    return sorted(name for name in os.listdir(path) if not name.endswith(".tmp"))
+
+
+def current_generation(root=None):
+    """Id of the published generation, None if nothing was published yet."""
+    try:
+        with open(os.path.join(_root(root), CURRENT_FILENAME), "r", encoding="utf-8") as f:
+            generation = f.read().strip()
+    except OSError:
+        return None
+    return generation if generation and os.path.isdir(generation_dir(generation, root)) else None
+
+
+def has_legacy_layout(root=None):
+    return any(os.path.exists(os.path.join(_root(root), name)) for name in LEGACY_MARKERS)
+
+
+def _copy_tree(src, dst, link):
+    """Copies a folder; with link=True files are hard-linked (falls back to copies across devices)."""
+    def copy(s, d):
+        if link:
+            try:
+                os.link(s, d)
+                return d
+            except OSError:
+                pass
+        return shutil.copy2(s, d)
+    shutil.copytree(src, dst, copy_function=copy, ignore=shutil.ignore_patterns("*.tmp", READERS_DIRNAME))
+
+
+def new_generation(seed=True, root=None):
+    """
+    Creates an unpublished generation folder and returns its id. With seed=True it starts
+    as a copy of the published index (or of a legacy flat DB_DIR), so an incremental
+    ingestion only touches what changed; immutable side indexes are hard-linked.
+    """
+    root = _root(root)
+    generation = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f") + f"-{os.getpid()}"
+    path = generation_dir(generation, root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    current = current_generation(root)
+    source = generation_dir(current, root) if current else (root if has_legacy_layout(root) else None)
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    if seed and source:
+        for name in os.listdir(source):
+            if name in (GENERATIONS_DIRNAME, READERS_DIRNAME) or name.startswith(CURRENT_FILENAME) \
+                    or name.endswith(".tmp"):
+                continue
+            src, dst = os.path.join(source, name), os.path.join(tmp_path, name)
+            if os.path.isdir(src):
+                _copy_tree(src, dst, link=name in LINKED_DIRNAMES)
+            else:
+                shutil.copy2(src, dst)
+    os.replace(tmp_path, path)
+    return generation
+
+
+def publish(generation, root=None):
+    """Makes `generation` the published index: one atomic rename of the pointer file."""
+    root = _root(root)
+    path = os.path.join(root, CURRENT_FILENAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(generation)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def discard_generation(generation, root=None):
+    """Deletes an unpublished generation (failed or no-op ingestion)."""
+    shutil.rmtree(generation_dir(generation, root), ignore_errors=True)
+
+
+# --- leases: which generations serving processes still read ---
+
+def _lease_path(generation, root=None):
+    return os.path.join(generation_dir(generation, root), READERS_DIRNAME, f"{socket.gethostname()}-{os.getpid()}")
+
+
+def _pid_alive(pid):
+    if os.name == "nt":
+        # os.kill(pid, 0) would terminate the process on Windows: assume it still runs
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _leased(generation, root=None):
+    """True while a live process on this host (or any process on another host) holds a lease."""
+    path = os.path.join(generation_dir(generation, root), READERS_DIRNAME)
+    if not os.path.isdir(path):
+        return False
+    hostname = socket.gethostname()
+    for name in os.listdir(path):
+        host, _, pid = name.rpartition("-")
+        if host != hostname or not pid.isdigit() or _pid_alive(int(pid)):
+            return True
+        # Stale lease of a process that exited without releasing it
+        try:
+            os.remove(os.path.join(path, name))
+        except OSError:
+            pass
+    return False
+
+
+def _lease(generation, root=None):
+    path = _lease_path(generation, root)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "w").close()
+    except OSError as e:
+        print(f" Warning: Could not register as reader of index generation {generation}: {e}")
+
+
+def _release(generation, root=None):
+    try:
+        os.remove(_lease_path(generation, root))
+    except OSError:
+        pass
+
+
+def collect_garbage(keep=INDEX_GENERATIONS_KEEP, root=None):
+    """
+    Deletes generations older than the published one, keeping the newest `keep` in total
+    (the previous one serves queries still in flight while processes swap) and any that a
+    serving process still holds. Newer unpublished generations are left alone (an
+    ingestion may be writing them). A legacy flat layout counts as the oldest generation.
+    Returns the deleted ids.
+    """
+    root = _root(root)
+    current = current_generation(root)
+    if current is None:
+        return []
+    older = [g for g in reversed(list_generations(root)) if g < current]
+    removed = []
+    for generation in older[max(keep - 1, 0):]:
+        if _leased(generation, root):
+            print(f" Keeping index generation {generation} (still in use)")
+            continue
+        shutil.rmtree(generation_dir(generation, root), ignore_errors=True)
+        removed.append(generation)
+        print(f" Removed old index generation {generation}")
+
+    if has_legacy_layout(root) and len(older) + 1 >= keep:
+        for name in os.listdir(root):
+            if name in (GENERATIONS_DIRNAME, CURRENT_FILENAME):
+                continue
+            path = os.path.join(root, name)
+            try:
+                shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+            except Exception as e:
+                print(f" Could not delete {path} (might be open): {e}")
+        removed.append("legacy")
+        print(f" Removed the pre-generation index files in {root}")
+    return removed
+
+
+# --- the generation this process reads ---
+
+_active = None
+_active_lock = threading.Lock()
+# Set while building or warming a generation that is not (yet) the one being served
+_override = contextvars.ContextVar("index_generation_dir", default=None)
+
+
+def active_generation():
+    """Id of the generation this process serves, None before the first one is loaded."""
+    return _active
+
+
+def set_active(generation, root=None):
+    """Pins this process to `generation` (and moves its reader lease there)."""
+    global _active
+    with _active_lock:
+        previous, _active = _active, generation
+        if previous != generation:
+            _lease(generation, root)
+            if previous:
+                _release(previous, root)
+
+
+def get_db_dir():
+    """
+    Folder of the index this code should read / write: the generation being built or
+    warmed (see using), else the generation this process serves. The first call pins
+    the published generation; a new one is only picked up through set_active.
+    Falls back to DB_DIR itself (legacy flat layout, or nothing ingested yet).
+    """
+    global _active
+    override = _override.get()
+    if override:
+        return override
+    if _active is None:
+        generation = current_generation()
+        if generation is None:
+            return DB_DIR
+        with _active_lock:
+            if _active is None:
+                _lease(generation)
+                _active = generation
+    return generation_dir(_active)
+
+
+@contextmanager
+def using(generation, root=None):
+    """Routes get_db_dir() of this thread / task to `generation` for the duration of the block."""
+    token = _override.set(generation_dir(generation, root))
+    try:
+        yield
+    finally:
+        _override.reset(token)
+
+
+# --- UNIT TEST ---
+if __name__ == "__main__":
+    import tempfile
+
+    root = tempfile.mkdtemp()
+    # Legacy flat layout with one side index
+    with open(os.path.join(root, "ingest_manifest.json"), "w") as f:
+        f.write("{}")
+    os.makedirs(os.path.join(root, "bm25", "p"))
+    with open(os.path.join(root, "bm25", "p", "meta.json"), "w") as f:
+        f.write("{}")
+
+    first = new_generation(root=root)
+    assert os.path.exists(os.path.join(generation_dir(first, root), "ingest_manifest.json"))
+    assert current_generation(root) is None
+    publish(first, root)
+    assert current_generation(root) == first
+
+    second = new_generation(root=root)
+    linked = os.path.join(generation_dir(second, root), "bm25", "p", "meta.json")
+    assert os.stat(linked).st_ino == os.stat(os.path.join(generation_dir(first, root), "bm25", "p", "meta.json")).st_ino
+    publish(second, root)
+    assert collect_garbage(keep=2, root=root) == ["legacy"]
+    assert not has_legacy_layout(root)
+
+    third = new_generation(root=root)
+    publish(third, root)
+    _lease(first, root)
+    assert collect_garbage(keep=2, root=root) == []
+    _release(first, root)
+    assert collect_garbage(keep=2, root=root) == [first]
+    assert list_generations(root) == [second, third]
+    shutil.rmtree(root)
+    print("✅ Index generations OK")
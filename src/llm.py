@@ -0,0 +1,286 @@
+import os
+import sys
+import re
+import json
+import time
+import itertools
+import asyncio
+import urllib.error
+import urllib.request
+from typing import Any, AsyncIterator, Iterator, List, Optional
+from langchain_core.callbacks.manager import CallbackManager, adispatch_custom_event, dispatch_custom_event
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.config import (
+    GOOGLE_API_KEY, LLM_MODEL_NAME, LLM_BACKEND, STUB_LLM_LATENCY_MS, STUB_LLM_URL,
+    LLM_ANSWER_MAX_WAIT, LLM_EXPANSION_MAX_WAIT
+)
+from src.context_packing import estimate_tokens
+from src.llm_scheduler import get_scheduler
+
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "does", "for", "from", "how", "in", "is",
+    "it", "of", "on", "or", "the", "this", "to", "what", "which", "with", "context",
+}
+
+
+def _content_words(text):
+    return {w for w in re.findall(r"\w+", text.lower()) if w not in _STOPWORDS}
+
+
+class StubLLM(LLM):
+    """
+    Deterministic, offline stand-in for Gemini (LLM_BACKEND=stub).
+
+    - Query-expansion prompts ("Original question: ...") get the question echoed back.
+    - Answer prompts ("Context: ... User Question: ...") get the context line that
+      shares the most words with the question, so keyword-based evaluation still
+      measures retrieval quality.
+    - Grouped batch prompts (src/batch_qa.py) get the same per question, as JSON with citations.
+    - latency_ms (STUB_LLM_LATENCY_MS) simulates the API round trip.
+    """
+
+    latency_ms: float = STUB_LLM_LATENCY_MS
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return self._answer(prompt)
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return self._answer(prompt)
+
+    def _answer(self, prompt):
+        if "Original question:" in prompt:
+            return prompt.rsplit("Original question:", 1)[1].strip()
+        if _BATCH_QUESTION.search(prompt) and "\nPassages:\n" in prompt:
+            return self._answer_batch(prompt)
+
+        match = re.search(r"Context:(.*)User Question:(.*?)(?:INSTRUCTIONS:|$)", prompt, re.S)
+        if not match:
+            return prompt.strip().splitlines()[-1] if prompt.strip() else ""
+
+        return _best_line(match.group(1), match.group(2)) or "This query is not related to the currently selected product."
+
+    def _answer_batch(self, prompt):
+        """Grouped prompt of src/batch_qa.py: per question, the best line of its own passages, as JSON."""
+        body = prompt.split("\nPassages:\n", 1)[1]
+        passage_text, question_text = body.split("\nQuestions:\n", 1)
+        passages = {int(n): text for n, text in _BATCH_PASSAGE.findall(passage_text)}
+        answers = []
+        for qid, numbers, question in _BATCH_QUESTION.findall(question_text.split("\nINSTRUCTIONS:", 1)[0]):
+            own = [int(n) for n in re.findall(r"\d+", numbers)]
+            line = _best_line("\n".join(passages.get(n, "") for n in own), question)
+            answers.append({
+                "id": qid,
+                "answer": line or "This query is not related to the currently selected product.",
+                "citations": [n for n in own if line and line in passages.get(n, "")],
+            })
+        return json.dumps(answers, ensure_ascii=False)
+
+
+# Grouped prompts of src/batch_qa.py: "[3] (file.pdf, page 2)\n<text>" passages, "Q1 (passages 1, 3): ..." questions
+_BATCH_PASSAGE = re.compile(r"^\[(\d+)\] \([^\n]*\)\n(.*?)(?=\n\n\[\d+\] \(|\n*\Z)", re.S | re.M)
+_BATCH_QUESTION = re.compile(r"^(Q\d+) \(passages ([\d, ]+|none)\): (.*)$", re.M)
+
+
+def _best_line(context, question):
+    """The context line sharing the most words with the question ("" if none shares any)."""
+    question_words = _content_words(question)
+    best_line, best_score = "", (0, False)
+    for line in context.splitlines():
+        # Most shared words wins; spec lines (with a number) win ties
+        score = (len(question_words & _content_words(line)), bool(re.search(r"\d", line)))
+        if score[0] and score > best_score:
+            best_line, best_score = line.strip(), score
+    return best_line
+
+
+class LLMHTTPError(RuntimeError):
+    """Error status of the HTTP stub server (429 carries the server's Retry-After)."""
+
+    def __init__(self, status_code, message="", retry_after=None):
+        super().__init__(f"HTTP {status_code}: {message}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class HttpStubLLM(LLM):
+    """
+    StubLLM behind benchmarks/stub_llm_server.py (LLM_BACKEND=stub-http): same answers, but
+    with a real network hop, rate limits (429 + Retry-After) and injected 5xx errors,
+    so the scheduler's retries / backoff can be exercised offline.
+    """
+
+    url: str = STUB_LLM_URL
+    timeout: float = 30.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-http"
+
+    def _post(self, prompt):
+        request = urllib.request.Request(
+            f"{self.url.rstrip('/')}/generate", data=json.dumps({"prompt": prompt}).encode("utf-8"),
+            headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as resp:
+                return json.loads(resp.read())["text"]
+        except urllib.error.HTTPError as e:
+            retry_after = e.headers.get("Retry-After")
+            raise LLMHTTPError(e.code, e.reason, float(retry_after) if retry_after else None) from e
+        except urllib.error.URLError as e:
+            raise ConnectionError(f"Stub LLM server unreachable at {self.url}: {e.reason}") from e
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        return self._post(prompt)
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        return await asyncio.to_thread(self._post, prompt)
+
+
+def _text(output):
+    return output.content if hasattr(output, "content") else str(output)
+
+
+def _event_config(run_manager):
+    # LLM run managers have no get_child(): the event's parent is the LLM run itself
+    return {"callbacks": CallbackManager(handlers=run_manager.inheritable_handlers,
+                                         inheritable_handlers=run_manager.inheritable_handlers,
+                                         parent_run_id=run_manager.run_id)}
+
+
+# The wrapped model runs without callbacks: the ScheduledLLM run is the one traced (and it
+# would otherwise inherit them from the surrounding runnable and show up twice)
+_DETACHED = {"callbacks": CallbackManager(handlers=[])}
+
+
+def _used_tokens(output):
+    usage = getattr(output, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+
+class ScheduledLLM(LLM):
+    """
+    Routes every call of the wrapped model through the process-wide LLMScheduler
+    (src/llm_scheduler.py): rate limits, priority (answers before query generation),
+    retries with backoff. The wait is reported to the trace as an "llm_schedule" event.
+    Streams keep their slot until the last chunk and are only retried before the first one.
+    """
+
+    llm: Any
+    scheduler: Any
+    priority: str = "answer"
+    max_wait: Optional[float] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return f"scheduled-{getattr(self.llm, '_llm_type', 'llm')}"
+
+    def _event(self, ticket):
+        return {"duration_ms": ticket.waited * 1000, "priority": self.priority, "attempts": ticket.attempts}
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        output, ticket = self.scheduler.run(
+            lambda: self.llm.invoke(prompt, _DETACHED, stop=stop, **kwargs), self.priority, estimate_tokens(prompt), self.max_wait
+        )
+        self.scheduler.release(ticket, _used_tokens(output))
+        if run_manager:
+            dispatch_custom_event("llm_schedule", self._event(ticket), config=_event_config(run_manager))
+        return _text(output)
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        output, ticket = await self.scheduler.arun(
+            lambda: self.llm.ainvoke(prompt, _DETACHED, stop=stop, **kwargs), self.priority, estimate_tokens(prompt), self.max_wait
+        )
+        self.scheduler.release(ticket, _used_tokens(output))
+        if run_manager:
+            await adispatch_custom_event("llm_schedule", self._event(ticket),
+                                         config=_event_config(run_manager))
+        return _text(output)
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None,
+                **kwargs: Any) -> Iterator[GenerationChunk]:
+        def start():
+            # The first chunk proves the call was accepted: errors up to here are retried
+            chunks = iter(self.llm.stream(prompt, _DETACHED, stop=stop, **kwargs))
+            return next(chunks, None), chunks
+
+        (first, chunks), ticket = self.scheduler.run(start, self.priority, estimate_tokens(prompt), self.max_wait)
+        try:
+            if run_manager:
+                dispatch_custom_event("llm_schedule", self._event(ticket), config=_event_config(run_manager))
+            for output in itertools.chain([first] if first is not None else [], chunks):
+                chunk = GenerationChunk(text=_text(output))
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+        finally:
+            self.scheduler.release(ticket)
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None,
+                       **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        async def start():
+            chunks = self.llm.astream(prompt, _DETACHED, stop=stop, **kwargs).__aiter__()
+            try:
+                return await chunks.__anext__(), chunks
+            except StopAsyncIteration:
+                return None, chunks
+
+        (first, chunks), ticket = await self.scheduler.arun(start, self.priority, estimate_tokens(prompt), self.max_wait)
+        try:
+            if run_manager:
+                await adispatch_custom_event("llm_schedule", self._event(ticket),
+                                             config=_event_config(run_manager))
+            if first is not None:
+                chunk = GenerationChunk(text=_text(first))
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+                async for output in chunks:
+                    chunk = GenerationChunk(text=_text(output))
+                    if run_manager:
+                        await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                    yield chunk
+        finally:
+            self.scheduler.release(ticket)
+
+
+def get_llm(temperature=0.5, priority="answer"):
+    """
+    Returns the chat model selected by LLM_BACKEND. Remote backends ("gemini", "stub-http")
+    go through the LLM scheduler unless LLM_SCHEDULER_ENABLED is off.
+    priority: "answer" or "expansion" (query generation: waits less, yields to answers).
+    """
+    if LLM_BACKEND == "stub":
+        return StubLLM()
+
+    scheduler = get_scheduler()
+    if LLM_BACKEND == "stub-http":
+        llm = HttpStubLLM()
+    else:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        llm = ChatGoogleGenerativeAI(
+            model=LLM_MODEL_NAME,
+            google_api_key=GOOGLE_API_KEY,
+            temperature=temperature,
+            # A single attempt when scheduled: retries belong to the scheduler, which sees every caller
+            max_retries=1 if scheduler is not None else 6
+        )
+    if scheduler is None:
+        return llm
+
+    max_wait = LLM_ANSWER_MAX_WAIT if priority == "answer" else LLM_EXPANSION_MAX_WAIT
+    return ScheduledLLM(llm=llm, scheduler=scheduler, priority=priority, max_wait=max_wait)
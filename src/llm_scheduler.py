@@ -0,0 +1,398 @@
+import os
+import sys
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import threading
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.config import (
+    LLM_SCHEDULER_ENABLED, LLM_RPM, LLM_TPM, LLM_BURST, LLM_MAX_CONCURRENCY, LLM_MAX_RETRIES,
+    LLM_BACKOFF_BASE, LLM_BACKOFF_MAX, LLM_EXPECTED_OUTPUT_TOKENS, LLM_EXPANSION_RESERVE
+)
+
+# Lower value = served first: an answer call never waits behind query generation
+PRIORITIES = {"answer": 0, "expansion": 1}
+# HTTP statuses worth retrying (rate limit, overload, gateway / deadline errors)
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+# google.api_core exceptions raised by the Gemini SDK, matched by name (no hard dependency)
+RETRYABLE_ERRORS = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded",
+                    "InternalServerError", "BadGateway", "GatewayTimeout"}
+RATE_LIMIT_ERRORS = {"ResourceExhausted", "TooManyRequests"}
+# Idle wait of a queued caller between re-checks (async callers poll, sync callers are notified)
+POLL_SECONDS = 0.02
+
+
+class LLMUnavailableError(RuntimeError):
+    """The LLM could not be called: rate limited / failing after every retry, or no budget in time."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMBudgetExceeded(LLMUnavailableError):
+    """No request / token budget within the caller's max_wait."""
+
+
+def _status(error):
+    for attr in ("status_code", "code", "status"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_retryable(error):
+    return (_status(error) in RETRYABLE_STATUS or type(error).__name__ in RETRYABLE_ERRORS
+            or isinstance(error, (TimeoutError, ConnectionError)))
+
+
+def is_rate_limit(error):
+    return _status(error) == 429 or type(error).__name__ in RATE_LIMIT_ERRORS
+
+
+def retry_after(error):
+    """Seconds the provider asked us to wait (Retry-After), if it said so."""
+    value = getattr(error, "retry_after", None)
+    return float(value) if isinstance(value, (int, float)) and value >= 0 else None
+
+
+class TokenBucket:
+    """Refills at per_minute / 60 units per second, up to capacity (the allowed burst)."""
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = float(capacity or per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` is available (0 = now)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class Ticket:
+    """One scheduled call: its place in the queue, the reserved tokens and what it cost to get through."""
+
+    def __init__(self, priority, seq, tokens):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        # The token reservation is taken on the first attempt and kept across retries
+        self.reserved = False
+        self.waited = 0.0
+        self.attempts = 0
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class LLMScheduler:
+    """
+    Process-wide gate in front of the LLM provider:
+      - token buckets for requests and tokens per minute (rpm / tpm, burst = bucket size)
+      - at most max_concurrency calls in flight
+      - a priority queue: answer calls go before query-generation (expansion) calls
+      - retries of rate-limit / transient errors with full-jitter exponential backoff;
+        a 429 pauses every caller (the quota is shared), honouring Retry-After
+    """
+
+    def __init__(self, rpm=LLM_RPM, tpm=LLM_TPM, burst=LLM_BURST, max_concurrency=LLM_MAX_CONCURRENCY,
+                 max_retries=LLM_MAX_RETRIES, backoff_base=LLM_BACKOFF_BASE, backoff_max=LLM_BACKOFF_MAX,
+                 expected_output_tokens=LLM_EXPECTED_OUTPUT_TOKENS, expansion_reserve=LLM_EXPANSION_RESERVE):
+        self.requests = TokenBucket(rpm, burst or rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.expected_output_tokens = expected_output_tokens
+        self.expansion_reserve = expansion_reserve
+        self.active = 0
+        self.paused_until = 0.0
+        self._queue = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.stats = {"calls": 0, "retries": 0, "rate_limited": 0, "failures": 0, "budget_timeouts": 0,
+                      "expansions_skipped": 0, "wait_seconds": 0.0}
+
+    # --- admission ---
+
+    def _enqueue(self, priority, tokens):
+        ticket = Ticket(PRIORITIES[priority], next(self._seq), tokens)
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            # The head of the queue may have changed: whoever waits for it must re-check
+            self._cond.notify_all()
+        return ticket
+
+    def _poll(self, ticket):
+        """Under the lock: starts the ticket if it is first in line and the budget allows (-> 0), else seconds to wait."""
+        if self._queue[0] is not ticket or self.active >= self.max_concurrency:
+            return None
+        now = time.monotonic()
+        token_wait = 0.0 if ticket.reserved else self.tokens.wait_time(ticket.tokens, now)
+        wait = max(self.requests.wait_time(1, now), token_wait, self.paused_until - now)
+        if wait > 0:
+            return wait
+        heapq.heappop(self._queue)
+        # Every attempt is a request; its tokens are reserved only once per ticket
+        self.requests.take(1)
+        if not ticket.reserved:
+            self.tokens.take(ticket.tokens)
+            ticket.reserved = True
+        self.active += 1
+        self._cond.notify_all()
+        return 0.0
+
+    def _give_up(self, ticket):
+        with self._cond:
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+            self.stats["budget_timeouts"] += 1
+            self._cond.notify_all()
+        raise LLMBudgetExceeded("LLM request budget exhausted, try again shortly")
+
+    def acquire(self, ticket, deadline=None):
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                wait = self._poll(ticket)
+                if wait == 0.0:
+                    break
+                now = time.monotonic()
+                if deadline is not None and (now >= deadline or (wait is not None and now + wait > deadline)):
+                    break
+                timeout = wait if wait is not None else None
+                if deadline is not None:
+                    timeout = min(timeout if timeout is not None else deadline - now, deadline - now)
+                self._cond.wait(timeout)
+        if wait != 0.0:
+            self._give_up(ticket)
+        self._account_wait(ticket, time.monotonic() - start)
+
+    async def aacquire(self, ticket, deadline=None):
+        start = time.monotonic()
+        while True:
+            with self._cond:
+                wait = self._poll(ticket)
+            if wait == 0.0:
+                break
+            now = time.monotonic()
+            if deadline is not None and (now >= deadline or (wait is not None and now + wait > deadline)):
+                self._give_up(ticket)
+            await asyncio.sleep(min(wait if wait is not None else POLL_SECONDS, 0.25))
+        self._account_wait(ticket, time.monotonic() - start)
+
+    def _account_wait(self, ticket, waited):
+        ticket.waited += waited
+        with self._cond:
+            self.stats["wait_seconds"] += waited
+
+    def release(self, ticket, used_tokens=None):
+        """Frees the slot; with the provider-reported token usage the reservation is settled."""
+        with self._cond:
+            self.active -= 1
+            if used_tokens is not None:
+                self.tokens.give_back(ticket.tokens - used_tokens)
+            self._cond.notify_all()
+
+    def should_skip_expansion(self, prompt_tokens=0):
+        """
+        Graceful degradation: query generation is skipped (local expansion instead) when answer
+        calls are waiting, the request bucket is down to its answer reserve, or the provider paused us.
+        """
+        with self._cond:
+            now = time.monotonic()
+            tight = (
+                any(ticket.priority == PRIORITIES["answer"] for ticket in self._queue)
+                or self.paused_until > now
+                or self.requests.wait_time(1 + self.expansion_reserve * self.requests.capacity, now) > 0
+                or self.tokens.wait_time(prompt_tokens + self.expected_output_tokens, now) > 0
+            )
+        if tight:
+            self.record_skipped_expansion()
+        return tight
+
+    def record_skipped_expansion(self):
+        with self._cond:
+            self.stats["expansions_skipped"] += 1
+
+    # --- retries ---
+
+    def _backoff(self, error, ticket, deadline):
+        """Seconds to wait before the next attempt; raises if the error is final."""
+        if not is_retryable(error):
+            raise error
+        if ticket.attempts > self.max_retries:
+            with self._cond:
+                self.stats["failures"] += 1
+            raise LLMUnavailableError(f"LLM unavailable after {ticket.attempts} attempt(s): {error}",
+                                      retry_after=retry_after(error)) from error
+        with self._cond:
+            self.stats["retries"] += 1
+
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (ticket.attempts - 1)))
+        hint = retry_after(error)
+        if hint is not None:
+            delay = hint + random.uniform(0, self.backoff_base)
+        if is_rate_limit(error):
+            # The quota is shared: stop everyone, not just this caller
+            with self._cond:
+                self.stats["rate_limited"] += 1
+                self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                self.requests.level = min(self.requests.level, 0.0)
+            delay = 0.0
+        if deadline is not None and time.monotonic() + delay > deadline:
+            with self._cond:
+                self.stats["failures"] += 1
+            raise LLMUnavailableError(f"LLM unavailable: {error}", retry_after=retry_after(error)) from error
+        return delay
+
+    def run(self, start, priority="answer", prompt_tokens=0, max_wait=None, on_start=None):
+        """
+        Calls start() once admitted, retrying rate-limit / transient errors.
+        Returns (result, ticket); the caller must release(ticket) once the response is consumed
+        (streams hold their slot until the last chunk). on_start(ticket) runs before each attempt.
+        """
+        deadline = time.monotonic() + max_wait if max_wait is not None else None
+        ticket = self._enqueue(priority, prompt_tokens + self.expected_output_tokens)
+        while True:
+            self.acquire(ticket, deadline)
+            ticket.attempts += 1
+            with self._cond:
+                self.stats["calls"] += 1
+            if on_start is not None:
+                on_start(ticket)
+            try:
+                return start(), ticket
+            except Exception as e:
+                self.release(ticket)
+                delay = self._backoff(e, ticket, deadline)
+                if delay:
+                    time.sleep(delay)
+                ticket = self._requeue(ticket)
+
+    async def arun(self, start, priority="answer", prompt_tokens=0, max_wait=None, on_start=None):
+        """Async twin of run: start() returns an awaitable."""
+        deadline = time.monotonic() + max_wait if max_wait is not None else None
+        ticket = self._enqueue(priority, prompt_tokens + self.expected_output_tokens)
+        while True:
+            await self.aacquire(ticket, deadline)
+            ticket.attempts += 1
+            with self._cond:
+                self.stats["calls"] += 1
+            if on_start is not None:
+                on_start(ticket)
+            try:
+                return await start(), ticket
+            except Exception as e:
+                self.release(ticket)
+                delay = self._backoff(e, ticket, deadline)
+                if delay:
+                    await asyncio.sleep(delay)
+                ticket = self._requeue(ticket)
+
+    def _requeue(self, ticket):
+        # A retry keeps its original place in line
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            self._cond.notify_all()
+        return ticket
+
+    def snapshot(self):
+        with self._cond:
+            now = time.monotonic()
+            self.requests._refill(now)
+            self.tokens._refill(now)
+            return dict(self.stats, active=self.active, queued=len(self._queue),
+                        requests_available=round(self.requests.level, 2), tokens_available=round(self.tokens.level),
+                        paused_seconds=round(max(self.paused_until - now, 0.0), 3))
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """The process-wide scheduler (None if LLM_SCHEDULER_ENABLED is off)."""
+    global _scheduler
+    if not LLM_SCHEDULER_ENABLED:
+        return None
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler()
+    return _scheduler
+
+
+# --- UNIT TEST ---
+if __name__ == "__main__":
+    class RateLimited(Exception):
+        status_code = 429
+        retry_after = 0.2
+
+    # Retries: two 429s, then success; the pause applies to the whole scheduler
+    scheduler = LLMScheduler(rpm=600, tpm=6000, burst=5, backoff_base=0.05)
+    failures = iter([RateLimited(), RateLimited()])
+
+    def flaky():
+        error = next(failures, None)
+        if error:
+            raise error
+        return "ok"
+
+    result, ticket = scheduler.run(flaky, prompt_tokens=1000)
+    scheduler.release(ticket)
+    snapshot = scheduler.snapshot()
+    print(result, snapshot)
+    assert result == "ok" and ticket.attempts == 3 and scheduler.stats["rate_limited"] == 2
+    # The retries reuse the first attempt's token reservation instead of taking it three times
+    assert snapshot["tokens_available"] > scheduler.tokens.capacity - 2 * ticket.tokens
+
+    # Priority: with one slot busy, an answer call queued after an expansion call goes first
+    scheduler = LLMScheduler(rpm=6000, tpm=1000000, max_concurrency=1)
+    _, busy = scheduler.run(lambda: None)
+    order = []
+    threads = [
+        threading.Thread(target=lambda p=p: scheduler.release(scheduler.run(lambda: order.append(p), priority=p)[1]))
+        for p in ("expansion", "answer")
+    ]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    assert scheduler.should_skip_expansion()
+    scheduler.release(busy)
+    for thread in threads:
+        thread.join()
+    print(order)
+    assert order == ["answer", "expansion"]
+
+    # Budget: an expansion call that cannot get a request within max_wait gives up
+    scheduler = LLMScheduler(rpm=60, burst=1)
+    scheduler.release(scheduler.run(lambda: None)[1])
+    try:
+        scheduler.run(lambda: None, priority="expansion", max_wait=0.1)
+        raise AssertionError("expected LLMBudgetExceeded")
+    except LLMBudgetExceeded:
+        pass
+    print("✅ LLM scheduler OK")
@@ -1,45 +1,177 @@
 import os
 import sys
+import json
 import glob
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from langchain_community.document_loaders import PyPDFLoader
 
 # --- THE FIX: Add parent directory to path so 'src' imports work ---
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 # -------------------------------------------------------------------
 
-from src.config import DATA_DIR
+from langchain_core.documents import Document
+from src.config import DATA_DIR, LOADER_WORKERS, PAGE_CACHE_DIR
+from src.generations import generation_dir, list_generations
+from src.manifest import file_hash, load_manifest
+from src.spec_index import extract_spec_rows
 
-def load_documents():
+# Parsed pages served from / added to PAGE_CACHE_DIR in this process (chunk_sweep.py reports them)
+page_cache_stats = {"hits": 0, "misses": 0}
+
+def list_pdf_files():
     """
-    Scans the DATA_DIR for PDF files and loads them.
-    Returns: A list of LangChain Document objects.
+    Returns the sorted list of PDF paths inside DATA_DIR (empty if the folder is missing).
     """
     # Verify directory exists first
     if not os.path.exists(DATA_DIR):
         print(f" Error: Directory not found at {DATA_DIR}")
         return []
 
-    pdf_files = glob.glob(os.path.join(DATA_DIR, "*.pdf"))
-    
+    return sorted(glob.glob(os.path.join(DATA_DIR, "*.pdf")))
+
+def _load_pdf(pdf_path):
+    """
+    Parses a single PDF. Runs inside a worker process, so it never raises:
+    Returns: (pdf_path, pages, error_message_or_None)
+    """
+    try:
+        return pdf_path, PyPDFLoader(pdf_path).load(), None
+    except Exception as e:
+        return pdf_path, [], str(e)
+
+def _page_cache_path(pdf_path, digest=None):
+    return os.path.join(PAGE_CACHE_DIR, f"{digest or file_hash(pdf_path)}.json")
+
+def _cached_pages(pdf_path, digest=None):
+    """Pages parsed from the same bytes before (any path), or None."""
+    if not PAGE_CACHE_DIR:
+        return None
+    try:
+        with open(_page_cache_path(pdf_path, digest), "r", encoding="utf-8") as f:
+            pages = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return [Document(page_content=page["text"], metadata=dict(page["metadata"], source=pdf_path)) for page in pages]
+
+def _cache_pages(pdf_path, pages, digest=None):
+    """Writes parsed pages to PAGE_CACHE_DIR (tmp file + rename); the path is not part of the entry."""
+    if not PAGE_CACHE_DIR or not pages:
+        return
+    path = _page_cache_path(pdf_path, digest)
+    os.makedirs(PAGE_CACHE_DIR, exist_ok=True)
+    entries = [{"text": page.page_content,
+                "metadata": {k: v for k, v in page.metadata.items() if k != "source"}} for page in pages]
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def prune_page_cache():
+    """
+    Deletes cached pages of PDF revisions that no index generation in DB_DIR refers to
+    any more (superseded or removed files). Returns the number of entries deleted.
+    """
+    if not PAGE_CACHE_DIR or not os.path.isdir(PAGE_CACHE_DIR):
+        return 0
+    known = {
+        entry.get("file_hash")
+        for generation in list_generations()
+        for entry in load_manifest(generation_dir(generation))["sources"].values()
+    }
+    removed = 0
+    for name in os.listdir(PAGE_CACHE_DIR):
+        if name.endswith(".json") and name[:-len(".json")] not in known:
+            os.remove(os.path.join(PAGE_CACHE_DIR, name))
+            removed += 1
+    if removed:
+        print(f" Removed {removed} outdated page cache entr{'y' if removed == 1 else 'ies'}")
+    return removed
+
+def _report(pdf_path, pages, error):
+    if error:
+        print(f"  Error loading {os.path.basename(pdf_path)}: {error}")
+    else:
+        print(f"   - Loaded {len(pages)} pages from {os.path.basename(pdf_path)}")
+
+def iter_documents(pdf_files=None, max_workers=None, spec_rows=None, file_hashes=None):
+    """
+    Parses PDFs in a process pool and yields their pages as each file finishes.
+    Pages of one PDF are always yielded together (in page order), and at most
+    2 x max_workers parsed files are held in memory at any time.
+    If a dict is passed as spec_rows, the key/value rows of each file's spec table
+    are extracted into spec_rows[pdf_path] while its pages are at hand.
+    Files parsed before (same bytes, PAGE_CACHE_DIR) are read from the page cache first;
+    pass the {pdf_path: file_hash} already computed (plan_ingestion) to skip re-hashing them.
+    """
+    file_hashes = file_hashes or {}
+    if pdf_files is None:
+        pdf_files = list_pdf_files()
+
     if not pdf_files:
         print(f" No PDFs found in {DATA_DIR}")
-        return []
+        return
 
-    print(f" Found {len(pdf_files)} PDF(s) in {DATA_DIR}...")
-    
-    all_documents = []
-    
+    to_parse = []
     for pdf_path in pdf_files:
-        try:
-            print(f"   - Loading: {os.path.basename(pdf_path)}")
-            loader = PyPDFLoader(pdf_path)
-            docs = loader.load()
-            all_documents.extend(docs)
-            print(f"     Loaded {len(docs)} pages.")
-            
-        except Exception as e:
-            print(f"  Error loading {os.path.basename(pdf_path)}: {e}")
+        pages = _cached_pages(pdf_path, file_hashes.get(pdf_path))
+        if pages is None:
+            to_parse.append(pdf_path)
+            continue
+        page_cache_stats["hits"] += 1
+        if spec_rows is not None:
+            spec_rows[pdf_path] = extract_spec_rows(pages)
+        yield from pages
+    page_cache_stats["misses"] += len(to_parse)
+    if len(to_parse) < len(pdf_files):
+        print(f" Read {len(pdf_files) - len(to_parse)} PDF(s) from the page cache")
+    pdf_files = to_parse
+    if not pdf_files:
+        return
+
+    max_workers = min(max_workers or LOADER_WORKERS or os.cpu_count() or 1, len(pdf_files))
+    print(f" Found {len(pdf_files)} PDF(s) to load ({max_workers} worker(s))...")
+
+    # A pool is pure overhead for a single file / single worker
+    if max_workers == 1:
+        for pdf_path in pdf_files:
+            pdf_path, pages, error = _load_pdf(pdf_path)
+            _report(pdf_path, pages, error)
+            if not error:
+                _cache_pages(pdf_path, pages, file_hashes.get(pdf_path))
+            if spec_rows is not None and not error:
+                spec_rows[pdf_path] = extract_spec_rows(pages)
+            yield from pages
+        return
 
+    pending_paths = iter(pdf_files)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        in_flight = set()
+        for pdf_path in pending_paths:
+            in_flight.add(pool.submit(_load_pdf, pdf_path))
+            if len(in_flight) >= 2 * max_workers:
+                break
+
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                pdf_path, pages, error = future.result()
+                _report(pdf_path, pages, error)
+                if not error:
+                    _cache_pages(pdf_path, pages, file_hashes.get(pdf_path))
+                if spec_rows is not None and not error:
+                    spec_rows[pdf_path] = extract_spec_rows(pages)
+                yield from pages
+
+                next_path = next(pending_paths, None)
+                if next_path is not None:
+                    in_flight.add(pool.submit(_load_pdf, next_path))
+
+def load_documents(pdf_files=None, max_workers=None):
+    """
+    Loads the given PDF files (defaults to every PDF in DATA_DIR).
+    Returns: A list of LangChain Document objects.
+    """
+    all_documents = list(iter_documents(pdf_files, max_workers=max_workers))
     print(f"Total Loaded Pages: {len(all_documents)}")
     return all_documents
 
@@ -49,4 +181,4 @@ if __name__ == "__main__":
     if len(docs) > 0:
         print("\n--- CONTENT PREVIEW (First 500 chars) ---")
         print(docs[0].page_content[:500])
-        print("-----------------------------------------")
\ No newline at end of file
+        print("-----------------------------------------")
@@ -0,0 +1,137 @@
+import os
+import sys
+import json
+import hashlib
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.generations import get_db_dir
+
+MANIFEST_FILENAME = "ingest_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_hash(path, block_size=1 << 20):
+    """SHA-256 of a file's bytes (streamed, so big manuals don't sit in memory)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def assign_chunk_ids(chunks, seen=None):
+    """
+    Gives every chunk a stable, content-derived id (source + page + text).
+    Identical chunks on the same page get an occurrence suffix so ids stay unique.
+    Pass the same `seen` dict across batches when chunks arrive as a stream.
+    Returns: list of ids, aligned with `chunks`.
+    """
+    seen = {} if seen is None else seen
+    ids = []
+    for chunk in chunks:
+        key = "\x00".join([
+            str(chunk.metadata.get("source", "")),
+            str(chunk.metadata.get("page", "")),
+            chunk.page_content,
+        ])
+        base = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        count = seen.get(base, 0)
+        seen[base] = count + 1
+        ids.append(base if count == 0 else f"{base}-{count}")
+    return ids
+
+
+def _manifest_path(db_dir=None):
+    return os.path.join(db_dir or get_db_dir(), MANIFEST_FILENAME)
+
+
+def load_manifest(db_dir=None):
+    """
+    Reads the ingestion manifest that sits next to the vector store files.
+    Layout: {"version": 1, "sources": {pdf_path: {"file_hash": ..., "chunk_ids": [...]}}}
+    plus the settings the index was built with ("embedding_model", "vector_backend", "chunking").
+    """
+    path = _manifest_path(db_dir)
+    if not os.path.exists(path):
+        return {"version": MANIFEST_VERSION, "sources": {}}
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f" Warning: Ignoring unreadable manifest at {path}: {e}")
+        return {"version": MANIFEST_VERSION, "sources": {}}
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        print(" Warning: Manifest version changed, every PDF will be re-ingested.")
+        return {"version": MANIFEST_VERSION, "sources": {}}
+
+    manifest.setdefault("sources", {})
+    return manifest
+
+
+def save_manifest(manifest, db_dir=None):
+    """Writes the manifest atomically (tmp file + rename)."""
+    path = _manifest_path(db_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def plan_ingestion(manifest, pdf_files):
+    """
+    Compares the PDFs on disk with the manifest.
+    Returns: (changed, removed, file_hashes)
+      changed     -> paths that are new or whose bytes changed
+      removed     -> paths in the manifest that no longer exist on disk
+      file_hashes -> {path: sha256} for every PDF on disk
+    """
+    known = manifest["sources"]
+    file_hashes = {path: file_hash(path) for path in pdf_files}
+
+    changed = [
+        path for path, digest in file_hashes.items()
+        if known.get(path, {}).get("file_hash") != digest
+    ]
+    removed = [path for path in known if path not in file_hashes]
+    return changed, removed, file_hashes
+
+
+# Manifest settings that change the chunks (and so the answers) without touching the PDFs
+VERSIONED_SETTINGS = ("embedding_model", "vector_backend", "chunking")
+
+
+# (path, mtime) -> manifest, so frequent version checks don't re-parse the JSON
+_version_cache = {}
+
+
+def index_version(source=None, db_dir=None):
+    """
+    Identifies the indexed content of one PDF (its file hash), or of the whole
+    index when source is None, together with the settings it was chunked and
+    embedded with. Changes whenever that content is re-ingested or re-built.
+    """
+    path = _manifest_path(db_dir)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    cached = _version_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        manifest = load_manifest(db_dir)
+        settings = json.dumps([manifest.get(key) for key in VERSIONED_SETTINGS])
+        versions = {
+            src: hashlib.sha256(f"{entry.get('file_hash')}\x00{settings}".encode("utf-8")).hexdigest()
+            for src, entry in manifest["sources"].items()
+        }
+        overall = hashlib.sha256(json.dumps(sorted(versions.items())).encode("utf-8")).hexdigest()
+        cached = (mtime, versions, overall)
+        _version_cache[path] = cached
+
+    _, versions, overall = cached
+    return overall if source is None else versions.get(source)
@@ -0,0 +1,390 @@
+import os
+import sys
+import json
+import uuid
+import shutil
+import threading
+import numpy as np
+from typing import Any, Iterable, List, Optional
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.generations import get_db_dir
+from src.bm25_index import ALL_PARTITION, partition_name
+from src.chunk_store import load_chunk_store
+
+# In-process dense index (VECTOR_BACKEND=numpy): one block per source PDF, named like
+# the BM25 partitions, so a product-locked lookup only touches that product's vectors.
+#   dense/<partition>/vectors.npy  -> float16 unit vectors, memory-mapped at query time
+#   dense/<partition>/chunks.json  -> chunk ids, texts, metadatas (queries read hits from the chunk store)
+# Writes are buffered per block and written once by flush() (ingestion calls it before the
+# side indexes; reads flush first). dense/__all__ concatenates every block for unfiltered
+# search; a flush that changes any block drops it and ingestion rebuilds it (consolidate).
+DENSE_DIRNAME = "dense"
+# Rows converted to float32 per matrix product (bounds the temporary copy for big blocks)
+SCORE_ROWS = 8192
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+class DenseBlock:
+    """
+    A loaded (memory-mapped) block of chunk vectors. Only the chunk ids stay in memory
+    (one fixed-width bytes array); texts + metadata of the hits come from the chunk store.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        ids = self.chunks()[0]
+        self.ids = np.array(ids, dtype="S") if ids else np.zeros(0, dtype="S1")
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r") if ids \
+            else np.zeros((0, 0), dtype=np.float16)
+        # Chunk store rows of the block's rows, resolved on the first query
+        self._store = None
+        self._rows = None
+
+    def chunks(self):
+        """(ids, texts, metadatas) as written: read from disk on every call (writes + get only)."""
+        with open(os.path.join(self.path, "chunks.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return meta["ids"], meta["texts"], meta["metadatas"]
+
+    def scores(self, query_vector):
+        """Cosine similarity of every row (vectors are stored unit-length)."""
+        return self.scores_batch(np.asarray(query_vector, dtype=np.float32)[None, :])[0]
+
+    def scores_batch(self, query_vectors):
+        """Cosine similarities of many unit query vectors (m, dim) at once: (m, rows), one matrix product per slice."""
+        scores = np.empty((len(query_vectors), len(self.ids)), dtype=np.float32)
+        for start in range(0, len(self.ids), SCORE_ROWS):
+            rows = np.asarray(self.vectors[start:start + SCORE_ROWS], dtype=np.float32)
+            scores[:, start:start + len(rows)] = query_vectors @ rows.T
+        return scores
+
+    def top_k(self, query_vector, k):
+        """Exact top-k: [(row, score)] best first."""
+        return self.top_k_batch(np.asarray(query_vector, dtype=np.float32)[None, :], k)[0]
+
+    def top_k_batch(self, query_vectors, k):
+        """top_k of every query vector: [[(row, score)], ...]."""
+        k = min(k, len(self.ids))
+        if k <= 0:
+            return [[] for _ in query_vectors]
+        results = []
+        for scores in self.scores_batch(query_vectors):
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            results.append([(int(i), float(scores[i])) for i in top])
+        return results
+
+    def document(self, row):
+        # The store of the generation this block belongs to (<db_dir>/dense/<block>)
+        try:
+            store = load_chunk_store(os.path.dirname(os.path.dirname(self.path)))
+        except FileNotFoundError:
+            store = None
+        if store is not None:
+            if store is not self._store:
+                self._rows, self._store = store.rows_of(self.ids), store
+            if self._rows[row] >= 0:
+                return store.document(int(self._rows[row]))
+        # Chunk missing from the store (mid-ingestion, or an index from before the store)
+        _, texts, metadatas = self.chunks()
+        return Document(page_content=texts[row], metadata=metadatas[row])
+
+
+def write_block(path, ids, texts, metadatas, vectors):
+    """Writes a block into a temp folder, then swaps it in (readers never see half a block)."""
+    tmp_dir = path + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    np.save(os.path.join(tmp_dir, "vectors.npy"), np.asarray(vectors, dtype=np.float16))
+    with open(os.path.join(tmp_dir, "chunks.json"), "w", encoding="utf-8") as f:
+        json.dump({"ids": list(ids), "texts": list(texts), "metadatas": list(metadatas)}, f)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_dir, path)
+    _forget(path)
+
+
+def delete_block(path):
+    shutil.rmtree(path, ignore_errors=True)
+    _forget(path)
+
+
+# Loaded blocks are shared by every store / retriever in the process
+_blocks = {}
+_blocks_lock = threading.Lock()
+
+
+def _forget(path):
+    with _blocks_lock:
+        _blocks.pop(path, None)
+
+
+def load_block(path):
+    """Lazily loads (and memoizes) a block. Raises FileNotFoundError if it does not exist."""
+    with _blocks_lock:
+        if path not in _blocks:
+            if not os.path.exists(os.path.join(path, "chunks.json")):
+                raise FileNotFoundError(f"Dense block not found: {path}")
+            _blocks[path] = DenseBlock(path)
+        return _blocks[path]
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Exact-search vector store over memory-mapped float16 blocks. Implements the part
+    of the Chroma API this project uses (add_documents/add_texts as upsert, delete,
+    get(where={"source": ...}), similarity_search with filter={"source": ...} or
+    {"source": {"$in": [...]}}),
+    so it plugs into create_vector_db and get_retriever unchanged.
+
+    add_texts / delete only buffer: each touched block is rewritten once, by flush().
+    """
+
+    def __init__(self, embedding_function, persist_directory=None):
+        self._embedding_function = embedding_function
+        self.root = os.path.join(persist_directory or get_db_dir(), DENSE_DIRNAME)
+        self._write_lock = threading.Lock()
+        # Block path -> {"rows": {id: (text, metadata, vector)} to upsert, "dropped": ids to delete}
+        self._pending = {}
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    # --- layout ---
+
+    def _source_path(self, source):
+        return os.path.join(self.root, partition_name(source))
+
+    def _block_paths(self):
+        if not os.path.isdir(self.root):
+            return []
+        return [
+            os.path.join(self.root, name) for name in sorted(os.listdir(self.root))
+            if name != ALL_PARTITION and os.path.exists(os.path.join(self.root, name, "chunks.json"))
+        ]
+
+    def _load(self, path):
+        try:
+            return load_block(path)
+        except FileNotFoundError:
+            return None
+
+    # --- writes ---
+
+    def _pending_block(self, path):
+        return self._pending.setdefault(path, {"rows": {}, "dropped": set()})
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas else [{} for _ in texts]
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        if not texts:
+            return ids
+        vectors = _normalize(self._embedding_function.embed_documents(texts)).astype(np.float16)
+
+        with self._write_lock:
+            for cid, text, metadata, vector in zip(ids, texts, metadatas, vectors):
+                rows = self._pending_block(self._source_path(metadata.get("source", "")))["rows"]
+                # Upsert (like Chroma): a re-added id replaces its old row and moves to the end
+                rows.pop(cid, None)
+                rows[cid] = (text, metadata, vector)
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[dict] = None,
+               **kwargs: Any) -> Optional[bool]:
+        """Deletes chunks by id. where={"source": ...} limits the lookup to that source's block."""
+        doomed = set(ids or [])
+        if not doomed:
+            return False
+        with self._write_lock:
+            if where and set(where) == {"source"}:
+                paths = [self._source_path(where["source"])]
+            else:
+                # No source given: the blocks holding any of the ids (block ids are kept in memory)
+                wanted = {cid.encode("utf-8") for cid in doomed}
+                paths = list(self._pending) + [
+                    path for path in self._block_paths()
+                    if path not in self._pending and not wanted.isdisjoint(load_block(path).ids.tolist())
+                ]
+            for path in paths:
+                pending = self._pending_block(path)
+                for cid in doomed:
+                    pending["rows"].pop(cid, None)
+                pending["dropped"] |= doomed
+        return True
+
+    def flush(self):
+        """Writes the buffered adds / deletes: every touched block once. Returns the number of blocks written."""
+        written = 0
+        with self._write_lock:
+            pending, self._pending = self._pending, {}
+            for path, changes in pending.items():
+                block = self._load(path)
+                old_ids, old_texts, old_metadatas = block.chunks() if block else ([], [], [])
+                rows = changes["rows"]
+                keep = [i for i, cid in enumerate(old_ids) if cid not in rows and cid not in changes["dropped"]]
+                if not rows and len(keep) == len(old_ids):
+                    continue
+                written += 1
+                if not keep and not rows:
+                    delete_block(path)
+                    continue
+                vectors = [np.asarray(block.vectors[keep], dtype=np.float16)] if keep else []
+                if rows:
+                    vectors.append(np.stack([vector for _, _, vector in rows.values()]))
+                write_block(
+                    path,
+                    [old_ids[i] for i in keep] + list(rows),
+                    [old_texts[i] for i in keep] + [text for text, _, _ in rows.values()],
+                    [old_metadatas[i] for i in keep] + [metadata for _, metadata, _ in rows.values()],
+                    np.concatenate(vectors),
+                )
+            if written:
+                delete_block(os.path.join(self.root, ALL_PARTITION))
+        return written
+
+    def consolidate(self, if_missing=False):
+        """(Re)builds the all-sources block used by unfiltered search. Returns False if it was kept."""
+        all_path = os.path.join(self.root, ALL_PARTITION)
+        ids, texts, metadatas, vectors = [], [], [], []
+        self.flush()
+        with self._write_lock:
+            if if_missing and os.path.exists(os.path.join(all_path, "chunks.json")):
+                return False
+            for path in self._block_paths():
+                block = load_block(path)
+                block_ids, block_texts, block_metadatas = block.chunks()
+                ids.extend(block_ids)
+                texts.extend(block_texts)
+                metadatas.extend(block_metadatas)
+                vectors.append(np.asarray(block.vectors))
+            write_block(
+                all_path, ids, texts, metadatas,
+                np.concatenate(vectors) if vectors else np.zeros((0, 0), dtype=np.float16)
+            )
+        print(f"   - Dense block built for all sources ({len(ids)} chunks)")
+        return True
+
+    # --- reads ---
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[dict] = None,
+            include: Optional[List[str]] = None, **kwargs: Any) -> dict:
+        """Chroma-style get: {"ids", "documents", "metadatas"} (+ "embeddings" if included) of the matching chunks."""
+        if self._pending:
+            self.flush()
+        if where and set(where) == {"source"}:
+            paths = [self._source_path(where["source"])]
+        else:
+            paths = self._block_paths()
+        wanted = set(ids) if ids else None
+        with_vectors = "embeddings" in (include or ())
+
+        result = {"ids": [], "documents": [], "metadatas": []}
+        vectors = []
+        for path in paths:
+            block = self._load(path)
+            if block is None:
+                continue
+            block_ids, texts, metadatas = block.chunks()
+            for i, cid in enumerate(block_ids):
+                if wanted is not None and cid not in wanted:
+                    continue
+                if where and any(metadatas[i].get(key) != value for key, value in where.items()):
+                    continue
+                result["ids"].append(cid)
+                result["documents"].append(texts[i])
+                result["metadatas"].append(metadatas[i])
+                if with_vectors:
+                    vectors.append(np.asarray(block.vectors[i], dtype=np.float32))
+        if with_vectors:
+            result["embeddings"] = vectors
+        return result
+
+    def _search_blocks(self, filter):
+        """Blocks to scan: the all-sources block, one product's, or those of {"source": {"$in": [...]}}."""
+        if self._pending:
+            self.flush()
+        if not filter:
+            path = os.path.join(self.root, ALL_PARTITION)
+            if not os.path.exists(os.path.join(path, "chunks.json")):
+                # Built by ingestion (sync_side_indexes); queries never write into a published index
+                raise FileNotFoundError(f"Dense block for all sources missing in {self.root}: "
+                                        f"run 'python src/vector_store.py --ingest' to build it")
+            return [self._load(path)]
+        if set(filter) != {"source"}:
+            raise ValueError(f"NumpyVectorStore only supports filter={{'source': ...}}, got {filter!r}")
+        sources = filter["source"]
+        if isinstance(sources, dict):
+            if set(sources) != {"$in"}:
+                raise ValueError(f"NumpyVectorStore only supports {{'$in': [...]}} source lists, got {sources!r}")
+            return [self._load(self._source_path(source)) for source in sources["$in"]]
+        return [self._load(self._source_path(sources))]
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[dict] = None, **kwargs: Any):
+        """[(Document, cosine similarity)] best first."""
+        query_vector = _normalize(embedding)[0]
+        hits = [
+            (score, block, row)
+            for block in self._search_blocks(filter) if block is not None
+            for row, score in block.top_k(query_vector, k)
+        ]
+        hits.sort(key=lambda hit: -hit[0])
+        return [(block.document(row), score) for score, block, row in hits[:k]]
+
+    def similarity_search_by_vectors(self, embeddings: List[List[float]], k: int = 4,
+                                     filter: Optional[dict] = None) -> List[List[Document]]:
+        """similarity_search_by_vector for many query vectors: each block is scored once for all of them."""
+        if not len(embeddings):
+            return []
+        query_vectors = _normalize(embeddings)
+        hits = [[] for _ in range(len(query_vectors))]
+        for block in self._search_blocks(filter):
+            if block is None:
+                continue
+            for query_hits, block_hits in zip(hits, block.top_k_batch(query_vectors, k)):
+                query_hits.extend((score, block, row) for row, score in block_hits)
+        results = []
+        for query_hits in hits:
+            query_hits.sort(key=lambda hit: -hit[0])
+            results.append([block.document(row) for _, block, row in query_hits[:k]])
+        return results
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any):
+        return self.similarity_search_by_vector_with_score(
+            self._embedding_function.embed_query(query), k=k, filter=filter
+        )
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4,
+                                    filter: Optional[dict] = None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, filter=filter)]
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def _select_relevance_score_fn(self):
+        # Scores are already cosine similarities
+        return lambda score: score
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, persist_directory=None, **kwargs: Any):
+        store = cls(embedding_function=embedding, persist_directory=persist_directory)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        store.flush()
+        return store
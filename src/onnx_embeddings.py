@@ -0,0 +1,177 @@
+import os
+import sys
+import time
+import inspect
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.config import EMBEDDING_MODEL_NAME, ONNX_MODEL_DIR, ONNX_MIN_COSINE, EMBED_BATCH_SIZE
+
+FP32_FILENAME = "model.onnx"
+INT8_FILENAME = "model.int8.onnx"
+TOKENIZER_FILENAME = "tokenizer.json"
+# all-MiniLM-L6-v2 was trained with 256-token inputs (sentence-transformers max_seq_length)
+MAX_LENGTH = 256
+
+
+def export_onnx_model(output_dir=None, quantize=True):
+    """
+    Exports EMBEDDING_MODEL_NAME's transformer to ONNX (dynamic batch + sequence axes)
+    and, by default, writes a dynamically int8-quantized copy next to it.
+    Needs torch / sentence-transformers / onnx (only at export time).
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    output_dir = output_dir or ONNX_MODEL_DIR
+    os.makedirs(output_dir, exist_ok=True)
+
+    print(f" Loading {EMBEDDING_MODEL_NAME} for export...")
+    st_model = SentenceTransformer(EMBEDDING_MODEL_NAME, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    fp32_path = os.path.join(output_dir, FP32_FILENAME)
+    dynamic = {0: "batch", 1: "sequence"}
+    # Newer torch defaults to the dynamo exporter; the TorchScript one handles dynamic_axes here
+    legacy = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={"input_ids": dynamic, "attention_mask": dynamic,
+                          "token_type_ids": dynamic, "last_hidden_state": dynamic},
+            opset_version=14,
+            **legacy,
+        )
+    print(f" Exported FP32 model to {fp32_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        int8_path = os.path.join(output_dir, INT8_FILENAME)
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        print(f" Wrote int8-quantized model to {int8_path} "
+              f"({os.path.getsize(int8_path) / 1e6:.1f} MB vs {os.path.getsize(fp32_path) / 1e6:.1f} MB)")
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    CPU embedding backend: onnxruntime + the fast Rust tokenizer, mean pooling and
+    L2 normalisation (same pipeline as the sentence-transformers model).
+    """
+
+    def __init__(self, model_dir=None, quantized=True, batch_size=None, threads=None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_dir = model_dir or ONNX_MODEL_DIR
+        model_path = os.path.join(model_dir, INT8_FILENAME if quantized else FP32_FILENAME)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"ONNX model not found at {model_path}. Run: python src/onnx_embeddings.py --export"
+            )
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILENAME))
+        self.tokenizer.enable_truncation(max_length=MAX_LENGTH)
+        self.tokenizer.enable_padding()
+        self.batch_size = batch_size or EMBED_BATCH_SIZE
+
+    def _encode(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        hidden = self.session.run(None, feeds)[0]
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts):
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.append(self._encode(list(texts[start:start + self.batch_size])))
+        return np.concatenate(vectors).tolist() if vectors else []
+
+    def embed_query(self, text):
+        return self._encode([text])[0].tolist()
+
+
+def validate_against_pytorch(texts, min_cosine=None, model_dir=None):
+    """
+    Cosine-similarity tolerance test: every ONNX vector must be within min_cosine
+    of the PyTorch (HuggingFaceEmbeddings) vector for the same text.
+    """
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    min_cosine = ONNX_MIN_COSINE if min_cosine is None else min_cosine
+    torch_vectors = np.asarray(HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME).embed_documents(texts))
+    onnx_vectors = np.asarray(OnnxEmbeddings(model_dir=model_dir).embed_documents(texts))
+
+    torch_vectors /= np.linalg.norm(torch_vectors, axis=1, keepdims=True)
+    cosines = (torch_vectors * onnx_vectors).sum(axis=1)
+    passed = bool(cosines.min() >= min_cosine)
+    print(f" ONNX vs PyTorch cosine: min {cosines.min():.4f}, mean {cosines.mean():.4f} "
+          f"(tolerance {min_cosine}) -> {'PASS' if passed else 'FAIL'}")
+    return passed
+
+
+def benchmark_query_embedding(queries, repeats=20, model_dir=None):
+    """Single-query embedding latency, PyTorch vs ONNX int8 (what every dense lookup pays)."""
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    backends = {
+        "torch": HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME),
+        "onnx-int8": OnnxEmbeddings(model_dir=model_dir),
+    }
+    for name, backend in backends.items():
+        backend.embed_query(queries[0])  # warm-up
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for query in queries:
+                backend.embed_query(query)
+        per_query_ms = (time.perf_counter() - start) / (repeats * len(queries)) * 1000
+        print(f"   {name:<10} {per_query_ms:.2f} ms/query")
+
+
+# --- UNIT TEST ---
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export / validate the ONNX embedding backend.")
+    parser.add_argument("--export", action="store_true", help="Export + int8-quantize the model to ONNX_MODEL_DIR")
+    parser.add_argument("--validate", action="store_true", help="Cosine tolerance test against PyTorch vectors")
+    parser.add_argument("--benchmark", action="store_true", help="Query-embedding latency, torch vs onnx")
+    args = parser.parse_args()
+
+    if args.export:
+        export_onnx_model()
+
+    sample_texts = [
+        "What is the Net Weight of a single DM8SE loudspeaker?",
+        "Tail Length 480 ms",
+        "AC Power Consumption 35 W typical at 40 °C (104 °F) ambient",
+        "The ControlSpace® EX-1280C conferencing processor includes 12 mic/line analog inputs, "
+        "8 analog outputs, 8 AmpLink digital outputs, 12 acoustic echo cancellers (AEC)",
+        "IP55 rating with weather-treated drivers and cabinet, aluminum grille",
+    ]
+    if args.validate and not validate_against_pytorch(sample_texts):
+        sys.exit(1)
+    if args.benchmark:
+        benchmark_query_embedding(sample_texts)
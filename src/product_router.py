@@ -0,0 +1,193 @@
+import os
+import sys
+import re
+import json
+import shutil
+import threading
+import numpy as np
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.config import ROUTER_KEYWORD_BOOST, ROUTER_MARGIN
+from src.generations import get_db_dir
+from src.spec_index import product_tokens
+
+# Product router: picks the manuals an unlocked question is most likely about, so
+# dense + BM25 search only touch those partitions. Built at ingestion time:
+#   router/centroids.npy  -> one unit vector per manual (mean of its chunk vectors)
+#   router/router.json    -> {"sources": [...], "keywords": {source: {keyword: kind}}}
+# Keywords are model numbers ("DM8SE", "EX-1280C", file name or repeated in the text)
+# and product family names from the file name ("DesignMax"); a keyword's weight is
+# split between the manuals that share it, so unique model numbers dominate.
+ROUTER_DIRNAME = "router"
+# Weight of a keyword by where it was found (file name = the manual is about that product)
+KEYWORD_KINDS = {"model": 1.0, "family": 0.5, "text": 0.5}
+# Model numbers in running text: "PM8500N", "EX-1280C", "IZA250-LZ"
+_MODEL_NUMBER = re.compile(r"\b[A-Z]{1,6}-?\d{1,6}[A-Z0-9]*(?:-[A-Z0-9]+)?\b")
+# ... that are really ratings / standards (IP55, AES67, UL2043) and say nothing about the product
+_NOT_A_MODEL = re.compile(r"^(IP|AES|UL|IEC|EN|ISO|NFPA|CE|RJ|USB)\d")
+# A text model number must occur this often in a manual to count (not just a cross-reference)
+MIN_TEXT_MENTIONS = 2
+_QUERY_TOKEN = re.compile(r"[A-Za-z0-9][A-Za-z0-9\-]*")
+
+
+def normalize_keyword(token):
+    """'EX-1280C' / 'ex1280c' -> 'EX1280C'."""
+    return re.sub(r"[^A-Z0-9]", "", token.upper())
+
+
+def mine_keywords(source, texts):
+    """{keyword: kind} of one manual: file-name model numbers / families + repeated model numbers in the text."""
+    keywords = {}
+    stem = os.path.splitext(os.path.basename(source))[0]
+    for token in re.split(r"[_\s]+", stem):
+        if re.search(r"[a-z][A-Z]", token) and token.isalpha():
+            keywords[normalize_keyword(token)] = "family"
+    for token in product_tokens(source):
+        keywords[normalize_keyword(token)] = "model"
+
+    mentions = {}
+    for text in texts:
+        for match in _MODEL_NUMBER.findall(text):
+            keyword = normalize_keyword(match)
+            if len(keyword) >= 4 and not _NOT_A_MODEL.match(keyword):
+                mentions[keyword] = mentions.get(keyword, 0) + 1
+    for keyword, count in mentions.items():
+        if count >= MIN_TEXT_MENTIONS:
+            keywords.setdefault(keyword, "text")
+    return keywords
+
+
+def _centroid(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if not len(vectors):
+        return None
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    centroid = vectors.mean(axis=0)
+    return centroid / max(float(np.linalg.norm(centroid)), 1e-12)
+
+
+def _router_dir(db_dir=None):
+    return os.path.join(db_dir or get_db_dir(), ROUTER_DIRNAME)
+
+
+def router_exists(db_dir=None):
+    return os.path.exists(os.path.join(_router_dir(db_dir), "router.json"))
+
+
+def _read(db_dir=None):
+    """{source: (centroid, keywords)} as saved, {} if the router was never built."""
+    path = _router_dir(db_dir)
+    if not router_exists(db_dir):
+        return {}
+    with open(os.path.join(path, "router.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    centroids = np.load(os.path.join(path, "centroids.npy"))
+    return {source: (centroids[i], meta["keywords"][source]) for i, source in enumerate(meta["sources"])}
+
+
+def update_router(vector_store, sources, removed=(), db_dir=None):
+    """
+    (Re)computes the centroid and keywords of `sources` from the chunks + vectors stored in
+    the vector store (nothing is re-embedded), drops `removed` ones and rewrites the router.
+    """
+    entries = _read(db_dir)
+    for source in removed:
+        entries.pop(source, None)
+    for source in sources:
+        raw = vector_store.get(where={"source": source}, include=["embeddings", "documents"])
+        centroid = _centroid(raw["embeddings"])
+        if centroid is None:
+            entries.pop(source, None)
+            continue
+        entries[source] = (centroid, mine_keywords(source, raw["documents"]))
+        print(f"   - Router entry built for {os.path.basename(source)} ({len(entries[source][1])} keywords)")
+
+    ordered = sorted(entries)
+    # Write into a temp folder, then swap it in (same as the BM25 partitions)
+    final_dir = _router_dir(db_dir)
+    tmp_dir = final_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    dim = len(next(iter(entries.values()))[0]) if entries else 0
+    np.save(os.path.join(tmp_dir, "centroids.npy"),
+            np.array([entries[s][0] for s in ordered], dtype=np.float32).reshape(len(ordered), dim))
+    with open(os.path.join(tmp_dir, "router.json"), "w", encoding="utf-8") as f:
+        json.dump({"sources": ordered, "keywords": {s: entries[s][1] for s in ordered}}, f)
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(tmp_dir, final_dir)
+
+
+class ProductRouter:
+    """Loaded router: ranks manuals for a question by centroid similarity + keyword matches."""
+
+    def __init__(self, path, keyword_boost=ROUTER_KEYWORD_BOOST):
+        with open(os.path.join(path, "router.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.sources = meta["sources"]
+        self.centroids = np.load(os.path.join(path, "centroids.npy"))
+
+        sharing = {}
+        for keywords in meta["keywords"].values():
+            for keyword in keywords:
+                sharing[keyword] = sharing.get(keyword, 0) + 1
+        # keyword -> [(source row, weight)]
+        self.keywords = {}
+        for row, source in enumerate(self.sources):
+            for keyword, kind in meta["keywords"][source].items():
+                weight = keyword_boost * KEYWORD_KINDS[kind] / sharing[keyword]
+                self.keywords.setdefault(keyword, []).append((row, weight))
+
+    def route(self, query, query_vector, top_n, margin=ROUTER_MARGIN):
+        """
+        The top_n manuals for the question, best first, minus those scoring more than
+        `margin` below the best: [{"source", "score", "keyword": matched keyword or None}]
+        """
+        if not self.sources:
+            return []
+        vector = np.asarray(query_vector, dtype=np.float32)
+        scores = self.centroids @ (vector / max(float(np.linalg.norm(vector)), 1e-12))
+        matched = {}
+        for keyword in dict.fromkeys(normalize_keyword(token) for token in _QUERY_TOKEN.findall(query)):
+            for row, weight in self.keywords.get(keyword, ()):
+                scores[row] += weight
+                matched.setdefault(row, keyword)
+
+        top_n = min(top_n, len(self.sources))
+        top = np.argpartition(-scores, top_n - 1)[:top_n]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        top = [row for row in top if scores[row] >= scores[top[0]] - margin]
+        return [{"source": self.sources[row], "score": round(float(scores[row]), 4), "keyword": matched.get(row)}
+                for row in top]
+
+
+# Loaded router per DB folder, reloaded when ingestion rewrites it
+_routers = {}
+_routers_lock = threading.Lock()
+
+
+def load_router(db_dir=None):
+    """The current ProductRouter of the index, or None if it was never built."""
+    path = _router_dir(db_dir)
+    try:
+        mtime = os.path.getmtime(os.path.join(path, "router.json"))
+    except OSError:
+        return None
+    with _routers_lock:
+        cached = _routers.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, ProductRouter(path))
+            _routers[path] = cached
+        return cached[1]
+
+
+# --- UNIT TEST ---
+if __name__ == "__main__":
+    keywords = mine_keywords("/data/tds_DesignMax_DM8SE_a4_EN.pdf", [
+        "DM8SE loudspeaker, IP55 rated. The DM8SE pairs with PowerMatch PM8500N amplifiers.",
+    ])
+    print(keywords)
+    assert keywords == {"DESIGNMAX": "family", "DM8SE": "model"}
+    assert normalize_keyword("ex-1280c") == "EX1280C"
+    print("✅ Product router OK")
@@ -0,0 +1,235 @@
+import os
+import sys
+import time
+import asyncio
+from contextlib import nullcontext
+from langchain_core.prompts import format_document
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.config import TRACING_ENABLED
+from src.context_packing import estimate_tokens
+from src.tracing import Trace, record_trace
+
+
+class ProductQAChain:
+    """
+    What get_qa_chain hands out: the RetrievalQA chain of one product plus the
+    serving-side extras around it (spec-table fast path, semantic answer cache, token streaming).
+    Keeps the chain's contract: invoke({"query": ...}) -> {"result", "source_documents", ...}
+    With TRACING_ENABLED every response also carries "trace" (per-stage spans, see src/tracing.py).
+    """
+
+    def __init__(self, chain, product=None, expansion_mode=None, answer_cache=None, version_fn=None,
+                 spec_lookup=None):
+        self.chain = chain
+        self.product = product or ""
+        self.expansion_mode = expansion_mode
+        # Answers can differ per expansion mode, so each mode gets its own cache scope
+        self.cache_scope = (self.product, expansion_mode)
+        self.answer_cache = answer_cache
+        # Returns the current index version of this product (used to invalidate cached answers)
+        self.version_fn = version_fn or (lambda: None)
+        # query -> {"result", "source_documents", ...} answered from the spec tables, or None
+        self.spec_lookup = spec_lookup
+
+    # --- tracing ---
+
+    def _trace(self, query):
+        return Trace(query=query, product=self.product) if TRACING_ENABLED else None
+
+    @staticmethod
+    def _span(trace, stage):
+        return trace.span(stage) if trace is not None else nullcontext({})
+
+    @staticmethod
+    def _with_trace(config, trace):
+        """Adds the trace's callback handler to a RunnableConfig (keeps the caller's callbacks)."""
+        if trace is None:
+            return config
+        config = dict(config or {})
+        callbacks = config.get("callbacks")
+        if callbacks is None:
+            config["callbacks"] = [trace]
+        elif isinstance(callbacks, list):
+            config["callbacks"] = callbacks + [trace]
+        else:
+            callbacks = callbacks.copy()
+            callbacks.add_handler(trace)
+            config["callbacks"] = callbacks
+        return config
+
+    @staticmethod
+    def _finish(response, trace, outcome):
+        if trace is not None:
+            summary = trace.summary(outcome)
+            record_trace(summary)
+            response["trace"] = summary
+        return response
+
+    # --- serving-side shortcuts ---
+
+    def _spec_answer(self, query, trace=None):
+        if self.spec_lookup is None:
+            return None
+        with self._span(trace, "spec_lookup") as span:
+            spec = self.spec_lookup(query)
+            span["hit"] = spec is not None
+        return spec
+
+    def _cache_lookup(self, query, version, trace=None):
+        with self._span(trace, "answer_cache_lookup") as span:
+            cached, vector = self.answer_cache.lookup(self.cache_scope, query, version=version)
+            span["hit"] = cached is not None
+        return cached, vector
+
+    def _cache_store(self, query, response, version, vector):
+        self.answer_cache.store(
+            self.cache_scope,
+            query,
+            {"result": response["result"], "source_documents": response.get("source_documents", [])},
+            version=version,
+            vector=vector,
+        )
+
+    def invoke(self, inputs, config=None, **kwargs):
+        query = inputs["query"]
+        trace = self._trace(query)
+
+        spec = self._spec_answer(query, trace)
+        if spec is not None:
+            return self._finish(dict(spec, query=query, cached=False, fast_path=True), trace, "fast_path")
+
+        config = self._with_trace(config, trace)
+        if self.answer_cache is None:
+            response = self.chain.invoke(inputs, config=config, **kwargs)
+            return self._finish(dict(response, cached=False), trace, "generated")
+
+        version = self.version_fn()
+        cached, vector = self._cache_lookup(query, version, trace)
+        if cached is not None:
+            return self._finish(dict(cached, query=query, cached=True), trace, "cached")
+
+        response = self.chain.invoke(inputs, config=config, **kwargs)
+        self._cache_store(query, response, version, vector)
+        return self._finish(dict(response, cached=False), trace, "generated")
+
+    async def ainvoke(self, inputs, config=None, **kwargs):
+        """Async twin of invoke: retrieval fans out concurrently, the event loop is never blocked."""
+        query = inputs["query"]
+        trace = self._trace(query)
+
+        spec = self._spec_answer(query, trace)
+        if spec is not None:
+            return self._finish(dict(spec, query=query, cached=False, fast_path=True), trace, "fast_path")
+
+        config = self._with_trace(config, trace)
+        if self.answer_cache is None:
+            response = await self.chain.ainvoke(inputs, config=config, **kwargs)
+            return self._finish(dict(response, cached=False), trace, "generated")
+
+        loop = asyncio.get_running_loop()
+        version = self.version_fn()
+        # Query embedding is CPU-bound, keep it off the event loop
+        cached, vector = await loop.run_in_executor(None, lambda: self._cache_lookup(query, version, trace))
+        if cached is not None:
+            return self._finish(dict(cached, query=query, cached=True), trace, "cached")
+
+        response = await self.chain.ainvoke(inputs, config=config, **kwargs)
+        self._cache_store(query, response, version, vector)
+        return self._finish(dict(response, cached=False), trace, "generated")
+
+    def retrieve(self, query, config=None):
+        """Retrieval step of the chain: (documents, packing stats or None if the chain does not pack)."""
+        retriever = self.chain.retriever
+        if hasattr(retriever, "retrieve_with_stats"):
+            return retriever.retrieve_with_stats(query, config=config)
+        return retriever.invoke(query, config=config), None
+
+    def build_prompt(self, query, documents):
+        """Formats the "stuff" prompt exactly like the chain's StuffDocumentsChain would."""
+        combine = self.chain.combine_documents_chain
+        context = combine.document_separator.join(
+            format_document(doc, combine.document_prompt) for doc in documents
+        )
+        return combine.llm_chain.prompt.format(**{combine.document_variable_name: context, "question": query})
+
+    def _replay(self, payload, elapsed, cached, fast_path, trace=None):
+        """Stream events for an answer that is ready without generation (cache hit / spec table)."""
+        yield {"type": "sources", "source_documents": payload["source_documents"], "cached": cached}
+        yield {"type": "token", "text": payload["result"]}
+        yield self._finish({
+            "type": "done", "result": payload["result"], "source_documents": payload["source_documents"],
+            "cached": cached, "fast_path": fast_path,
+            "timings": {"retrieval": elapsed, "time_to_first_token": elapsed, "generation": 0.0, "total": elapsed},
+            "prompt_tokens": 0, "context": None,
+        }, trace, "fast_path" if fast_path else "cached")
+
+    def stream(self, inputs, use_cache=True, use_fast_path=True):
+        """
+        Generator version of invoke for chat UIs (use_cache=False bypasses the answer cache and
+        use_fast_path=False the spec tables, e.g. for benchmarks). Yields events:
+          {"type": "sources", "source_documents": [...], "cached": bool}   once retrieval is done
+          {"type": "token", "text": "..."}                                 per streamed LLM chunk
+          {"type": "done", "result": "...", "source_documents": [...], "cached": bool, "fast_path": bool,
+           "timings": {"retrieval", "time_to_first_token", "generation", "total"},  (seconds)
+           "prompt_tokens": int, "context": {packing stats} or None,  (estimated tokens, 0 without LLM call)
+           "trace": {...} (TRACING_ENABLED)}
+        """
+        query = inputs["query"]
+        start = time.perf_counter()
+        trace = self._trace(query)
+
+        # Spec lookups answered straight from the extracted tables (no retrieval, no LLM)
+        spec = self._spec_answer(query, trace) if use_fast_path else None
+        if spec is not None:
+            yield from self._replay(spec, time.perf_counter() - start, cached=False, fast_path=True, trace=trace)
+            return
+
+        use_cache = use_cache and self.answer_cache is not None
+        cached, vector, version = None, None, None
+        if use_cache:
+            version = self.version_fn()
+            cached, vector = self._cache_lookup(query, version, trace)
+
+        if cached is not None:
+            yield from self._replay(cached, time.perf_counter() - start, cached=True, fast_path=False, trace=trace)
+            return
+
+        # 1. Retrieval (query expansion + hybrid search + context packing), then show sources right away
+        config = self._with_trace(None, trace)
+        documents, context_stats = self.retrieve(query, config=config)
+        retrieval_done = time.perf_counter()
+        yield {"type": "sources", "source_documents": documents, "cached": False}
+
+        # 2. Generation, streamed chunk by chunk
+        llm = self.chain.combine_documents_chain.llm_chain.llm
+        prompt = self.build_prompt(query, documents)
+        first_token_at = None
+        parts = []
+        for chunk in llm.stream(prompt, config=config):
+            text = chunk.content if hasattr(chunk, "content") else str(chunk)
+            if not text:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            parts.append(text)
+            yield {"type": "token", "text": text}
+        end = time.perf_counter()
+
+        result = "".join(parts)
+        if use_cache:
+            self._cache_store(query, {"result": result, "source_documents": documents}, version, vector)
+
+        yield self._finish({
+            "type": "done", "result": result, "source_documents": documents, "cached": False, "fast_path": False,
+            "timings": {
+                "retrieval": retrieval_done - start,
+                "time_to_first_token": (first_token_at or end) - start,
+                "generation": end - retrieval_done,
+                "total": end - start,
+            },
+            "prompt_tokens": estimate_tokens(prompt),
+            "context": context_stats,
+        }, trace, "generated")
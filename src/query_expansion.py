@@ -0,0 +1,228 @@
+import os
+import sys
+import re
+import json
+import asyncio
+from typing import Any, Dict, List
+from langchain.retrievers.multi_query import MultiQueryRetriever
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.generations import get_db_dir
+from src.context_packing import estimate_tokens
+from src.llm_scheduler import LLMUnavailableError
+
+ACRONYMS_FILENAME = "acronyms.json"
+
+# Words skipped when matching initials: "Signal to Noise Ratio (SNR)"
+_STOPWORDS = {"of", "and", "to", "the", "for", "in", "on", "a", "an", "&", "/", "-"}
+_WORD = r"[A-Za-z][A-Za-z0-9\-/]*"
+# "acoustic echo cancellers (AEC)"  /  "AEC (acoustic echo cancellation)"
+_LONG_THEN_SHORT = re.compile(rf"((?:{_WORD}[ \t]+){{1,8}})\(([A-Z][A-Za-z0-9]{{1,7}})s?\)")
+_SHORT_THEN_LONG = re.compile(rf"\b([A-Z][A-Z0-9]{{1,7}})s?[ \t]+\(((?:{_WORD}[ \t]*){{2,8}})\)")
+
+# Spec-sheet wording people use in questions vs. what the manuals say
+SPEC_SYNONYMS = {
+    "heavy": "weight",
+    "weigh": "weight",
+    "watts": "W",
+    "size": "dimensions",
+    "loud": "SPL",
+    "loudness": "SPL",
+}
+
+
+def _initials(words):
+    return "".join(w[0].upper() for w in words if w.lower() not in _STOPWORDS)
+
+
+def _match_expansion(words, acronym):
+    """Shortest run of trailing `words` whose initials spell `acronym` (None if none does)."""
+    target = acronym.upper()
+    for start in range(len(words) - 1, -1, -1):
+        candidate = words[start:]
+        initials = _initials(candidate)
+        if initials == target:
+            return " ".join(candidate)
+        if len(initials) > len(target):
+            break
+    return None
+
+
+def mine_acronyms(texts):
+    """
+    Mines an {ACRONYM: expansion} table from manual text using the usual
+    "Long Form (LF)" / "LF (Long Form)" definitions.
+    """
+    table = {}
+    for text in texts:
+        flat = re.sub(r"\s+", " ", text)
+
+        for match in _LONG_THEN_SHORT.finditer(flat):
+            words, acronym = match.group(1).split(), match.group(2)
+            expansion = _match_expansion(words, acronym)
+            if expansion:
+                table.setdefault(acronym.upper(), expansion.lower())
+
+        for match in _SHORT_THEN_LONG.finditer(flat):
+            acronym, words = match.group(1), match.group(2).split()
+            if _initials(words) == acronym.upper():
+                table.setdefault(acronym.upper(), " ".join(words).lower())
+
+    return table
+
+
+# --- persisted table (built at ingestion time) ---
+
+def _table_path(db_dir=None):
+    return os.path.join(db_dir or get_db_dir(), ACRONYMS_FILENAME)
+
+
+def load_acronym_tables(db_dir=None):
+    """Returns {source: {ACRONYM: expansion}} as saved by update_acronym_tables."""
+    path = _table_path(db_dir)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def update_acronym_tables(texts_by_source, removed=(), db_dir=None):
+    """Mines the tables of the given sources and merges them into the saved file."""
+    tables = load_acronym_tables(db_dir)
+    for source in removed:
+        tables.pop(source, None)
+    for source, texts in texts_by_source.items():
+        tables[source] = mine_acronyms(texts)
+        print(f"   - Mined {len(tables[source])} acronyms from {os.path.basename(source)}")
+
+    path = _table_path(db_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(tables, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def get_expansion_table(source=None, db_dir=None):
+    """Acronym table of one source, or all sources merged when source is None."""
+    tables = load_acronym_tables(db_dir)
+    if source is not None:
+        return dict(tables.get(source, {}))
+    merged = {}
+    for table in tables.values():
+        for acronym, expansion in table.items():
+            merged.setdefault(acronym, expansion)
+    return merged
+
+
+# --- query side ---
+
+def expand_query(query, table):
+    """
+    Returns the query variants to search for: the original query, plus one with
+    acronyms and colloquial spec words spelled out the way the manual writes them.
+    """
+    expanded = query
+    for acronym, expansion in table.items():
+        if re.search(rf"\b{re.escape(acronym)}s?\b", query, re.I) and expansion not in query.lower():
+            expanded += f" {expansion}"
+        elif expansion in query.lower() and not re.search(rf"\b{re.escape(acronym)}\b", query):
+            expanded += f" {acronym}"
+
+    for word, spec_word in SPEC_SYNONYMS.items():
+        if re.search(rf"\b{word}\b", query, re.I) and spec_word.lower() not in query.lower():
+            expanded += f" {spec_word}"
+
+    return [query] if expanded == query else [query, expanded]
+
+
+class LocalQueryExpansionRetriever(BaseRetriever):
+    """
+    Drop-in replacement for MultiQueryRetriever that expands queries from the
+    mined acronym table instead of asking the LLM for variants.
+    """
+
+    retriever: BaseRetriever
+    table: Dict[str, str] = {}
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        config = {"callbacks": run_manager.get_child()} if run_manager else None
+        documents = []
+        for variant in expand_query(query, self.table):
+            documents.extend(self.retriever.invoke(variant, config=config))
+        return _unique_documents(documents)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        config = {"callbacks": run_manager.get_child()} if run_manager else None
+        # All variants are searched concurrently (each one fans out to dense + BM25)
+        document_lists = await asyncio.gather(
+            *(self.retriever.ainvoke(variant, config=config) for variant in expand_query(query, self.table))
+        )
+        return _unique_documents([doc for docs in document_lists for doc in docs])
+
+
+class BudgetedMultiQueryRetriever(MultiQueryRetriever):
+    """
+    MultiQueryRetriever that degrades to the local acronym table instead of queueing
+    for the LLM: when the scheduler has answers waiting / is low on budget, or the
+    query-generation call fails after its retries, the variants come from expand_query.
+    """
+
+    table: Dict[str, str] = {}
+    scheduler: Any = None
+
+    @classmethod
+    def from_llm(cls, retriever, llm, table=None, scheduler=None, **kwargs) -> "BudgetedMultiQueryRetriever":
+        multi_query = super().from_llm(retriever=retriever, llm=llm, **kwargs)
+        return cls(retriever=multi_query.retriever, llm_chain=multi_query.llm_chain,
+                   include_original=multi_query.include_original, table=table or {}, scheduler=scheduler)
+
+    def _skip(self, question):
+        return self.scheduler is not None and self.scheduler.should_skip_expansion(estimate_tokens(question))
+
+    def _fallback(self):
+        if self.scheduler is not None:
+            self.scheduler.record_skipped_expansion()
+
+    def generate_queries(self, question: str, run_manager) -> List[str]:
+        if self._skip(question):
+            return expand_query(question, self.table)
+        try:
+            return super().generate_queries(question, run_manager)
+        except LLMUnavailableError:
+            self._fallback()
+            return expand_query(question, self.table)
+
+    async def agenerate_queries(self, question: str, run_manager) -> List[str]:
+        if self._skip(question):
+            return expand_query(question, self.table)
+        try:
+            return await super().agenerate_queries(question, run_manager)
+        except LLMUnavailableError:
+            self._fallback()
+            return expand_query(question, self.table)
+
+
+def _unique_documents(documents: List[Any]) -> List[Any]:
+    # Same de-duplication as MultiQueryRetriever.unique_union
+    return [doc for i, doc in enumerate(documents) if doc not in documents[:i]]
+
+
+# --- UNIT TEST ---
+if __name__ == "__main__":
+    table = mine_acronyms([
+        "12 acoustic echo cancellers (AEC), 64 x 64 Dante",
+        "Sound Pressure Level (SPL) measured at 1 m",
+        "NC (noise criterion) rating",
+    ])
+    print(table)
+    assert table["AEC"] == "acoustic echo cancellers"
+    assert table["SPL"] == "sound pressure level"
+    assert table["NC"] == "noise criterion"
+    print(expand_query("What is the AEC tail length?", table))
+    print(expand_query("How heavy is the DM8SE?", table))
+    print("✅ Query expansion OK")
@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import threading
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.config import EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND, VECTOR_BACKEND
+from src.generations import get_db_dir
+
+# Process-wide registry: Streamlit imports this module once per server process,
+# so every session (and every product switch) shares the same model + client.
+# The backends (torch / chromadb) are imported when first needed, not at import time.
+_lock = threading.Lock()
+_embeddings = None
+# One store per index generation folder: a new generation is opened (and warmed) next to
+# the one being served, and the old store stays usable by queries still in flight
+_vector_stores = {}
+# Seconds spent importing + loading each resource (bot.startup_report)
+load_timings = {}
+
+
+def embedding_model_id():
+    """Identifies the vectors we produce: model + backend (used by the embedding cache and manifest)."""
+    if EMBEDDING_BACKEND == "onnx":
+        return f"{EMBEDDING_MODEL_NAME}:onnx-int8"
+    return EMBEDDING_MODEL_NAME
+
+
+def get_embeddings():
+    """Returns the shared embedding model (EMBEDDING_BACKEND), loading it on first use."""
+    global _embeddings
+    if _embeddings is None:
+        with _lock:
+            if _embeddings is None:
+                print(f" Loading embedding model ({embedding_model_id()})...")
+                start_time = time.perf_counter()
+                if EMBEDDING_BACKEND == "onnx":
+                    from src.onnx_embeddings import OnnxEmbeddings
+                    _embeddings = OnnxEmbeddings()
+                elif EMBEDDING_BACKEND == "torch":
+                    from langchain_community.embeddings import HuggingFaceEmbeddings
+                    _embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+                else:
+                    raise ValueError(f"Unknown EMBEDDING_BACKEND: {EMBEDDING_BACKEND!r} (use torch or onnx)")
+                load_timings["embeddings"] = round(time.perf_counter() - start_time, 3)
+    return _embeddings
+
+
+def open_vector_store(embeddings, db_dir=None):
+    """Opens the VECTOR_BACKEND store over the index folder (default get_db_dir()) with the given embedding function."""
+    db_dir = db_dir or get_db_dir()
+    if VECTOR_BACKEND == "numpy":
+        from src.numpy_store import NumpyVectorStore
+        return NumpyVectorStore(embedding_function=embeddings, persist_directory=db_dir)
+    if VECTOR_BACKEND == "chroma":
+        from langchain_chroma import Chroma
+        return Chroma(persist_directory=db_dir, embedding_function=embeddings)
+    raise ValueError(f"Unknown VECTOR_BACKEND: {VECTOR_BACKEND!r} (use chroma or numpy)")
+
+
+def get_vector_store():
+    """Returns the shared vector store over get_db_dir(), opening it on first use."""
+    db_dir = get_db_dir()
+    vector_store = _vector_stores.get(db_dir)
+    if vector_store is None:
+        embeddings = get_embeddings()
+        with _lock:
+            vector_store = _vector_stores.get(db_dir)
+            if vector_store is None:
+                start_time = time.perf_counter()
+                vector_store = open_vector_store(embeddings, db_dir)
+                _vector_stores[db_dir] = vector_store
+                load_timings["vector_store"] = round(time.perf_counter() - start_time, 3)
+    return vector_store
+
+
+def release_vector_store(db_dir):
+    """Forgets the store of an index folder that is no longer served (holders keep their reference)."""
+    with _lock:
+        _vector_stores.pop(db_dir, None)
+
+
+def reset_resources():
+    """Drops the shared stores (e.g. after the DB folder was rebuilt). The model is kept."""
+    with _lock:
+        _vector_stores.clear()
@@ -0,0 +1,387 @@
+import os
+import sys
+import re
+import json
+import threading
+from langchain_core.documents import Document
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.config import SPEC_MIN_COVERAGE, SPEC_MIN_MARGIN, SPEC_MIN_QUERY_SHARE
+from src.generations import get_db_dir
+
+SPECS_FILENAME = "specs.json"
+# Bumped when extraction changes: tables saved by an older extractor are re-extracted at the next ingestion
+SPECS_VERSION = 2
+
+# --- extraction (runs at ingestion, see loader.iter_documents) ---
+
+# The spec table runs from "Technical Specifications" until compliance / product codes / footnotes / diagrams
+_SPEC_START = re.compile(r"^technical specifications\b", re.I)
+_SPEC_END = re.compile(r"^(compliance|product codes|footnotes|mechanical diagrams)\b", re.I)
+# Section headers inside the table: "ELECTRICAL SPECIFICATIONS", "ACOUSTIC ECHO CANCELLING"
+_SECTION = re.compile(r"^[A-Z][A-Z0-9 /&\-]{3,}$")
+# Page headers/footers that pypdf glues onto neighbouring rows
+_BOILERPLATE = re.compile(
+    r"For additional specifications and application information,? (?:please )?visit BoseProfessional\.com\.?"
+    r"(?: Specifications are subject to change\.)?(?: ?\d{2}/\d{4})?|TECHNICAL DATA|BoseProfessional\.com \d+ OF \d+",
+    re.I,
+)
+# First token of a value: a number with an optional short unit ("35", "3.6", "70V:", "0°C", "32-bit", "+24")
+_VALUE_TOKEN = re.compile(r"[<>≤≥~±+\-–]?\d[\d.,/]*(?:[A-Za-z°%Ωμ\"”]{1,3}:?|-[a-z]+)?")
+_COMPARATORS = {"<", ">", "≤", "≥", "~", "±"}
+# "1. Frequency response and range measured on-axis ..." under the "Footnotes" heading
+_FOOTNOTES_START = re.compile(r"^footnotes\b", re.I)
+_FOOTNOTE = re.compile(r"^(\d{1,2})\.\s+(\S.*)")
+# A value that is only number + unit pairs, one per column: "600 W 500 W" (AES / extended-lifecycle test)
+_COLUMN = r"[<>≤≥~±+\-–]?\s?\d[\d.,]*\s?[A-Za-zΩμ°%]{1,4}"
+_MULTI_COLUMN = re.compile(rf"{_COLUMN}(?:\s+{_COLUMN})+")
+
+
+def _split_row(line):
+    """'Net Weight 3.6 kg (7.3 lb)' -> ('Net Weight', '3.6 kg (7.3 lb)'); None if the line has no numeric value."""
+    tokens = line.split()
+    depth = 0
+    for i, token in enumerate(tokens):
+        # Numbers inside parentheses or after "@" qualify the label: "Sensitivity (SPL / 1 W @ 1 m) 93 dB"
+        if i > 0 and depth == 0 and tokens[i - 1] != "@" and _VALUE_TOKEN.fullmatch(token):
+            # Keep a detached comparator with its number: "Dynamic Range > 115 dB"
+            if tokens[i - 1] in _COMPARATORS:
+                i -= 1
+            return " ".join(tokens[:i]).rstrip(" ,:"), " ".join(tokens[i:])
+        depth = max(depth + token.count("(") - token.count(")"), 0)
+    return None
+
+
+def _strip_footnote_marker(row, footnotes):
+    """
+    pypdf glues a label's footnote marker onto the value: "Frequency Response (–3 dB) 160 – 20,000 Hz"
+    with footnote "1. Frequency response and range measured ..." -> "60 – 20,000 Hz". The leading digits
+    are only dropped when the footnote's subject (its first words) shares a word with the row label.
+    """
+    token, _, rest = row["value"].partition(" ")
+    label = {t for t in _terms(row["key"]) if len(t) > 2 and not t.isdigit()}
+    for number, text in footnotes.items():
+        if len(token) > len(number) and token.startswith(number) and token[len(number)].isdigit() \
+                and label & set(_terms(" ".join(text.split()[:4]))):
+            row["value"] = f"{token[len(number):]} {rest}".strip()
+            row["footnote"] = int(number)
+            return
+
+
+def _columns(value):
+    """'150 W 125 W' -> ['150 W', '125 W'] for a multi-column value, None otherwise."""
+    if _MULTI_COLUMN.fullmatch(value) is None:
+        return None
+    return [column.strip() for column in re.findall(_COLUMN, value)]
+
+
+def is_multi_column(value):
+    """Whether a value holds one number + unit per table column ("150 W 125 W"): no single answer."""
+    return _MULTI_COLUMN.fullmatch(value) is not None
+
+
+def line_kind(line):
+    """
+    What a PDF text line is to a spec table: "table_start" / "table_end" (the table's own
+    headings), "section" (an all-caps header), "value" (wrapped value of the row above),
+    "row" (label + numeric value), "boilerplate" (page header / footer) or "text".
+    Used by the structure-aware splitter.
+    """
+    line = _BOILERPLATE.sub(" ", line).strip()
+    if not line:
+        return "boilerplate"
+    if _SPEC_START.match(line):
+        return "table_start"
+    if _SPEC_END.match(line):
+        return "table_end"
+    if _SECTION.match(line):
+        return "section"
+    if _VALUE_TOKEN.fullmatch(line.split()[0]):
+        return "value"
+    split = _split_row(line)
+    return "row" if split is not None and re.search(r"[a-z]", split[0], re.I) else "text"
+
+
+def extract_spec_rows(pages):
+    """
+    Extracts the key/value rows (with units) of a data sheet's spec table.
+    pages: the PDF's page Documents in page order.
+    Returns [{"key", "value", "section", "page"}] (+ "footnote" when a marker was split off the value);
+    wrapped value lines ("100V: 5 W, ...") are joined.
+    """
+    rows = []
+    footnotes = {}
+    in_specs = in_footnotes = False
+    section = ""
+    for page in pages:
+        page_number = page.metadata.get("page", 0)
+        last = None
+        for raw_line in page.page_content.splitlines():
+            line = _BOILERPLATE.sub(" ", raw_line).strip()
+            if not line:
+                continue
+            if _SPEC_START.match(line):
+                in_specs, last = True, None
+                continue
+            if _FOOTNOTES_START.match(line):
+                in_specs, in_footnotes, last = False, True, None
+                continue
+            if in_footnotes:
+                footnote = _FOOTNOTE.match(line)
+                if footnote:
+                    footnotes[footnote.group(1)] = footnote.group(2)
+                continue
+            if not in_specs:
+                continue
+            if _SPEC_END.match(line):
+                in_specs, last = False, None
+                continue
+            if _SECTION.match(line):
+                section, last = line, None
+                continue
+
+            first = line.split()[0]
+            if last is not None and _VALUE_TOKEN.fullmatch(first):
+                last["value"] += "; " + line
+                continue
+
+            split = _split_row(line)
+            if split is None or not re.search(r"[a-z]", split[0], re.I):
+                last = None
+                continue
+            last = {"key": split[0], "value": split[1], "section": section, "page": page_number}
+            rows.append(last)
+
+    # Footnotes come after the table; longest numbers first so "12" is not read as "1"
+    footnotes = dict(sorted(footnotes.items(), key=lambda item: -len(item[0])))
+    for row in rows:
+        _strip_footnote_marker(row, footnotes)
+        # Same value in every column ("93 dB 93 dB"): one answer after all
+        columns = _columns(row["value"])
+        if columns and len(set(columns)) == 1:
+            row["value"] = columns[0]
+    return rows
+
+
+# --- persisted tables (one per source PDF) ---
+
+def _specs_path(db_dir=None):
+    return os.path.join(db_dir or get_db_dir(), SPECS_FILENAME)
+
+
+def load_spec_tables(db_dir=None):
+    """Returns {source: [row, ...]} as saved by update_spec_tables ({} if missing or from an older extractor)."""
+    path = _specs_path(db_dir)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        saved = json.load(f)
+    if saved.get("version") != SPECS_VERSION:
+        return {}
+    return saved["tables"]
+
+
+def update_spec_tables(rows_by_source, removed=(), db_dir=None):
+    """Merges freshly extracted rows into the saved file and drops removed sources."""
+    tables = load_spec_tables(db_dir)
+    for source in removed:
+        tables.pop(source, None)
+    for source, rows in rows_by_source.items():
+        tables[source] = rows
+        print(f"   - Extracted {len(rows)} spec rows from {os.path.basename(source)}")
+
+    path = _specs_path(db_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": SPECS_VERSION, "tables": tables}, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+# Query side: the file is re-read only when ingestion rewrote it
+_tables_cache = {}
+_tables_lock = threading.Lock()
+
+
+def _current_tables(db_dir=None):
+    path = _specs_path(db_dir)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+    with _tables_lock:
+        cached = _tables_cache.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, load_spec_tables(db_dir))
+            _tables_cache[path] = cached
+        return cached[1]
+
+
+# --- matching ---
+
+_STOPWORDS = {
+    "what", "whats", "which", "is", "are", "the", "a", "an", "of", "for", "in", "on", "at", "to", "and",
+    "does", "do", "it", "its", "this", "that", "how", "much", "many", "tell", "me", "about", "with", "per",
+    # The product itself, not a spec: "... of the processor?"
+    "processor", "loudspeaker", "speaker", "amplifier", "device", "unit", "product",
+}
+# Question words mapped to the label wording of the data sheets
+_QUERY_SYNONYMS = {"heavy": "weight", "weigh": "weight", "size": "dimensions", "taps": "tap", "loud": "spl"}
+# Unit words in a question -> unit strings in the value (tie-break between rows)
+_UNIT_HINTS = {
+    "watts": "W", "watt": "W", "milliseconds": "ms", "millisecond": "ms", "ms": "ms", "kg": "kg",
+    "kilograms": "kg", "pounds": "lb", "lb": "lb", "lbs": "lb", "db": "dB", "decibels": "dB",
+    "hz": "Hz", "hertz": "Hz", "khz": "kHz", "ohms": "Ω", "ohm": "Ω", "mm": "mm", "volts": "V",
+}
+# app.py prefixes questions with the selected product: "Context: DesignMax DM8SE Loudspeaker. ..."
+_CONTEXT_PREFIX = re.compile(r"^\s*Context:[^.?!]*[.?!]\s*", re.I)
+
+
+def _stem(word):
+    for suffix in ("ations", "ation", "ings", "ing", "ers", "er", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def _terms(text):
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    return [_stem(_QUERY_SYNONYMS.get(w, w)) for w in words if w not in _STOPWORDS]
+
+
+def _label_terms(key):
+    """Label words outside parentheses (required) and inside them (qualifiers, bonus only)."""
+    qualifiers = " ".join(re.findall(r"\(([^)]*)\)", key))
+    return set(_terms(re.sub(r"\([^)]*\)", " ", key))), set(_terms(qualifiers))
+
+
+def _row_terms(row):
+    return set(_terms(f"{row['key']} {row['section']} {row['value']}"))
+
+
+def match_spec(query, rows, min_coverage=None, min_margin=None, min_query_share=None):
+    """
+    Finds the row a spec question asks for. Score = label words found in the question
+    + share of the label covered (+ small bonuses for section / qualifier / unit hits).
+    Returns (row, score), or None unless the best row covers min_coverage of its label,
+    leads the runner-up by min_margin, accounts for min_query_share of the question (see
+    below) and holds a single value (not one per table column).
+    Query share: question words found in the row's label, section or value, over those plus
+    the question words the row lacks but other rows of the table use ("Dante" in "maximum
+    input level of the Dante channels" points away from the analog input row).
+    """
+    min_coverage = SPEC_MIN_COVERAGE if min_coverage is None else min_coverage
+    min_margin = SPEC_MIN_MARGIN if min_margin is None else min_margin
+    min_query_share = SPEC_MIN_QUERY_SHARE if min_query_share is None else min_query_share
+
+    words = set(_terms(query))
+    units = {_UNIT_HINTS[w] for w in re.findall(r"[a-z]+", query.lower()) if w in _UNIT_HINTS}
+    if not words:
+        return None
+
+    scored = []
+    for row in rows:
+        required, qualifiers = _label_terms(row["key"])
+        if not required:
+            continue
+        hits = len(required & words)
+        if not hits:
+            continue
+        coverage = hits / len(required)
+        score = hits + coverage
+        score += 0.25 * len(qualifiers & words) + 0.25 * len(set(_terms(row["section"])) & words)
+        score += 0.25 * any(re.search(rf"\d\s?{re.escape(unit)}\b", row["value"]) for unit in units)
+        scored.append((score, coverage, row))
+
+    if not scored:
+        return None
+    scored.sort(key=lambda item: item[0], reverse=True)
+    best_score, best_coverage, best_row = scored[0]
+    runner_up = scored[1][0] if len(scored) > 1 else 0.0
+    if best_coverage < min_coverage or best_score - runner_up < min_margin:
+        return None
+
+    row_terms = _row_terms(best_row)
+    matched = {
+        w for w in words
+        if w in row_terms or (w in _UNIT_HINTS and re.search(rf"\d\s?{re.escape(_UNIT_HINTS[w])}\b", best_row["value"]))
+    }
+    elsewhere = set().union(*(_row_terms(row) for row in rows)) & (words - matched)
+    if len(matched) / (len(matched) + len(elsewhere)) < min_query_share:
+        return None
+    if is_multi_column(best_row["value"]):
+        return None
+    return best_row, best_score
+
+
+def product_tokens(source):
+    """Model-number tokens of a data sheet file name: 'tds_DesignMax_DM8SE_a4_EN.pdf' -> ['dm8se']."""
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return [t.lower() for t in re.split(r"[_\s]+", stem) if re.search(r"\d", t) and re.search(r"[A-Za-z]", t)
+            and len(t) > 2]
+
+
+def answer_from_specs(query, source=None, db_dir=None):
+    """
+    LLM-free answer for a spec lookup, straight from the extracted tables.
+    source: the PDF the chain is locked to; None = all manuals, in which case the
+    question must name exactly one product (model number).
+    Returns {"result", "source_documents", "spec_match"} or None (-> run the RAG chain).
+    """
+    tables = _current_tables(db_dir)
+    question = _CONTEXT_PREFIX.sub("", query)
+
+    if source is not None:
+        candidates = [source] if source in tables else []
+    else:
+        lowered = question.lower()
+        candidates = [s for s in tables if any(token in lowered for token in product_tokens(s))]
+    if len(candidates) != 1:
+        return None
+
+    source = candidates[0]
+    match = match_spec(question, tables[source])
+    if match is None:
+        return None
+
+    row, score = match
+    file_name = os.path.basename(source)
+    document = Document(
+        page_content=f"{row['section']}\n{row['key']} {row['value']}".strip(),
+        metadata={"source": source, "page": row["page"], "spec_key": row["key"]},
+    )
+    return {
+        "result": f"{row['key']}: {row['value']}\n\n(Source: {file_name}, page {row['page'] + 1})",
+        "source_documents": [document],
+        "spec_match": {"key": row["key"], "value": row["value"], "page": row["page"], "score": round(score, 3)},
+    }
+
+
+# --- UNIT TEST ---
+if __name__ == "__main__":
+    from src.loader import list_pdf_files, load_documents
+
+    test_questions = [
+        ("What is the maximum power consumption of the processor?", "EX-1280C"),
+        ("What is the maximum 70V transformer tap setting in Watts?", "DM8SE"),
+        ("What is the Net Weight of a single DM8SE loudspeaker?", "DM8SE"),
+        ("What is the Dynamic Range of the analog signal path?", "EX-1280C"),
+        ("What is the length of AEC tail in milliseconds?", "EX-1280C"),
+        ("How do I mount the loudspeaker on a pole?", "DM8SE"),
+        # Rows that only cover part of the question / hold one value per column -> RAG
+        ("What is the maximum input level of the Dante channels?", "EX-1280C"),
+        ("What is the sample rate of USB audio?", "EX-1280C"),
+        ("What is the peak power handling?", "DM8SE"),
+    ]
+
+    tables = {}
+    for pdf in list_pdf_files():
+        tables[pdf] = extract_spec_rows(load_documents([pdf], max_workers=1))
+        print(f"{os.path.basename(pdf)}: {len(tables[pdf])} rows")
+
+    for question, product in test_questions:
+        source = next((s for s in tables if product in os.path.basename(s)), None)
+        match = match_spec(question, tables.get(source, []))
+        print(f"Q: {question}\n   -> {match[0]['key']}: {match[0]['value']}" if match else f"Q: {question}\n   -> (RAG)")
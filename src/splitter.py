@@ -1,33 +1,183 @@
 import os
 import sys
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
 
 # --- PATH FIX (Standard for all our files) ---
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 # ---------------------------------------------
 
+from src.config import INGEST_BATCH_SIZE, CHUNKING_MODE, CHUNK_SIZE, CHUNK_OVERLAP
 from src.loader import load_documents
+from src.spec_index import line_kind
 
-def split_documents(documents):
+CHUNKING_MODES = ("fixed", "structure")
+# What indexes built before CHUNKING_MODE existed were split with
+LEGACY_CHUNKING = "fixed:1000:200"
+# Bumped when chunk metadata changes so existing indexes get re-split (2: start_index offsets)
+CHUNK_FORMAT = 2
+# Structure mode: a chunk is cut at its last heading instead of at the size limit as long
+# as it stays at least this full (so chunks start at headings without getting small)
+MIN_FILL = 0.5
+# Short Title Case lines outside spec tables ("Product Overview", "Key Features") are headings
+_TITLE_SMALL_WORDS = {"and", "of", "the", "for", "to", "with", "in", "on", "&"}
+
+
+def chunking_signature(mode=CHUNKING_MODE, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """Identifies how chunks were cut ("structure:1000:200:v2"); stored in the ingestion manifest."""
+    if mode not in CHUNKING_MODES:
+        raise ValueError(f"Unknown CHUNKING_MODE: {mode!r} (use fixed or structure)")
+    return f"{mode}:{chunk_size}:{chunk_overlap}:v{CHUNK_FORMAT}"
+
+def _get_text_splitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,        # Size of each piece
+        chunk_overlap=chunk_overlap,  # Overlap to keep context between chunks
+        length_function=len,
+        separators=["\n\n", "\n", " ", ""], # Try to split by paragraphs first
+        add_start_index=True  # Character offset in the page, lets context packing merge overlapping chunks
+    )
+
+def _is_title(line):
+    words = line.split()
+    return (0 < len(words) <= 6 and len(line) <= 60 and line[-1] not in ".,:;"
+            and not any(c.isdigit() for c in line)
+            and all(w[0].isupper() or w.lower() in _TITLE_SMALL_WORDS for w in words))
+
+def _line_units(text, state):
+    """
+    Splits a page into line units [start, end, kind, section] (character offsets in the page).
+    kind: "heading", "row" (a spec row, with its wrapped value lines) or "line". `state` carries
+    the current section / spec-table flag / titles seen from one page of a PDF to the next.
+    Headings: the spec table's own headings, its all-caps sections, and Title Case lines
+    outside it that are not repeated page headers (product name on every page).
+    """
+    units = []
+    offset = 0
+    for raw in text.splitlines(keepends=True):
+        line_start, offset = offset, offset + len(raw)
+        line = raw.strip()
+        if not line:
+            continue
+        start = line_start + len(raw) - len(raw.lstrip())
+        end = start + len(line)
+
+        kind = line_kind(line)
+        if kind == "value" and units and units[-1][2] == "row":
+            units[-1][1] = end
+            continue
+        if kind in ("table_start", "table_end") or (kind == "section" and state["in_specs"]):
+            state["in_specs"] = kind == "table_start" or (state["in_specs"] and kind != "table_end")
+        elif kind in ("text", "section") and not state["in_specs"] and _is_title(line) \
+                and line not in state["titles"]:
+            state["titles"].add(line)
+        else:
+            units.append([start, end, "row" if kind == "row" else "line", state["section"]])
+            continue
+        state["section"] = line
+        units.append([start, end, "heading", line])
+    return units
+
+def _split_structured(page, state, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """
+    Structure-aware split of one page: whole lines are packed up to chunk_size and the chunk
+    is cut at its last heading when that keeps it MIN_FILL full (a heading never ends a
+    chunk); spec rows are never cut. Only a single line longer than chunk_size is split
+    (fixed windows with chunk_overlap). Chunks are slices of the page text: start_index holds.
+    """
+    text = page.page_content
+    chunks = []
+
+    def emit(units):
+        start, end = units[0][0], units[-1][1]
+        metadata = dict(page.metadata, start_index=start, section=units[0][3])
+        chunks.append(Document(page_content=text[start:end], metadata=metadata))
+
+    current = []
+    for unit in _line_units(text, state):
+        start, end, kind, section = unit
+        if end - start > chunk_size:
+            if current:
+                emit(current)
+                current = []
+            for piece in _get_text_splitter(chunk_size, chunk_overlap).split_documents(
+                    [Document(page_content=text[start:end])]):
+                piece_start = start + piece.metadata["start_index"]
+                emit([[piece_start, piece_start + len(piece.page_content), kind, section]])
+            continue
+        while current and end - current[0][0] > chunk_size:
+            # Cut before the last heading that leaves the chunk MIN_FILL full, else before the
+            # trailing headings (they move on with the text they introduce)
+            cut = next((i for i in range(len(current) - 1, 0, -1) if current[i][2] == "heading"
+                        and current[i - 1][1] - current[0][0] >= chunk_size * MIN_FILL), None)
+            if cut is None:
+                cut = len(current)
+                while cut > 0 and current[cut - 1][2] == "heading":
+                    cut -= 1
+            if cut == 0:
+                break
+            emit(current[:cut])
+            current = current[cut:]
+        current.append(unit)
+    if current:
+        emit(current)
+    return chunks
+
+def _page_splitter(mode=CHUNKING_MODE, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """Returns split(page) -> chunks for the chunking mode (structure mode keeps per-PDF section state)."""
+    chunking_signature(mode, chunk_size, chunk_overlap)
+    if mode == "fixed":
+        text_splitter = _get_text_splitter(chunk_size, chunk_overlap)
+        return lambda page: text_splitter.split_documents([page])
+
+    states = {}
+
+    def split(page):
+        state = states.setdefault(page.metadata.get("source"), {"section": "", "in_specs": False, "titles": set()})
+        return _split_structured(page, state, chunk_size, chunk_overlap)
+    return split
+
+def split_documents(documents, mode=CHUNKING_MODE, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
     """
     Takes a list of documents and splits them into smaller chunks.
     Crucial for RAG to find specific technical details.
     """
     print(f" Splitting {len(documents)} documents...")
     
-
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,      # Size of each piece
-        chunk_overlap=200,    # Overlap to keep context between chunks
-        length_function=len,
-        separators=["\n\n", "\n", " ", ""] # Try to split by paragraphs first
-    )
+    split = _page_splitter(mode, chunk_size, chunk_overlap)
     
-    chunks = text_splitter.split_documents(documents)
+    chunks = [chunk for page in documents for chunk in split(page)]
     
     print(f"Created {len(chunks)} chunks from {len(documents)} pages.")
     return chunks
 
+def iter_split_documents(documents, batch_size=INGEST_BATCH_SIZE, mode=CHUNKING_MODE,
+                         chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """
+    Streaming version of split_documents: consumes any iterable of pages
+    (e.g. loader.iter_documents) and yields lists of at most `batch_size` chunks.
+    Chunk order is the same as split_documents on the full list.
+    """
+    split = _page_splitter(mode, chunk_size, chunk_overlap)
+    batch = []
+    page_count = 0
+    chunk_count = 0
+
+    for page in documents:
+        page_count += 1
+        for chunk in split(page):
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                chunk_count += len(batch)
+                yield batch
+                batch = []
+
+    if batch:
+        chunk_count += len(batch)
+        yield batch
+
+    print(f"Created {chunk_count} chunks from {page_count} pages.")
+
 # --- UNIT TEST ---
 if __name__ == "__main__":
     # 1. Load first
@@ -42,4 +192,13 @@ if __name__ == "__main__":
             print("\n--- CHUNK PREVIEW (Chunk #1) ---")
             print(my_chunks[0].page_content)
             print("--------------------------------")
-            print(f"Metadata: {my_chunks[0].metadata}")
\ No newline at end of file
+            print(f"Metadata: {my_chunks[0].metadata}")
+
+        # 4. Structure-aware chunks are slices of their page and keep spec rows whole
+        structured = split_documents(docs, mode="structure")
+        pages = {(d.metadata["source"], d.metadata["page"]): d.page_content for d in docs}
+        for chunk in structured:
+            start = chunk.metadata["start_index"]
+            page_text = pages[(chunk.metadata["source"], chunk.metadata["page"])]
+            assert page_text[start:start + len(chunk.page_content)] == chunk.page_content
+        print(f"fixed: {len(my_chunks)} chunks, structure: {len(structured)} chunks")
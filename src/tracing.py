@@ -0,0 +1,326 @@
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from langchain_core.callbacks.base import BaseCallbackHandler
+
+# --- PATH FIX ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.config import TRACE_LOG_PATH, METRICS_PROM_PATH
+from src.context_packing import estimate_tokens
+
+# Retriever classes of the chain (bot._build_qa_chain / vector_store.get_retriever) -> pipeline stage
+RETRIEVER_STAGES = {
+    "ContextPackingRetriever": "retrieval",
+    "MultiQueryRetriever": "query_expansion",
+    "BudgetedMultiQueryRetriever": "query_expansion",
+    "LocalQueryExpansionRetriever": "query_expansion",
+    "RoutedRetriever": "routed_search",
+    "HybridRetriever": "hybrid_search",
+    "VectorStoreRetriever": "dense_search",
+    "RoutedDenseRetriever": "dense_search",
+    "PersistedBM25Retriever": "bm25_search",
+    "PartitionedBM25Retriever": "bm25_search",
+}
+# Custom events emitted by our retrievers with their own timing (see vector_store / context_packing)
+# (llm_schedule: time an LLM call waited in the rate-limit scheduler, see src/llm.py)
+EVENT_STAGES = {"fusion": "fusion", "context_packing": "context_packing", "routing": "routing",
+                "llm_schedule": "llm_wait"}
+# Prometheus histogram buckets (seconds)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _run_name(serialized, kwargs):
+    name = kwargs.get("name") or (serialized or {}).get("name")
+    if not name and (serialized or {}).get("id"):
+        name = serialized["id"][-1]
+    return name or "unknown"
+
+
+def _llm_usage(response):
+    """(prompt_tokens, response_tokens, response_text) reported by the model, tokens None if it reports none."""
+    text, usage = "", None
+    for generations in response.generations:
+        for generation in generations:
+            text += generation.text
+            message = getattr(generation, "message", None)
+            usage = getattr(message, "usage_metadata", None) or usage
+    if usage:
+        return usage.get("input_tokens"), usage.get("output_tokens"), text
+    return None, None, text
+
+
+class Trace(BaseCallbackHandler):
+    """
+    Span recorder for one question. Passed as a LangChain callback, it turns every
+    retriever / LLM run of the chain into a span (parent links, documents, tokens);
+    stages outside LangChain runs (cache lookup, spec table) are added with span().
+    """
+
+    # Our handlers only take a lock; no need to hop to an executor on async runs
+    run_inline = True
+
+    def __init__(self, query="", product=""):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.query = query
+        self.product = product
+        self.start = time.perf_counter()
+        self.spans = []
+        self._runs = {}
+        self._parents = {}
+        self._lock = threading.Lock()
+
+    def config(self):
+        """RunnableConfig that routes a chain / retriever / LLM call's callbacks into this trace."""
+        return {"callbacks": [self]}
+
+    def _now_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def _open(self, run_id, parent_run_id, name, stage, **attrs):
+        with self._lock:
+            self._parents[run_id] = parent_run_id
+            if stage is None:
+                return
+            span = {"id": len(self.spans), "parent": self._span_parent(parent_run_id), "name": name,
+                    "stage": stage, "start_ms": round(self._now_ms(), 3), "duration_ms": None, **attrs}
+            self.spans.append(span)
+            self._runs[run_id] = span
+
+    def _close(self, run_id, **attrs):
+        with self._lock:
+            span = self._runs.pop(run_id, None)
+            if span is not None:
+                span["duration_ms"] = round(self._now_ms() - span["start_ms"], 3)
+                span.update(attrs)
+
+    def _span_parent(self, run_id):
+        """Nearest enclosing run that is a span (chains in between are skipped)."""
+        while run_id is not None:
+            span = self._runs.get(run_id)
+            if span is not None:
+                return span["id"]
+            run_id = self._parents.get(run_id)
+        return None
+
+    def _inside(self, run_id, stage):
+        while run_id is not None:
+            span = self._runs.get(run_id)
+            if span is not None and span["stage"] == stage:
+                return True
+            run_id = self._parents.get(run_id)
+        return False
+
+    # --- LangChain callbacks ---
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        self._open(run_id, parent_run_id, _run_name(serialized, kwargs), None)
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs):
+        name = _run_name(serialized, kwargs)
+        self._open(run_id, parent_run_id, name, RETRIEVER_STAGES.get(name, "retriever"))
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._close(run_id, documents=len(documents))
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._close(run_id, error=str(error))
+
+    def _llm_start(self, serialized, prompt_text, run_id, parent_run_id, kwargs):
+        with self._lock:
+            generating_queries = self._inside(parent_run_id, "query_expansion")
+        stage = "query_generation" if generating_queries else "answer_generation"
+        self._open(run_id, parent_run_id, _run_name(serialized, kwargs), stage,
+                   prompt_tokens=estimate_tokens(prompt_text), tokens_estimated=True)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._llm_start(serialized, "\n".join(prompts), run_id, parent_run_id, kwargs)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        text = "\n".join(str(m.content) for batch in messages for m in batch)
+        self._llm_start(serialized, text, run_id, parent_run_id, kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        prompt_tokens, response_tokens, text = _llm_usage(response)
+        attrs = {"response_tokens": estimate_tokens(text)}
+        if response_tokens is not None:
+            attrs = {"prompt_tokens": prompt_tokens, "response_tokens": response_tokens, "tokens_estimated": False}
+        self._close(run_id, **attrs)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._close(run_id, error=str(error))
+
+    def on_custom_event(self, name, data, *, run_id, **kwargs):
+        stage = EVENT_STAGES.get(name)
+        if stage is None:
+            return
+        data = dict(data)
+        duration_ms = data.pop("duration_ms", 0.0)
+        with self._lock:
+            self.spans.append({"id": len(self.spans), "parent": self._span_parent(run_id), "name": name,
+                               "stage": stage, "start_ms": round(self._now_ms() - duration_ms, 3),
+                               "duration_ms": round(duration_ms, 3), **data})
+
+    # --- spans outside LangChain runs ---
+
+    @contextmanager
+    def span(self, stage, **attrs):
+        """Times a block of our own code as a top-level span; yields the span dict (add attrs to it)."""
+        span = {"name": stage, "stage": stage, "start_ms": round(self._now_ms(), 3), "duration_ms": None, **attrs}
+        try:
+            yield span
+        finally:
+            span["duration_ms"] = round(self._now_ms() - span["start_ms"], 3)
+            with self._lock:
+                span.update(id=len(self.spans), parent=None)
+                self.spans.append(span)
+
+    def summary(self, outcome):
+        """
+        JSON-ready trace: {"trace_id", "query", "product", "outcome", "total_ms", "spans": [...],
+        "stages": {stage: {"count", "total_ms"}}, "documents": {stage: n}, "tokens": {"prompt", "response"}}
+        outcome: "generated", "cached" or "fast_path".
+        """
+        with self._lock:
+            spans = sorted((dict(span) for span in self.spans), key=lambda span: span["start_ms"])
+        stages, documents, tokens = {}, {}, {"prompt": 0, "response": 0}
+        for span in spans:
+            stage = stages.setdefault(span["stage"], {"count": 0, "total_ms": 0.0})
+            stage["count"] += 1
+            stage["total_ms"] = round(stage["total_ms"] + (span["duration_ms"] or 0.0), 3)
+            if "documents" in span:
+                documents[span["stage"]] = documents.get(span["stage"], 0) + span["documents"]
+            tokens["prompt"] += span.get("prompt_tokens") or 0
+            tokens["response"] += span.get("response_tokens") or 0
+        return {
+            "trace_id": self.trace_id, "query": self.query, "product": self.product, "outcome": outcome,
+            "total_ms": round(self._now_ms(), 3), "spans": spans, "stages": stages,
+            "documents": documents, "tokens": tokens,
+        }
+
+
+# --- process-wide metrics (Prometheus text / JSON) ---
+
+class MetricsRegistry:
+    """Aggregates finished traces: per-stage latency histograms, document / token / outcome counters."""
+
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = {}
+            self.request_seconds = {"count": 0, "sum": 0.0, "buckets": [0] * len(self.buckets)}
+            self.stages = {}
+            self.documents = {}
+            self.tokens = {}
+
+    def _observe(self, histogram, seconds):
+        histogram["count"] += 1
+        histogram["sum"] += seconds
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                histogram["buckets"][i] += 1
+
+    def observe(self, summary):
+        with self._lock:
+            self.requests[summary["outcome"]] = self.requests.get(summary["outcome"], 0) + 1
+            self._observe(self.request_seconds, summary["total_ms"] / 1000)
+            for span in summary["spans"]:
+                stage = span["stage"]
+                histogram = self.stages.setdefault(stage, {"count": 0, "sum": 0.0, "buckets": [0] * len(self.buckets)})
+                self._observe(histogram, (span["duration_ms"] or 0.0) / 1000)
+                if "documents" in span:
+                    self.documents[stage] = self.documents.get(stage, 0) + span["documents"]
+                for kind in ("prompt", "response"):
+                    if span.get(f"{kind}_tokens"):
+                        key = (stage, kind)
+                        self.tokens[key] = self.tokens.get(key, 0) + span[f"{kind}_tokens"]
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "request_seconds": {"count": self.request_seconds["count"], "sum": round(self.request_seconds["sum"], 6)},
+                "stages": {stage: {"count": h["count"], "sum": round(h["sum"], 6)} for stage, h in self.stages.items()},
+                "documents": dict(self.documents),
+                "tokens": {f"{stage}:{kind}": n for (stage, kind), n in self.tokens.items()},
+            }
+
+    def _histogram_lines(self, name, histogram, labels=""):
+        sep = "," if labels else ""
+        lines = [f'{name}_bucket{{{labels}{sep}le="{bound}"}} {count}'
+                 for bound, count in zip(self.buckets, histogram["buckets"])]
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {histogram["count"]}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {histogram['sum']:.6f}")
+        lines.append(f"{name}_count{suffix} {histogram['count']}")
+        return lines
+
+    def to_prometheus(self):
+        """Prometheus text exposition format (e.g. for node_exporter's textfile collector)."""
+        with self._lock:
+            lines = ["# HELP bose_rag_requests_total Answered questions by outcome.",
+                     "# TYPE bose_rag_requests_total counter"]
+            lines += [f'bose_rag_requests_total{{outcome="{k}"}} {v}' for k, v in sorted(self.requests.items())]
+            lines += ["# HELP bose_rag_request_seconds End-to-end answer latency.",
+                      "# TYPE bose_rag_request_seconds histogram"]
+            lines += self._histogram_lines("bose_rag_request_seconds", self.request_seconds)
+            lines += ["# HELP bose_rag_stage_seconds Latency of each pipeline stage (one observation per span).",
+                      "# TYPE bose_rag_stage_seconds histogram"]
+            for stage, histogram in sorted(self.stages.items()):
+                lines += self._histogram_lines("bose_rag_stage_seconds", histogram, f'stage="{stage}"')
+            lines += ["# HELP bose_rag_documents_total Documents returned per stage.",
+                      "# TYPE bose_rag_documents_total counter"]
+            lines += [f'bose_rag_documents_total{{stage="{k}"}} {v}' for k, v in sorted(self.documents.items())]
+            lines += ["# HELP bose_rag_tokens_total LLM tokens per stage (estimated when the model reports none).",
+                      "# TYPE bose_rag_tokens_total counter"]
+            lines += [f'bose_rag_tokens_total{{stage="{stage}",kind="{kind}"}} {n}'
+                      for (stage, kind), n in sorted(self.tokens.items())]
+        return "\n".join(lines) + "\n"
+
+
+_metrics = MetricsRegistry()
+_export_lock = threading.Lock()
+
+
+def get_metrics():
+    return _metrics
+
+
+def export_prometheus(path=None):
+    """Writes the metrics as a Prometheus text file (atomic replace)."""
+    path = path or METRICS_PROM_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with _export_lock:
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(_metrics.to_prometheus())
+        os.replace(tmp_path, path)
+
+
+def log_trace(summary, path=None):
+    """Appends one trace as a JSON line."""
+    path = path or TRACE_LOG_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with _export_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(summary, ensure_ascii=False) + "\n")
+
+
+def record_trace(summary):
+    """Feeds a finished trace into the metrics and the configured exports (TRACE_LOG_PATH / METRICS_PROM_PATH)."""
+    _metrics.observe(summary)
+    try:
+        if TRACE_LOG_PATH:
+            log_trace(summary)
+        if METRICS_PROM_PATH:
+            export_prometheus()
+    except OSError as e:
+        print(f" Could not export trace metrics: {e}")
@@ -1,50 +1,243 @@
 import os
 import sys
+import time
 import shutil
-from langchain_chroma import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.retrievers import BM25Retriever
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
 from langchain.retrievers import EnsembleRetriever
+from langchain_core.callbacks.manager import adispatch_custom_event, dispatch_custom_event
 from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables.config import RunnableConfig, patch_config
 
 # --- PATH FIX ---
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.config import DB_DIR, EMBEDDING_MODEL_NAME, DATA_DIR
-from src.splitter import split_documents
-from src.loader import load_documents
-
-
-def create_vector_db():
-    """Creates Chroma vector DB from PDFs."""
-    
-    # Reset DB
-    if os.path.exists(DB_DIR):
-        print(f" Clearing existing database at {DB_DIR}...")
-        try:
-            shutil.rmtree(DB_DIR)
-        except Exception as e:
-            print(f" Could not delete folder (might be open): {e}")
-
-    docs = load_documents()
-    chunks = split_documents(docs)
-
-    if not chunks:
-        print(" No chunks created. Check your data folder.")
-        return None
-
-    print(f" Loading embedding model ({EMBEDDING_MODEL_NAME})...")
-    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
-
-    print(" Creating Chroma database...")
-    vector_store = Chroma.from_documents(
-        documents=chunks,
-        embedding=embeddings,
-        persist_directory=DB_DIR
-    )
+from src.config import DATA_DIR, INGEST_BATCH_SIZE, VECTOR_BACKEND, PRODUCT_ROUTER_ENABLED, ROUTER_TOP_N
+from src.splitter import LEGACY_CHUNKING, chunking_signature, iter_split_documents
+from src.loader import iter_documents, list_pdf_files, prune_page_cache
+from src.embedding_cache import CachedEmbeddings
+from src.resources import embedding_model_id, get_embeddings, get_vector_store, open_vector_store, release_vector_store
+from src.generations import (
+    active_generation, collect_garbage, current_generation, discard_generation, generation_dir, get_db_dir,
+    new_generation, publish, set_active, using
+)
+from src.manifest import load_manifest, save_manifest, plan_ingestion, assign_chunk_ids
+from src.bm25_index import (
+    ALL_PARTITION, PartitionedBM25Retriever, PersistedBM25Retriever, load_partition, partition_exists,
+    partition_name, read_partition_chunks, rebuild_all_partition, update_bm25_index
+)
+from src.chunk_store import chunk_store_exists, load_chunk_store, update_chunk_store
+from src.product_router import load_router, router_exists, update_router
+from src.query_expansion import load_acronym_tables, update_acronym_tables
+from src.spec_index import load_spec_tables, update_spec_tables
+
+
+def _clear_db_dir(db_dir):
+    """Empties an unpublished generation folder (full rebuild); the served index is never touched."""
+    shutil.rmtree(db_dir, ignore_errors=True)
+    os.makedirs(db_dir, exist_ok=True)
+
+
+def create_vector_db(reset=False):
+    """
+    Creates / updates the vector DB (VECTOR_BACKEND) from PDFs.
+    Only new or changed PDFs are loaded, split and embedded; chunks of PDFs that
+    disappeared from DATA_DIR are deleted. Pass reset=True for a full rebuild.
+    Each run works on a new index generation (a copy of the published one, or empty
+    with reset=True) and publishes it once complete, so a running app keeps answering
+    from the old index meanwhile. Returns the published generation id (None if empty).
+    """
+    generation = new_generation(seed=not reset)
+    db_dir = generation_dir(generation)
+    print(f" Building index generation {generation}...")
+    try:
+        with using(generation):
+            updated = _update_index(db_dir)
+    except BaseException:
+        discard_generation(generation)
+        raise
+    finally:
+        release_vector_store(db_dir)
+
+    if not updated:
+        discard_generation(generation)
+        return current_generation()
+
+    publish(generation)
+    print(f" Published index generation {generation}")
+    # A process that was serving an older generation switches to the one it just built
+    if active_generation() is not None:
+        set_active(generation)
+    collect_garbage()
+    prune_page_cache()
+    return generation
+
+
+def _update_index(db_dir):
+    """Brings the index in `db_dir` in line with DATA_DIR. Returns whether anything was written."""
+    manifest = load_manifest()
+
+    # Vectors from different models/backends must not be mixed in one collection,
+    # a newly selected vector store starts out empty, and new chunking settings re-split
+    # every PDF (pages and vectors of unchanged text still come from the caches)
+    model_id = embedding_model_id()
+    chunking = chunking_signature()
+    stored = (manifest.get("embedding_model", model_id), manifest.get("vector_backend", "chroma"),
+              manifest.get("chunking", LEGACY_CHUNKING))
+    if manifest["sources"] and stored != (model_id, VECTOR_BACKEND, chunking):
+        print(f" Index settings changed ({' / '.join(stored)} -> {model_id} / {VECTOR_BACKEND} / {chunking}), "
+              f"rebuilding everything.")
+        _clear_db_dir(db_dir)
+        manifest = load_manifest()
+    manifest["embedding_model"] = model_id
+    manifest["vector_backend"] = VECTOR_BACKEND
+    manifest["chunking"] = chunking
+
+    pdf_files = list_pdf_files()
+    changed, removed, file_hashes = plan_ingestion(manifest, pdf_files)
+
+    print(f" Ingestion plan: {len(changed)} new/changed, "
+          f"{len(pdf_files) - len(changed)} unchanged, {len(removed)} removed.")
+
+    if not pdf_files and not manifest["sources"]:
+        print(" No PDFs to ingest. Check your data folder.")
+        return False
+
+    # Chunks that were embedded before (any earlier run / chunking config) are read back from disk
+    embeddings = CachedEmbeddings(get_embeddings(), model_name=model_id)
+
+    vector_store = open_vector_store(embeddings, db_dir)
+
+    if not changed and not removed:
+        if not sync_side_indexes(vector_store, manifest):
+            print(" Database is up to date")
+            return False
+        print(f" Side indexes rebuilt at {db_dir}")
+        return True
+
+    # 1. Drop chunks of PDFs that were removed from the data folder
+    for source in removed:
+        old_ids = manifest["sources"][source].get("chunk_ids", [])
+        if old_ids:
+            vector_store.delete(ids=old_ids, where={"source": source})
+        del manifest["sources"][source]
+        save_manifest(manifest)
+        print(f"   - Removed {len(old_ids)} chunks of {os.path.basename(source)}")
 
-    print(f" Database created successfully at {DB_DIR}")
-    return vector_store
+    # 2. Stream the changed PDFs (parallel parsing -> bounded chunk batches)
+    #    and only embed chunks we have not stored yet
+    old_ids = {
+        source: set(manifest["sources"].get(source, {}).get("chunk_ids", []))
+        for source in changed
+    }
+    new_ids = {source: [] for source in changed}
+    embedded = {source: 0 for source in changed}
+    seen = {}
+    spec_rows = {}
+
+    pages = iter_documents(changed, spec_rows=spec_rows, file_hashes=file_hashes)
+    for batch in iter_split_documents(pages, batch_size=INGEST_BATCH_SIZE):
+        fresh_docs, fresh_ids = [], []
+        for cid, chunk in zip(assign_chunk_ids(batch, seen), batch):
+            source = chunk.metadata.get("source")
+            new_ids[source].append(cid)
+            if cid not in old_ids[source]:
+                fresh_docs.append(chunk)
+                fresh_ids.append(cid)
+                embedded[source] += 1
+
+        if fresh_docs:
+            vector_store.add_documents(documents=fresh_docs, ids=fresh_ids)
+
+    # 3. Per PDF: delete chunks that no longer exist and record the new state
+    for source in changed:
+        if not new_ids[source]:
+            print(f" Warning: No chunks from {os.path.basename(source)}, keeping previous index entries.")
+            continue
+
+        new_id_set = set(new_ids[source])
+        stale_ids = [cid for cid in old_ids[source] if cid not in new_id_set]
+        if stale_ids:
+            vector_store.delete(ids=stale_ids, where={"source": source})
+
+        manifest["sources"][source] = {
+            "file_hash": file_hashes[source],
+            "chunk_ids": new_ids[source],
+        }
+        save_manifest(manifest)
+        print(f"   - {os.path.basename(source)}: {embedded[source]} added, "
+              f"{len(new_ids[source]) - embedded[source]} reused, {len(stale_ids)} deleted")
+
+    # numpy backend: adds / deletes were buffered, write every touched block once
+    if VECTOR_BACKEND == "numpy":
+        vector_store.flush()
+
+    # 4. Side indexes (BM25 partitions, acronym + spec tables) of the PDFs that changed
+    sync_side_indexes(vector_store, manifest, rebuilt=[s for s in changed if new_ids[s]], removed=removed,
+                      spec_rows=spec_rows)
+
+    embeddings.report()
+    print(f" Database updated successfully at {db_dir}")
+    return True
+
+
+def sync_side_indexes(vector_store, manifest, rebuilt=(), removed=(), spec_rows=None):
+    """
+    Brings the indexes built next to the vector store in line with the manifest:
+      - BM25 partitions: rebuilds `rebuilt` sources plus any missing ones (e.g. a DB
+        built by an older version), drops `removed` ones, refreshes the all-sources partition
+      - chunk store: texts + metadata of every chunk, read by the retrievers for their hits
+      - acronym table used by local query expansion (mined from the same chunks)
+      - spec tables of the LLM-free fast path (`spec_rows` extracted while loading;
+        sources without a table are parsed once more)
+      - product router: centroid + keywords of every manual, for unlocked questions
+      - numpy backend: the all-sources dense block, so the first unfiltered query doesn't build it
+    Returns whether anything was (re)built.
+    """
+    sources = list(manifest["sources"])
+    to_build = list(rebuilt) + [
+        s for s in sources if s not in rebuilt and not partition_exists(partition_name(s))
+    ]
+
+    updated = False
+    if to_build or removed or not partition_exists(ALL_PARTITION) or not chunk_store_exists():
+        updated = True
+        update_bm25_index(vector_store, to_build, removed=removed)
+        rebuild_all_partition(sources)
+        update_chunk_store(sources)
+
+    known_tables = load_acronym_tables()
+    to_mine = [s for s in sources if s in to_build or s not in known_tables]
+    if to_mine or any(s in known_tables for s in removed):
+        updated = True
+        update_acronym_tables(
+            {s: read_partition_chunks(partition_name(s))[1] for s in to_mine},
+            removed=removed
+        )
+
+    known_specs = load_spec_tables()
+    spec_rows = {s: rows for s, rows in (spec_rows or {}).items() if s in manifest["sources"]}
+    missing_specs = [s for s in sources if s not in spec_rows and s not in known_specs and os.path.exists(s)]
+    if missing_specs:
+        # DB built before spec extraction existed (or by an older extractor, see SPECS_VERSION):
+        # parse those PDFs once, pages are discarded
+        for _ in iter_documents(missing_specs, spec_rows=spec_rows):
+            pass
+    if spec_rows or any(s in known_specs for s in removed):
+        updated = True
+        update_spec_tables(spec_rows, removed=removed)
+
+    routed = set(load_router().sources) if router_exists() else set()
+    to_route = [s for s in sources if s in to_build or s not in routed]
+    if to_route or any(s in routed for s in removed) or not router_exists():
+        updated = True
+        update_router(vector_store, to_route, removed=removed)
+
+    if VECTOR_BACKEND == "numpy":
+        updated = vector_store.consolidate(if_missing=True) or updated
+    return updated
 
 
 def _find_matching_path(keyword: str):
@@ -59,50 +252,204 @@ def _find_matching_path(keyword: str):
     return None
 
 
-def get_retriever(target_pdf_name=None):
+# Query path: indexes are only ever written by ingestion, into a new generation it then publishes
+_MISSING_INDEX = "{what} missing in {db_dir}: run 'python src/vector_store.py --ingest' to build it"
+
+
+def _get_bm25_partition(name, db_dir=None):
+    """Loads a prebuilt BM25 partition. FileNotFoundError (with the fix) if the index has none."""
+    try:
+        return load_partition(name, db_dir)
+    except FileNotFoundError:
+        raise FileNotFoundError(_MISSING_INDEX.format(what=f"BM25 partition {name}", db_dir=db_dir or get_db_dir())) from None
+
+
+def _get_chunk_store(db_dir=None):
+    """Loads the chunk store the BM25 hits are read from. FileNotFoundError (with the fix) for an index without one."""
+    try:
+        return load_chunk_store(db_dir)
+    except FileNotFoundError:
+        raise FileNotFoundError(_MISSING_INDEX.format(what="Chunk store", db_dir=db_dir or get_db_dir())) from None
+
+
+def similarity_search_by_vectors(vector_store, vectors, k=4, filter=None):
+    """
+    Dense lookups of many query vectors in one call (batch QA, src/batch_qa.py): one matrix
+    product per block for the NumPy index, one multi-embedding query for Chroma.
+    Returns one Document list per vector, each identical to similarity_search_by_vector.
+    """
+    if not len(vectors):
+        return []
+    if hasattr(vector_store, "similarity_search_by_vectors"):
+        return vector_store.similarity_search_by_vectors(vectors, k=k, filter=filter)
+    collection = getattr(vector_store, "_collection", None)
+    if collection is None:
+        return [vector_store.similarity_search_by_vector(vector, k=k, filter=filter) for vector in vectors]
+    results = collection.query(query_embeddings=[list(map(float, v)) for v in vectors], n_results=k, where=filter,
+                               include=["documents", "metadatas"])
+    return [
+        [Document(page_content=text, metadata=metadata or {}) for text, metadata in zip(texts, metadatas)]
+        for texts, metadatas in zip(results["documents"], results["metadatas"])
+    ]
+
+
+# Shared pool for running the dense and sparse lookups of a sync query side by side
+_lookup_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hybrid-lookup")
+
+
+class HybridRetriever(EnsembleRetriever):
+    """
+    EnsembleRetriever whose member lookups run concurrently on the sync path too
+    (the async path, ainvoke, already gathers them). Fusion is the inherited
+    weighted reciprocal rank, so results are identical to EnsembleRetriever.
+    The fusion step reports its own timing as a "fusion" event (src/tracing.py).
+    """
+
+    def _fuse(self, retriever_docs):
+        start = time.perf_counter()
+        fused = self.weighted_reciprocal_rank(retriever_docs)
+        event = {"duration_ms": (time.perf_counter() - start) * 1000,
+                 "documents_in": sum(len(docs) for docs in retriever_docs), "documents": len(fused)}
+        return fused, event
+
+    def rank_fusion(self, query, run_manager, *, config: Optional[RunnableConfig] = None) -> List[Document]:
+        futures = [
+            _lookup_pool.submit(
+                retriever.invoke,
+                query,
+                patch_config(config, callbacks=run_manager.get_child(tag=f"retriever_{i+1}")),
+            )
+            for i, retriever in enumerate(self.retrievers)
+        ]
+        fused, event = self._fuse([future.result() for future in futures])
+        dispatch_custom_event("fusion", event, config={"callbacks": run_manager.get_child()})
+        return fused
+
+    async def arank_fusion(self, query, run_manager, *, config: Optional[RunnableConfig] = None) -> List[Document]:
+        retriever_docs = await asyncio.gather(*(
+            retriever.ainvoke(query, patch_config(config, callbacks=run_manager.get_child(tag=f"retriever_{i+1}")))
+            for i, retriever in enumerate(self.retrievers)
+        ))
+        fused, event = self._fuse(retriever_docs)
+        await adispatch_custom_event("fusion", event, config={"callbacks": run_manager.get_child()})
+        return fused
+
+
+class RoutedDenseRetriever(BaseRetriever):
+    """Dense lookup with a query vector computed upstream (the router already embedded the question)."""
+
+    vector_store: Any
+    query_vector: List[float]
+    filter: Optional[dict] = None
+    k: int = 4
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        return self.vector_store.similarity_search_by_vector(self.query_vector, k=self.k, filter=self.filter)
+
+
+class RoutedRetriever(BaseRetriever):
+    """
+    Unlocked search over many manuals: the product router picks the top_n manuals for the
+    question and the hybrid search (dense + BM25) only scans their partitions.
+    The routing step reports its own timing and candidates as a "routing" event (src/tracing.py).
+    """
+
+    vector_store: Any
+    router: Any
+    # Index folder the router + vector store were loaded from: partitions come from the same generation
+    db_dir: Optional[str] = None
+    top_n: int = ROUTER_TOP_N
+    k: int = 4
+
+    def _plan(self, query, query_vector=None):
+        """
+        Routes the question: (HybridRetriever over the picked manuals, "routing" event).
+        query_vector: the question's embedding if the caller already has it (batch QA).
+        """
+        start = time.perf_counter()
+        if query_vector is None:
+            query_vector = self.vector_store.embeddings.embed_query(query)
+        embedded = time.perf_counter()
+        routes = self.router.route(query, query_vector, self.top_n)
+        sources = [route["source"] for route in routes]
+        event = {
+            "duration_ms": (time.perf_counter() - embedded) * 1000,
+            "embed_ms": round((embedded - start) * 1000, 3),
+            "candidates": [os.path.basename(source) for source in sources],
+            "keyword": next((route["keyword"] for route in routes if route["keyword"]), None),
+        }
+
+        source_filter = {"source": sources[0]} if len(sources) == 1 else {"source": {"$in": sources}}
+        hybrid = HybridRetriever(
+            retrievers=[
+                RoutedDenseRetriever(vector_store=self.vector_store, query_vector=query_vector,
+                                     filter=source_filter, k=self.k),
+                PartitionedBM25Retriever(
+                    partitions=[_get_bm25_partition(partition_name(s), self.db_dir) for s in sources],
+                    chunks=_get_chunk_store(self.db_dir),
+                    k=self.k
+                ),
+            ],
+            weights=[0.5, 0.5]
+        )
+        return hybrid, event
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        hybrid, event = self._plan(query)
+        config = {"callbacks": run_manager.get_child()} if run_manager else None
+        if run_manager:
+            dispatch_custom_event("routing", event, config=config)
+        return hybrid.invoke(query, config=config)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        # Query embedding + routing are CPU work: off the event loop
+        hybrid, event = await asyncio.get_running_loop().run_in_executor(None, self._plan, query)
+        config = {"callbacks": run_manager.get_child()} if run_manager else None
+        if run_manager:
+            await adispatch_custom_event("routing", event, config=config)
+        return await hybrid.ainvoke(query, config=config)
+
+
+def get_retriever(target_pdf_name=None, route=PRODUCT_ROUTER_ENABLED):
     """
     Returns a HYBRID retriever (Dense + BM25) with optional PDF filtering.
     Ensures both UI and eval.py retrieve IDENTICAL chunks.
+    route: without a PDF, search only the manuals picked by the product router.
     """
 
-    # Dense retriever through ChromaDB
-    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
-    vector_store = Chroma(
-        persist_directory=DB_DIR,
-        embedding_function=embeddings
-    )
+    # Dense retriever through the shared vector store (model + store load once per process)
+    vector_store = get_vector_store()
 
     dense_kwargs = {"k": 4}
     dense_retriever = vector_store.as_retriever(search_kwargs=dense_kwargs)
 
-    # Pull ALL documents from Chroma
-    raw = vector_store.get()  # dict: {documents: [...], metadatas: [...]}
+    # Whole library: search only the manuals the router picks (once there are more than ROUTER_TOP_N)
+    if not target_pdf_name and route:
+        router = load_router()
+        if router is not None and len(router.sources) > ROUTER_TOP_N:
+            return RoutedRetriever(vector_store=vector_store, router=router, db_dir=get_db_dir())
 
-    all_docs = [
-        Document(page_content=text, metadata=meta)
-        for text, meta in zip(raw["documents"], raw["metadatas"])
-    ]
-
-    # If product filter requested → pre-filter docs for BM25
-    bm25_docs = all_docs
+    # BM25 is prebuilt at ingestion time, one partition per PDF (+ one for all PDFs)
+    bm25_partition = ALL_PARTITION
     if target_pdf_name:
         real_path = _find_matching_path(target_pdf_name)
 
         if real_path:
-            bm25_docs = [
-                d for d in all_docs if d.metadata.get("source") == real_path
-            ]
+            bm25_partition = partition_name(real_path)
             dense_kwargs["filter"] = {"source": real_path}
             print(f"Locking search to: {os.path.basename(real_path)}")
         else:
             print(f" Warning: Could not match any file for '{target_pdf_name}'")
 
-    # BM25 retriever on filtered Documents
-    bm25_retriever = BM25Retriever.from_documents(bm25_docs)
-    bm25_retriever.k = 4
+    # BM25 retriever on the product's (memory-mapped) partition
+    bm25_retriever = PersistedBM25Retriever(
+        partition=_get_bm25_partition(bm25_partition),
+        chunks=_get_chunk_store(),
+        k=4
+    )
 
-    # Hybrid = Dense + BM25 (50/50 weight)
-    hybrid = EnsembleRetriever(
+    # Hybrid = Dense + BM25 (50/50 weight), both lookups run concurrently
+    hybrid = HybridRetriever(
         retrievers=[dense_retriever, bm25_retriever],
         weights=[0.5, 0.5]
     )
@@ -112,10 +459,20 @@ def get_retriever(target_pdf_name=None):
 
 # --- DEBUG TEST ---
 if __name__ == "__main__":
-    print("--- DEBUGGING FILTER ---")
-    r = get_retriever("DM8SE")
-    docs = r.invoke("IP Rating")
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build or inspect the vector index.")
+    parser.add_argument("--ingest", action="store_true", help="Ingest new/changed PDFs from the data folder")
+    parser.add_argument("--reset", action="store_true", help="With --ingest: wipe the DB and rebuild everything")
+    args = parser.parse_args()
+
+    if args.ingest:
+        create_vector_db(reset=args.reset)
+    else:
+        print("--- DEBUGGING FILTER ---")
+        r = get_retriever("DM8SE")
+        docs = r.invoke("IP Rating")
 
-    print(f"Found {len(docs)} docs.")
-    if docs:
-        print("First doc source:", docs[0].metadata.get("source"))
+        print(f"Found {len(docs)} docs.")
+        if docs:
+            print("First doc source:", docs[0].metadata.get("source"))